@@ -1,12 +1,21 @@
 from utils.logging_utils.logging_config import setup_logging
 from index import BOQ_EXTRACTOR_SERVICE
+from utils.jobs.job_store import JobStore
+from utils.jobs.job_queue import BOQJobQueue
+from utils.common_utils.progress_events import progress_sink_var, queue_sink
+from utils.common_utils.token_utils import compute_costs
+from utils.common_utils.run_options import resolve_run_options
+from utils.common_utils.workbook_cache import BOQWorkbook
+from utils.cost_estimation.preflight_estimator import BudgetExceededError, estimate_workbook
+from utils.observability.metrics import get_metrics_registry
 from fastapi import FastAPI, UploadFile, File, Form, Request
 from dotenv import load_dotenv
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, PlainTextResponse
 import uvicorn
 import shutil
 import os
+import json
 import asyncio
 import logging
 
@@ -18,12 +27,45 @@ logger = logging.getLogger(__name__)
 BASE_PUBLIC_URL = os.getenv("PUBLIC_BASE_URL")
 
 app.mount("/outputs", StaticFiles(directory="outputs"), name="outputs")
+
+# Background job queue for /jobs; the job table is persisted so queued/running jobs survive restarts
+job_queue = BOQJobQueue(JobStore())
+
+
+@app.on_event("startup")
+async def start_job_queue():
+    await job_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await job_queue.stop()
+
+
+def batch_rejected(llm_execution: str) -> JSONResponse:
+    # batch results arrive within BOQ_BATCH_COMPLETION_WINDOW (up to 24h); only a queued job can wait for them
+    return JSONResponse(status_code=400, content={
+        "status": "rejected",
+        "message": f"llm_execution '{llm_execution}' is only available for queued runs; submit the workbook to /jobs"
+    })
+
+
+def public_url(request: Request, path: str) -> str:
+    base_url = BASE_PUBLIC_URL or str(request.base_url)
+    return f"{base_url}{path}".replace("\\", "/")
+
 # Health Check Endpoint
 @app.get("/health")
 async def health_check():
     return JSONResponse(content={"status": "ok", "message": "Service is healthy."})
 
 
+# Prometheus scrape endpoint: span durations, LLM calls/tokens/retries/queue wait, scheduler load, runs
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(get_metrics_registry().render(), media_type="text/plain; version=0.0.4")
+
+
 # Arbaz:
 # If needed, auto-delete:
 # temp file (temp_{file.filename})
@@ -33,14 +75,33 @@ async def health_check():
 async def process_boq(
     request: Request,
     file: UploadFile = File(...),
-    custom_instructions: str = Form("")  # optional user-supplied instructions
+    custom_instructions: str = Form(""),  # optional user-supplied instructions
+    bypass_cache: bool = Form(False),  # force fresh LLM calls instead of reusing cached responses
+    extraction_mode: str = Form(None),  # "sequential" | "parallel"; defaults to BOQ_EXTRACTION_MODE
+    resume: bool = Form(False),  # reuse intact sheets/chunks of a previous run of the same workbook
+    max_cost_usd: float = Form(None),  # pre-flight cost cap; defaults to BOQ_MAX_COST_USD, 0 disables it
+    budget_action: str = Form(None),  # "reject" | "downscope" when the estimate exceeds the cap
+    llm_execution: str = Form(None),  # "interactive" only; batch runs go through /jobs
+    output_mode: str = Form(None),  # "text" | "row_refs" (model returns row numbers, descriptions rebuilt locally)
+    table_format: str = Form(None)  # "markdown" | "compact" serialization of the chunk tables in the prompt
 ):
+    if llm_execution == "batch":
+        return batch_rejected(llm_execution)
+
     temp_file_path = f"temp_{file.filename}"
     with open(temp_file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
 
     try:
-        combined_json_path, combined_excel_path, cost_usd, elapsed_time, sheet_errors = await BOQ_EXTRACTOR_SERVICE(temp_file_path, custom_instructions)
+        combined_json_path, combined_excel_path, cost_usd, elapsed_time, sheet_errors = await BOQ_EXTRACTOR_SERVICE(
+            temp_file_path, custom_instructions, bypass_cache,
+            run_options={
+                "extraction_mode": extraction_mode, "resume": resume,
+                # a BOQ_LLM_EXECUTION=batch default only applies to /jobs
+                "max_cost_usd": max_cost_usd, "budget_action": budget_action, "llm_execution": llm_execution or "interactive",
+                "output_mode": output_mode, "table_format": table_format
+            }
+        )
         base_folder = os.path.splitext(os.path.basename(temp_file_path))[0]
         safe_base = "".join(c if c.isalnum() or c in ("_", "-") else "_" for c in base_folder)
         base_url = str(request.base_url)
@@ -55,12 +116,223 @@ async def process_boq(
             "time_sec": round(elapsed_time, 2),
             "failed_sheets": sheet_errors
         }
+    except BudgetExceededError as e:
+        logger.warning(f"💸 BOQ run rejected: {e}")
+        return JSONResponse(status_code=413, content={"status": "rejected", "message": str(e), "estimate": e.estimate})
     except Exception as e:
         logger.error(f"❌ Error during processing: {e}")
         return {"status": "error", "message": str(e)}
     finally:
         if os.path.exists(temp_file_path):
             os.remove(temp_file_path)
+
+
+@app.post("/estimate")
+async def estimate_boq(
+    file: UploadFile = File(...),
+    custom_instructions: str = Form(""),
+    extraction_mode: str = Form(None),
+    llm_execution: str = Form(None),
+    output_mode: str = Form(None),
+    table_format: str = Form(None)
+):
+    """
+    Pre-flight estimate of LLM calls, tokens, cost and latency for a workbook, without calling the LLM.
+    """
+    temp_file_path = f"temp_estimate_{file.filename}"
+    with open(temp_file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+    try:
+        run_options = resolve_run_options({
+            "extraction_mode": extraction_mode, "llm_execution": llm_execution, "output_mode": output_mode,
+            "table_format": table_format
+        })
+        workbook = await asyncio.to_thread(BOQWorkbook.load, temp_file_path)
+        estimate = await asyncio.to_thread(estimate_workbook, workbook, None, custom_instructions, run_options)
+        return {"status": "success", "estimate": estimate}
+    except Exception as e:
+        logger.error(f"❌ Error during estimation: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+
+
+def format_stream_event(event: dict, stream_format: str) -> str:
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    if stream_format == "sse":
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+@app.post("/process-boq/stream")
+async def process_boq_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    custom_instructions: str = Form(""),
+    bypass_cache: bool = Form(False),
+    extraction_mode: str = Form(None),
+    resume: bool = Form(False),
+    max_cost_usd: float = Form(None),
+    budget_action: str = Form(None),
+    output_mode: str = Form(None),
+    table_format: str = Form(None),
+    stream_format: str = Form("ndjson")  # "ndjson" | "sse"
+):
+    """
+    Same pipeline as /process-boq, but streams product entries as soon as each chunk is finalized,
+    together with progress and running cost events, and ends with a "result" (or "error") event.
+    """
+    if stream_format not in ("ndjson", "sse"):
+        return JSONResponse(status_code=400, content={"error": f"Unknown stream_format '{stream_format}'"})
+
+    temp_file_path = f"temp_{file.filename}"
+    with open(temp_file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+    events = asyncio.Queue()
+
+    async def run_pipeline():
+        # runs in its own task, so the sink only sees events of this request
+        progress_sink_var.set(queue_sink(events))
+        try:
+            combined_json_path, combined_excel_path, cost_usd, elapsed_time, sheet_errors = await BOQ_EXTRACTOR_SERVICE(
+                temp_file_path, custom_instructions, bypass_cache,
+                run_options={
+                    "extraction_mode": extraction_mode, "resume": resume,
+                    "max_cost_usd": max_cost_usd, "budget_action": budget_action, "output_mode": output_mode,
+                    "table_format": table_format, "llm_execution": "interactive"
+                }
+            )
+            events.put_nowait({
+                "type": "result",
+                "status": "partial_success" if sheet_errors else "success",
+                "download_json": public_url(request, combined_json_path),
+                "download_excel": public_url(request, combined_excel_path),
+                "cost_usd": cost_usd,
+                "time_sec": round(elapsed_time, 2),
+                "failed_sheets": sheet_errors
+            })
+        except BudgetExceededError as e:
+            logger.warning(f"💸 Streamed BOQ run rejected: {e}")
+            events.put_nowait({"type": "error", "status": "rejected", "message": str(e), "estimate": e.estimate})
+        except Exception as e:
+            logger.error(f"❌ Error during streamed processing: {e}")
+            events.put_nowait({"type": "error", "message": str(e)})
+        finally:
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+            events.put_nowait(None)
+
+    pipeline_task = asyncio.create_task(run_pipeline())
+
+    async def event_stream():
+        prompt_tokens = completion_tokens = cached_prompt_tokens = 0
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                if event["type"] == "llm_usage":
+                    prompt_tokens += event["prompt_tokens"]
+                    completion_tokens += event["completion_tokens"]
+                    cached_prompt_tokens += event.get("cached_prompt_tokens", 0)
+                    event = {
+                        "type": "cost",
+                        "timestamp": event["timestamp"],
+                        "prompt_tokens": prompt_tokens,
+                        "cached_prompt_tokens": cached_prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "cost_usd": round(compute_costs(
+                            prompt_tokens, completion_tokens, cached_prompt_tokens=cached_prompt_tokens
+                        )[0], 6)
+                    }
+                yield format_stream_event(event, stream_format)
+        finally:
+            # client went away before the run finished
+            if not pipeline_task.done():
+                logger.info("Stream closed by client, cancelling BOQ run")
+                pipeline_task.cancel()
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(event_stream(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+
+@app.post("/jobs")
+async def submit_boq_job(
+    request: Request,
+    file: UploadFile = File(...),
+    custom_instructions: str = Form(""),
+    bypass_cache: bool = Form(False),
+    extraction_mode: str = Form(None),
+    resume: bool = Form(False),
+    max_cost_usd: float = Form(None),
+    budget_action: str = Form(None),
+    llm_execution: str = Form(None),
+    output_mode: str = Form(None),
+    table_format: str = Form(None)
+):
+    job_id = await job_queue.submit(file.filename, file.file, custom_instructions, options={
+        "bypass_cache": bypass_cache,
+        "run_options": {
+            "extraction_mode": extraction_mode, "resume": resume,
+            "max_cost_usd": max_cost_usd, "budget_action": budget_action, "llm_execution": llm_execution,
+            "output_mode": output_mode, "table_format": table_format
+        }
+    })
+    return JSONResponse(status_code=202, content={
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"{request.base_url}jobs/{job_id}"
+    })
+
+
+@app.get("/jobs/{job_id}")
+async def get_boq_job(request: Request, job_id: str):
+    job = job_queue.store.get_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+
+    progress = job["progress"]
+    # partial results: every sheet finished so far can already be downloaded
+    partial_results = [
+        {"sheet_name": sheet_name, "download_json": public_url(request, sheet["final_json_path"])}
+        for sheet_name, sheet in progress.get("sheets", {}).items()
+        if sheet.get("status") == "completed" and sheet.get("final_json_path")
+    ]
+
+    response = {
+        "job_id": job_id,
+        "file_name": job["file_name"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "progress": progress,
+        "partial_results": partial_results,
+        "error": job["error"],
+    }
+    result = job["result"]
+    if result:
+        response.update({
+            "download_json": public_url(request, result["combined_json_path"]),
+            "download_excel": public_url(request, result["combined_excel_path"]),
+            "cost_usd": result["cost_usd"],
+            "time_sec": result["time_sec"],
+            "failed_sheets": result["failed_sheets"],
+        })
+    return response
+
+
+@app.get("/jobs")
+async def list_boq_jobs(limit: int = 50):
+    return [
+        {"job_id": job["job_id"], "file_name": job["file_name"], "status": job["status"], "created_at": job["created_at"]}
+        for job in job_queue.store.list_jobs(limit)
+    ]
+
+
 @app.get("/download/json")
 async def download_combined_json(file_name: str):
     path = os.path.join("outputs", file_name, "product_entries_combined_across_sheets.json")
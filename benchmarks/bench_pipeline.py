@@ -0,0 +1,360 @@
+"""
+End-to-end benchmark of BOQ_EXTRACTOR_SERVICE on the workbooks in inputs/ without calling the model: LLM calls
+are answered by the replay backend (benchmarks/replay_backend.py) from the recorded runs in outputs/, with
+synthetic latency and optional injected failures. Reports wall time, CPU time, peak RSS, LLM calls and the
+LLM concurrency achieved, per workbook and per phase. Each run executes in a fresh process inside a scratch
+folder, so the recordings in outputs/ are never overwritten and peak RSS is per run.
+
+    python -m benchmarks.bench_pipeline [--workbooks CITCO] [--extraction-mode parallel] [--output-mode row_refs] [--repeat 3]
+        [--latency-sec 0.3] [--failure-rate 0.02] [--save-baseline main] [--compare main]
+
+Baselines are stored as benchmarks/baselines/<name>.json; --compare prints the change against one.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import bisect
+import argparse
+import tempfile
+import threading
+import statistics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES_FOLDER = os.path.join(REPO_ROOT, "benchmarks", "baselines")
+SAMPLE_INTERVAL_SEC = 0.02
+# metrics compared against a baseline (lower is better for all of them)
+COMPARED_METRICS = ("wall_sec", "cpu_sec", "peak_rss_mb", "llm_calls", "prompt_tokens", "completion_tokens")
+
+
+# --- resource sampling ---
+
+def _current_rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _peak_rss_bytes() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class ResourceSampler:
+    """Samples (wall clock, process CPU time, RSS) in a background thread so phases can be attributed afterwards."""
+
+    def __init__(self, interval_sec: float = SAMPLE_INTERVAL_SEC):
+        self.interval_sec = interval_sec
+        self.samples: List[Tuple[float, float, Optional[int]]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        self.samples.append((time.time(), time.process_time(), _current_rss_bytes()))
+
+    def _run(self):
+        while not self._stop.wait(self.interval_sec):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def cpu_between(self, start: float, end: float) -> float:
+        times = [sample[0] for sample in self.samples]
+
+        def cpu_at(moment: float) -> float:
+            idx = min(max(bisect.bisect_left(times, moment), 0), len(times) - 1)
+            return self.samples[idx][1]
+        return cpu_at(end) - cpu_at(start)
+
+    def peak_rss_between(self, start: float, end: float) -> Optional[int]:
+        values = [rss for moment, _, rss in self.samples if start <= moment <= end and rss is not None]
+        if not values:  # window shorter than the sampling interval: use the first sample after it
+            values = [rss for moment, _, rss in self.samples if moment >= end and rss is not None][:1]
+        return max(values) if values else None
+
+
+# --- trace analysis ---
+
+def llm_concurrency(llm_calls: List[Dict], start: float, end: float) -> Tuple[int, float]:
+    """Peak and time-averaged number of LLM requests in flight (queue wait excluded) within [start, end]."""
+    events = []
+    for call in llm_calls:
+        request_start = call["start_time"] + (call["attributes"].get("queue_wait_sec") or 0.0)
+        request_end = call["start_time"] + call["duration_sec"]
+        request_start, request_end = max(request_start, start), min(request_end, end)
+        if request_end > request_start:
+            events += [(request_start, 1), (request_end, -1)]
+    peak, in_flight, busy_time, last_moment = 0, 0, 0.0, start
+    for moment, change in sorted(events):
+        busy_time += in_flight * (moment - last_moment)
+        in_flight += change
+        peak = max(peak, in_flight)
+        last_moment = moment
+    return peak, (busy_time / (end - start) if end > start else 0.0)
+
+
+def summarize_phases(spans: List[Dict], sampler: ResourceSampler) -> Dict[str, Dict]:
+    llm_calls = [record for record in spans if record["name"] == "llm.call"]
+    phases = {}
+    for record in sorted(spans, key=lambda record: record["start_time"]):
+        if not record["name"].startswith("phase."):
+            continue
+        start, end = record["start_time"], record["start_time"] + record["duration_sec"]
+        calls = [call for call in llm_calls if start <= call["start_time"] < end]
+        peak_concurrency, average_concurrency = llm_concurrency(calls, start, end)
+        peak_rss = sampler.peak_rss_between(start, end)
+        phases[record["name"][len("phase."):]] = {
+            "wall_sec": round(record["duration_sec"], 3),
+            "cpu_sec": round(sampler.cpu_between(start, end), 3),
+            "peak_rss_mb": round(peak_rss / 2 ** 20, 1) if peak_rss else None,
+            "llm_calls": len(calls),
+            "llm_peak_concurrency": peak_concurrency,
+            "llm_avg_concurrency": round(average_concurrency, 2),
+        }
+    return phases
+
+
+# --- one run (executes in a child process) ---
+
+def run_one(workbook_path: str, work_folder: str, config: Dict) -> Dict:
+    import asyncio
+    import logging
+
+    # batch mode: poll the local batch folder often instead of the production 30s
+    os.environ.setdefault("BOQ_BATCH_POLL_SEC", "0.2")
+    os.environ.setdefault("BOQ_BATCH_COLLECT_IDLE_SEC", "0.5")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmark")
+    logging.basicConfig(level=logging.WARNING)
+
+    from benchmarks.replay_backend import ReplayLLMBackend, load_recordings
+    from utils.llm_interface.calling import set_async_client_override
+    from utils.llm_interface.batch_backends import LocalFileBatchBackend, register_batch_backend
+    import utils.llm_interface.batch_backends as batch_backends
+    from utils.boq_context_extraction.folder_helpers import get_output_root
+    from index import BOQ_EXTRACTOR_SERVICE
+
+    backend = ReplayLLMBackend(
+        load_recordings(os.path.join(REPO_ROOT, "outputs")),
+        latency_sec=config["latency_sec"],
+        sec_per_output_token=config["sec_per_output_token"],
+        latency_jitter=config["latency_jitter"],
+        failure_rate=config["failure_rate"],
+        rate_limit_rate=config["rate_limit_rate"],
+        seed=config["seed"]
+    )
+    set_async_client_override(backend.async_client())
+    register_batch_backend("replay", lambda: LocalFileBatchBackend(
+        os.path.join(work_folder, "batches"), responder=backend.respond_with_failures
+    ))
+    batch_backends.BOQ_BATCH_BACKEND = "replay"
+
+    os.chdir(work_folder)  # outputs/, cache/ and batches land in the scratch folder
+    run_options = {
+        "extraction_mode": config["extraction_mode"],
+        "llm_execution": config["llm_execution"],
+        "output_mode": config["output_mode"],
+        "row_prepass": config["row_prepass"],
+        "table_format": config["table_format"],
+        "header_detection": config["header_detection"],
+        "resume": False,
+        "max_cost_usd": 0,
+    }
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    with ResourceSampler() as sampler:
+        _, _, cost_usd, _, sheet_errors = asyncio.run(
+            BOQ_EXTRACTOR_SERVICE(workbook_path, "", bypass_cache=not config["llm_cache"], run_options=run_options)
+        )
+    wall_sec, cpu_sec = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    with open(os.path.join(get_output_root(workbook_path), "trace.jsonl"), "r", encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+    with open(os.path.join(get_output_root(workbook_path), "product_entries_combined_across_sheets.json"), "r", encoding="utf-8") as f:
+        product_entries = len(json.load(f))
+    llm_calls = [record for record in spans if record["name"] == "llm.call"]
+    peak_concurrency, average_concurrency = llm_concurrency(
+        llm_calls, min(record["start_time"] for record in spans), max(record["start_time"] + record["duration_sec"] for record in spans)
+    )
+    peak_rss = _peak_rss_bytes()
+    return {
+        "wall_sec": round(wall_sec, 3),
+        "cpu_sec": round(cpu_sec, 3),
+        "peak_rss_mb": round(peak_rss / 2 ** 20, 1) if peak_rss else None,
+        "llm_calls": len(llm_calls),
+        "llm_cache_hits": sum(1 for call in llm_calls if call["attributes"].get("outcome") == "cache_hit"),
+        "prompt_tokens": sum(call["attributes"].get("prompt_tokens") or 0 for call in llm_calls),
+        "completion_tokens": sum(call["attributes"].get("completion_tokens") or 0 for call in llm_calls),
+        "llm_retries": sum(
+            (call["attributes"].get("rate_limit_retries") or 0) + (call["attributes"].get("error_retries") or 0)
+            for call in llm_calls
+        ),
+        "llm_peak_concurrency": peak_concurrency,
+        "llm_avg_concurrency": round(average_concurrency, 2),
+        "cost_usd": round(cost_usd, 4),
+        "product_entries": product_entries,
+        "sheet_errors": len(sheet_errors),
+        "replay": dict(backend.stats),
+        "phases": summarize_phases(spans, sampler),
+    }
+
+
+def run_in_child(workbook_path: str, work_folder: str, config: Dict) -> Dict:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_one, workbook_path, work_folder, config).result()
+
+
+# --- report ---
+
+def median_result(runs: List[Dict]) -> Dict:
+    """Per-metric median over repeated runs of one workbook (phases included)."""
+    result = dict(runs[-1])
+    for metric in ("wall_sec", "cpu_sec", "peak_rss_mb", "llm_avg_concurrency"):
+        values = [run[metric] for run in runs if run[metric] is not None]
+        result[metric] = round(statistics.median(values), 3) if values else None
+    for phase, phase_result in result["phases"].items():
+        for metric in ("wall_sec", "cpu_sec", "peak_rss_mb"):
+            values = [run["phases"][phase][metric] for run in runs if phase in run["phases"] and run["phases"][phase][metric] is not None]
+            phase_result[metric] = round(statistics.median(values), 3) if values else None
+    result["repeats"] = len(runs)
+    return result
+
+
+def print_report(results: Dict[str, Dict]):
+    with pd.option_context("display.width", 220, "display.max_rows", None, "display.max_columns", None):
+        summary = pd.DataFrame([
+            {"workbook": workbook[:40], **{key: value for key, value in result.items() if key not in ("phases", "replay")}}
+            for workbook, result in results.items()
+        ])
+        print(summary.to_string(index=False))
+        print()
+        phases = pd.DataFrame([
+            {"workbook": workbook[:40], "phase": phase, **phase_result}
+            for workbook, result in results.items() for phase, phase_result in result["phases"].items()
+        ])
+        print(phases.to_string(index=False))
+        print()
+        replay = pd.DataFrame([{"workbook": workbook[:40], **result["replay"]} for workbook, result in results.items()])
+        print(replay.to_string(index=False))
+
+
+def compare_with_baseline(results: Dict[str, Dict], config: Dict, baseline: Dict):
+    if baseline["config"] != config:
+        changed = sorted(key for key in set(config) | set(baseline["config"]) if config.get(key) != baseline["config"].get(key))
+        print(f"⚠️ Benchmark settings differ from the baseline: {changed}")
+    rows = []
+    for workbook, result in results.items():
+        previous = baseline["results"].get(workbook)
+        if previous is None:
+            continue
+        scopes = [("total", result, previous)] + [
+            (phase, phase_result, previous["phases"][phase])
+            for phase, phase_result in result["phases"].items() if phase in previous["phases"]
+        ]
+        for scope, current_values, previous_values in scopes:
+            for metric in COMPARED_METRICS:
+                before, after = previous_values.get(metric), current_values.get(metric)
+                if before is None or after is None:
+                    continue
+                rows.append({
+                    "workbook": workbook[:40], "scope": scope, "metric": metric, "baseline": before, "current": after,
+                    "change_%": round(100 * (after - before) / before, 1) if before else None,
+                })
+    print(f"\nComparison with baseline '{baseline['name']}':")
+    with pd.option_context("display.width", 200, "display.max_rows", None):
+        print(pd.DataFrame(rows).to_string(index=False) if rows else "no common workbooks")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inputs", default=os.path.join(REPO_ROOT, "inputs"))
+    parser.add_argument("--workbooks", nargs="*", default=None, help="substrings of workbook file names to run (default: all)")
+    parser.add_argument("--extraction-mode", choices=("sequential", "parallel"), default="parallel")
+    parser.add_argument("--llm-execution", choices=("interactive", "batch"), default="interactive")
+    parser.add_argument("--output-mode", choices=("text", "row_refs"), default="text")
+    parser.add_argument("--table-format", choices=("markdown", "compact"), default="markdown")
+    parser.add_argument("--no-row-prepass", action="store_true", help="send blank/total/header rows to the model too")
+    parser.add_argument("--header-detection", choices=("rule", "llm"), default="rule")
+    parser.add_argument("--llm-cache", action="store_true", help="keep the LLM response cache on (warm from the 2nd repeat)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--latency-sec", type=float, default=0.3)
+    parser.add_argument("--sec-per-output-token", type=float, default=0.002)
+    parser.add_argument("--latency-jitter", type=float, default=0.25)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="scratch folder for outputs/ and cache/ (default: a temp folder)")
+    parser.add_argument("--output", default=None, help="also write the full report as JSON")
+    parser.add_argument("--save-baseline", default=None, metavar="NAME")
+    parser.add_argument("--compare", default=None, metavar="NAME")
+    args = parser.parse_args()
+
+    config = {
+        "extraction_mode": args.extraction_mode,
+        "llm_execution": args.llm_execution,
+        "output_mode": args.output_mode,
+        "row_prepass": not args.no_row_prepass,
+        "table_format": args.table_format,
+        "header_detection": args.header_detection,
+        "llm_cache": args.llm_cache,
+        "latency_sec": args.latency_sec,
+        "sec_per_output_token": args.sec_per_output_token,
+        "latency_jitter": args.latency_jitter,
+        "failure_rate": args.failure_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "seed": args.seed,
+    }
+    workbook_paths = [
+        os.path.abspath(path) for path in sorted(glob.glob(os.path.join(args.inputs, "*.xlsx")))
+        if not args.workbooks or any(pattern.lower() in os.path.basename(path).lower() for pattern in args.workbooks)
+    ]
+    if not workbook_paths:
+        raise SystemExit(f"❌ No workbooks matched in {args.inputs}")
+
+    work_folder = os.path.abspath(args.work_dir or tempfile.mkdtemp(prefix="boq_bench_"))
+    os.makedirs(work_folder, exist_ok=True)
+    results = {}
+    for workbook_path in workbook_paths:
+        workbook = os.path.basename(workbook_path)
+        runs = []
+        for repeat_idx in range(args.repeat):
+            print(f"⏱️ {workbook} ({repeat_idx + 1}/{args.repeat})", flush=True)
+            runs.append(run_in_child(workbook_path, work_folder, config))
+        results[workbook] = median_result(runs)
+
+    print()
+    print_report(results)
+    report = {"config": config, "results": results, "python": sys.version.split()[0], "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(os.path.join(BASELINES_FOLDER, f"{args.compare}.json"), "r", encoding="utf-8") as f:
+            compare_with_baseline(results, config, {"name": args.compare, **json.load(f)})
+    if args.save_baseline:
+        os.makedirs(BASELINES_FOLDER, exist_ok=True)
+        with open(os.path.join(BASELINES_FOLDER, f"{args.save_baseline}.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Saved baseline '{args.save_baseline}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Parity and speed check of the vectorized sheet cleaning / markdown rendering against the original
+cell-by-cell implementations, on the workbooks in inputs/ plus a synthetic wide 10k-row sheet.
+
+    python -m benchmarks.bench_table_rendering [--synthetic-rows 10000] [--synthetic-cols 40] [--repeat 3]
+"""
+import os
+import re
+import glob
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from utils.boq_context_extraction.excel_helpers import clean_sheet_df
+from utils.boq_context_extraction.header_helpers import load_first_n_rows_as_markdown
+from utils.common_utils.markdown_helpers import format_batch_as_markdown
+
+
+# --- reference implementations (as they were before vectorization) ---
+
+def legacy_clean_sheet_df(df: pd.DataFrame) -> pd.DataFrame:
+    return df.fillna('').map(lambda x: re.sub(r'\r\n|\r|\n', ' ', str(x)).strip())
+
+
+def legacy_format_batch_as_markdown(df_schedule: pd.DataFrame, header_md: str, start_idx: int = 0, batch_size: int = 20) -> str:
+    df_batch = df_schedule.iloc[start_idx:min(start_idx + batch_size, len(df_schedule))]
+    header_lines = [line.strip() for line in header_md.strip().split("\n") if line.strip()]
+    num_cols = max(line.count("|") for line in header_lines)
+    header_rows = "\n".join(header_lines)
+    separator = " | ".join(["---"] * (num_cols + 1))
+    markdown_rows = []
+    for _, row in df_batch.iterrows():
+        cells = list(row.astype(str))
+        cells = cells[:num_cols + 1]
+        cells += [""] * (num_cols + 1 - len(cells))
+        markdown_rows.append(" | ".join(cells))
+    return f"{header_rows}\n{separator}\n" + '\n'.join(markdown_rows)
+
+
+def legacy_load_first_n_rows_as_markdown(df: pd.DataFrame, num_rows: int = 20) -> str:
+    df_chunk = df.iloc[:num_rows]
+    markdown_lines = df_chunk.apply(lambda row: ' | '.join(row.astype(str)), axis=1).tolist()
+    return '\n'.join(markdown_lines)
+
+
+# --- helpers ---
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def synthetic_sheet(rows: int, cols: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = {}
+    for col_idx in range(cols):
+        kind = col_idx % 5
+        if kind == 0:
+            values = np.arange(rows).astype(float)
+            values[rng.random(rows) < 0.1] = np.nan
+        elif kind == 1:
+            values = np.array([f"  Item {i}\r\nsupply & fix\n" if i % 7 == 0 else f"Item {i}" for i in range(rows)], dtype=object)
+            values[rng.random(rows) < 0.2] = np.nan
+        elif kind == 2:
+            values = rng.integers(0, 1000, rows)
+        elif kind == 3:
+            values = np.full(rows, np.nan)  # wide, mostly empty column spans
+        else:
+            values = np.array([i * 0.1 if i % 3 else "Nos" for i in range(rows)], dtype=object)
+        data[col_idx] = values
+    return pd.DataFrame(data)
+
+
+def edge_case_sheets():
+    yield "ints_and_floats", pd.DataFrame({0: [1, 2, 3], 1: [0.5, np.nan, 2.0]})
+    yield "datetimes", pd.DataFrame({0: pd.to_datetime(["2024-01-01 00:00", None, "2024-03-01 10:30"]), 1: ["a\r\nb", " c ", None]})
+    yield "bools", pd.DataFrame({0: [True, False], 1: ["x", None]})
+    yield "all_empty", pd.DataFrame({0: [np.nan, np.nan], 1: [None, None]})
+
+
+def compare(label: str, df_raw: pd.DataFrame, repeat: int, results: list):
+    legacy_clean = legacy_clean_sheet_df(df_raw)
+    new_clean = clean_sheet_df(df_raw)
+    clean_ok = legacy_clean.equals(new_clean) and list(legacy_clean.dtypes) == list(new_clean.dtypes)
+
+    # render both the raw frame (mixed dtypes, as read from xlsx) and the cleaned one (all strings)
+    header_md = " | ".join(["h"] * max(1, df_raw.shape[1] - 1))
+    render_ok = True
+    for df in (df_raw, new_clean):
+        render_ok &= legacy_load_first_n_rows_as_markdown(df) == load_first_n_rows_as_markdown(df) if len(df) else True
+        for start_idx in range(0, len(df), 30):
+            render_ok &= legacy_format_batch_as_markdown(df, header_md, start_idx, 30) == format_batch_as_markdown(df, header_md, start_idx, 30)
+
+    def render_all(render):
+        for start_idx in range(0, len(new_clean), 30):
+            render(new_clean, header_md, start_idx, 30)
+
+    results.append({
+        "sheet": label,
+        "rows": df_raw.shape[0],
+        "cols": df_raw.shape[1],
+        "parity": clean_ok and render_ok,
+        "clean_legacy_s": best_of(lambda: legacy_clean_sheet_df(df_raw), repeat),
+        "clean_new_s": best_of(lambda: clean_sheet_df(df_raw), repeat),
+        "render_legacy_s": best_of(lambda: render_all(legacy_format_batch_as_markdown), repeat),
+        "render_new_s": best_of(lambda: render_all(format_batch_as_markdown), repeat),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inputs", default="inputs")
+    parser.add_argument("--synthetic-rows", type=int, default=10000)
+    parser.add_argument("--synthetic-cols", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = []
+    for label, df in edge_case_sheets():
+        compare(f"edge:{label}", df, 1, results)
+    for file_path in sorted(glob.glob(os.path.join(args.inputs, "*.xlsx"))):
+        for sheet_name, df in pd.read_excel(file_path, sheet_name=None, header=None).items():
+            compare(f"{os.path.basename(file_path)[:30]}:{sheet_name[:20]}", df, args.repeat, results)
+    if args.synthetic_rows:
+        compare("synthetic", synthetic_sheet(args.synthetic_rows, args.synthetic_cols), args.repeat, results)
+
+    report = pd.DataFrame(results)
+    report["clean_speedup"] = report["clean_legacy_s"] / report["clean_new_s"]
+    report["render_speedup"] = report["render_legacy_s"] / report["render_new_s"].where(report["render_new_s"] > 0)
+    with pd.option_context("display.width", 200, "display.max_rows", None, "display.float_format", "{:.4f}".format):
+        print(report.to_string(index=False))
+
+    totals = report[~report["sheet"].str.startswith("edge:")][["clean_legacy_s", "clean_new_s", "render_legacy_s", "render_new_s"]].sum()
+    print(f"\nTotal cleaning:  {totals['clean_legacy_s']:.3f}s -> {totals['clean_new_s']:.3f}s")
+    print(f"Total rendering: {totals['render_legacy_s']:.3f}s -> {totals['render_new_s']:.3f}s")
+    if not report["parity"].all():
+        raise SystemExit(f"❌ Output mismatch on: {list(report.loc[~report['parity'], 'sheet'])}")
+    print("✅ Outputs identical on every sheet")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Prompt tokens of the chunk tables in each table format (see TABLE_FORMATS), on the schedules the pipeline
+sends: each sheet of the workbooks in inputs/ as BOQWorkbook cleans it, sliced below the header rows found by
+rule (detect_header_rows, the default header_detection; sheets without a confident header are skipped). Each
+format is chunked the way the pipeline chunks it (adaptive chunks under the same token budget), so the report
+also shows how many chunks, i.e. extraction calls, each format needs.
+
+    python -m benchmarks.bench_table_tokens [--inputs inputs] [--workbooks CITCO] [--row-refs] [--no-row-prepass]
+"""
+import os
+import glob
+import argparse
+
+import pandas as pd
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmark")  # token counting resolves the model name
+
+from utils.boq_context_extraction.header_detection import detect_header_rows
+from utils.boq_context_extraction.header_helpers import find_max_column_idx
+from utils.common_utils.markdown_helpers import TABLE_FORMATS, format_chunk_table
+from utils.common_utils.run_options import DEFAULT_RUN_OPTIONS
+from utils.common_utils.token_estimator import count_tokens
+from utils.common_utils.workbook_cache import BOQWorkbook
+from utils.prepare_metadata.prepare_metadata_for_one_sheet import slice_schedule
+from utils.process_schedule.column_roles import numeric_columns
+from utils.process_schedule.generate_chunk_ranges import get_adaptive_chunk_ranges
+from utils.process_schedule.row_classifier import strip_non_item_rows
+
+
+def schedules(inputs_folder: str, patterns):
+    """(workbook, sheet name, header rows, schedule) of every sheet whose header is found by rule."""
+    for path in sorted(glob.glob(os.path.join(inputs_folder, "*.xlsx"))):
+        if patterns and not any(pattern.lower() in os.path.basename(path).lower() for pattern in patterns):
+            continue
+        workbook = BOQWorkbook.load(path)
+        for sheet_name in workbook.sheet_names:
+            cleaned_df = workbook.get_cleaned_sheet(sheet_name)
+            detected = detect_header_rows(cleaned_df)
+            if detected is None:
+                print(f"⏭️ {os.path.basename(path)} / {sheet_name}: no header found by rule, skipped")
+                continue
+            header_md = detected["header_rows"]
+            df_schedule = slice_schedule(cleaned_df, detected["schedule_start_idx"], find_max_column_idx(header_md))
+            yield os.path.basename(path), sheet_name, header_md, df_schedule
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inputs", default="inputs")
+    parser.add_argument("--workbooks", nargs="*", default=None, help="substrings of workbook file names (default: all)")
+    parser.add_argument("--row-refs", action="store_true", help="render the row-number column of the row_refs output mode")
+    parser.add_argument("--no-row-prepass", action="store_true")
+    args = parser.parse_args()
+    token_budget = DEFAULT_RUN_OPTIONS["chunk_token_budget"]
+
+    results = []
+    for workbook_name, sheet_name, header_md, df_schedule in schedules(args.inputs, args.workbooks):
+        if not args.no_row_prepass:
+            df_schedule, _ = strip_non_item_rows(df_schedule, header_md)
+        if df_schedule.empty:
+            continue
+        result = {"sheet": f"{workbook_name[:20]} / {sheet_name}"[:50], "rows": len(df_schedule)}
+        numeric_cols = numeric_columns(header_md, df_schedule)
+        for table_format in TABLE_FORMATS:
+            chunk_ranges = get_adaptive_chunk_ranges(df_schedule, header_md, token_budget, table_format=table_format)
+            result[f"{table_format}_chunks"] = len(chunk_ranges)
+            result[f"{table_format}_tokens"] = sum(
+                count_tokens(format_chunk_table(
+                    df_schedule, header_md, start, end - start, args.row_refs, table_format, numeric_cols
+                ))
+                for start, end in chunk_ranges
+            )
+        results.append(result)
+
+    if not results:
+        raise SystemExit(f"❌ No sheets with a header found in {args.inputs}")
+    report = pd.DataFrame(results)
+    report["saved_%"] = (100 * (1 - report["compact_tokens"] / report["markdown_tokens"])).round(1)
+    with pd.option_context("display.width", 200, "display.max_rows", None):
+        print(report.to_string(index=False))
+    totals = report[["markdown_chunks", "markdown_tokens", "compact_chunks", "compact_tokens"]].sum()
+    print(
+        f"\nTotal: {totals['markdown_tokens']} table tokens in {totals['markdown_chunks']} chunks (markdown) -> "
+        f"{totals['compact_tokens']} in {totals['compact_chunks']} chunks (compact), "
+        f"{100 * (1 - totals['compact_tokens'] / totals['markdown_tokens']):.1f}% fewer tokens"
+    )
+
+
+if __name__ == "__main__":
+    main()
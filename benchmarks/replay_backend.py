@@ -0,0 +1,409 @@
+"""
+Offline stand-in for the LLM, used by the pipeline benchmark. Answers are rebuilt from the outputs of earlier
+real runs in outputs/*/ instead of calling the model:
+
+- context/header calls: the recorded metadata.json whose header (and context) rows appear in the prompt
+- chunk extraction calls: every table row of the prompt is matched to a recorded product entry with the same
+  description tail (and quantity); consecutive matches sharing a section context become one product block.
+  In the row-reference output mode the description and section context are answered with the numbers of the
+  rows holding that text (rows of earlier chunks of the same sheet included), and quantity/unit are left out
+  when the prompt says they are read from mapped columns
+- boundary reconciliation calls: the blocks are returned unchanged
+
+Answers depend only on the request, so runs are repeatable. Synthetic latency and injected failures are drawn
+from a hash of the request and its attempt number, so they repeat too, whatever order concurrent calls run in.
+"""
+import os
+import re
+import glob
+import json
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+import logging
+
+import httpx
+from openai import RateLimitError, InternalServerError
+
+from utils.common_utils.run_store import RUN_STORE_NAME, RunStore
+from utils.common_utils.token_estimator import count_tokens
+from utils.prompts.boq_context_prompts import system_prompt_boq_context
+from utils.prompts.variant_extraction_prompts import (
+    system_prompt_product_entries_row_refs,
+    system_prompt_product_entries_row_refs_mapped_columns,
+)
+
+logger = logging.getLogger(__name__)
+
+RECONCILIATION_MARKER = "Consecutive product blocks across chunk boundaries:"
+TABLE_MARKER = "Markdown Table: \n"
+# sections build_chunk_user_prompt() appends after the table
+CARRY_OVER_MARKERS = ("\n\nsection_context_from_last_extracted_product_block_in_previous_chunk:",
+                      "\n\nlast_extracted_product_block_in_previous_chunk:")
+SUFFIX_KEY_CHARS = 12
+HEADING_SEPARATOR_PATTERN = re.compile(r" > |; |\n")
+
+
+def _normalize_text(text: str) -> str:
+    return re.sub(r"[^0-9a-z]+", "", str(text).lower())
+
+
+def _normalize_quantity(value) -> Optional[str]:
+    try:
+        # repr keeps every digit; "12" and "12.0" still compare equal
+        return repr(float(str(value).replace(',', '')))
+    except ValueError:
+        return None
+
+
+def _recorded_runs(outputs_root: str):
+    """
+    (sheet metadata, chunk product entries) of every recorded workbook run under `outputs_root`: its
+    run_store.sqlite, or for runs of earlier versions the metadata.json and chunk_outputs/*.json files.
+    """
+    for output_root in sorted(glob.glob(os.path.join(outputs_root, "*", ""))):
+        store_path = os.path.join(output_root, RUN_STORE_NAME)
+        if os.path.exists(store_path):
+            store = RunStore(store_path)
+            try:
+                yield list(store.all_metadata().values()), [entries for _, entries in store.all_chunk_entries()]
+            finally:
+                store.close()
+            continue
+        metadata, chunk_entries = [], []
+        for path in sorted(glob.glob(os.path.join(output_root, "*", "metadata.json"))):
+            with open(path, "r", encoding="utf-8") as f:
+                metadata.append(json.load(f))
+        for path in sorted(glob.glob(os.path.join(output_root, "*", "chunking", "chunk_outputs", "*.json"))):
+            with open(path, "r", encoding="utf-8") as f:
+                chunk_entries.append(json.load(f).get("product_entries", []))
+        yield metadata, chunk_entries
+
+
+def load_recordings(outputs_root: str = "outputs") -> Dict:
+    """Indexes the metadata and chunk outputs of every recorded run under `outputs_root`."""
+    metadata = []
+    entries_by_suffix: Dict[str, List[Dict]] = {}
+    entry_count = 0
+    for run_metadata, run_chunk_entries in _recorded_runs(outputs_root):
+        metadata.extend(
+            {"context_rows": data.get("context_md", ""), "header_rows": data["header_md"]}
+            for data in run_metadata if data.get("header_md")
+        )
+        for entry in (entry for entries in run_chunk_entries for entry in entries):
+            description = _normalize_text(entry.get("full_product_description", ""))
+            if len(description) < 3:
+                continue
+            entries_by_suffix.setdefault(description[-SUFFIX_KEY_CHARS:], []).append({
+                "description": description,
+                "quantity": _normalize_quantity(entry.get("quantity", "")),
+                "entry": entry,
+            })
+            entry_count += 1
+
+    logger.info(f"🎞️ Loaded {len(metadata)} recorded sheet headers and {entry_count} product entries from {outputs_root}")
+    return {"metadata": metadata, "entries_by_suffix": entries_by_suffix}
+
+
+def _row_key(cells: List[str]) -> str:
+    return _normalize_text(" | ".join(cell for cell in cells if cell and cell != "nan"))
+
+
+def _table_header(user_prompt: str) -> str:
+    # what identifies a sheet across its chunks: the BOQ context and the header rows
+    before_table, table = user_prompt.split(TABLE_MARKER, 1)
+    # the header rows of a markdown table, the legend line of a compact one
+    header = table.split("\n---", 1)[0] if "\n---" in table else table.split("\n", 1)[0]
+    return hashlib.sha256((before_table + header).encode("utf-8")).hexdigest()
+
+
+def _table_rows(user_prompt: str) -> List[List[str]]:
+    table = user_prompt.split(TABLE_MARKER, 1)[-1]
+    for marker in CARRY_OVER_MARKERS:
+        table = table.split(marker, 1)[0]
+    lines = table.split("\n")
+    # rows start after the markdown separator line, or after the legend line of a compact table
+    separator_idx = next((i for i, line in enumerate(lines) if line.strip().startswith("---")), 0)
+    return [[cell.strip() for cell in line.split("|")] for line in lines[separator_idx + 1:] if line.strip()]
+
+
+class ReplayLLMBackend:
+    """
+    Deterministic chat-completion backend built from load_recordings(). answer() maps a request body to a
+    chat completion body; async_client() wraps it in the surface calling.get_async_client() returns, with
+    synthetic latency (base + per completion token, +/- jitter) and injected rate limits / server errors.
+    """
+
+    def __init__(
+        self,
+        recordings: Dict,
+        latency_sec: float = 0.3,
+        sec_per_output_token: float = 0.002,
+        latency_jitter: float = 0.25,
+        failure_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        seed: int = 0
+    ):
+        self.recordings = recordings
+        self.latency_sec = latency_sec
+        self.sec_per_output_token = sec_per_output_token
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self.stats = {
+            "requests": 0, "injected_rate_limits": 0, "injected_failures": 0,
+            "context_matched": 0, "context_unmatched": 0, "rows_matched": 0, "rows_unmatched": 0,
+            "headings_matched": 0, "headings_unmatched": 0,
+        }
+        self._attempts: Dict[str, int] = {}
+        # row-reference mode: sheet -> normalized row text -> row numbers, for rows of earlier chunks
+        self._rows_seen: Dict[str, Dict[str, List[int]]] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str, value: int = 1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _draw(self, request_key: str, attempt: int, purpose: str) -> float:
+        digest = hashlib.sha256(f"{self.seed}:{purpose}:{request_key}:{attempt}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+    # --- answers ---
+
+    def _answer_context(self, user_prompt: str) -> Dict:
+        best, best_score = None, -1
+        for candidate in self.recordings["metadata"]:
+            header_lines = [line.strip() for line in candidate["header_rows"].split("\n") if line.strip()]
+            if not header_lines or not all(line in user_prompt for line in header_lines):
+                continue
+            score = sum(len(line) for line in header_lines)
+            context_lines = [line.strip() for line in candidate["context_rows"].split("\n") if line.strip(" |")]
+            if all(line in user_prompt for line in context_lines):
+                score += sum(len(line) for line in context_lines)
+            if score > best_score:
+                best, best_score = candidate, score
+        if best is not None:
+            self._count("context_matched")
+            return best
+
+        # unseen sheet: take the first row naming a description column as the header
+        self._count("context_unmatched")
+        lines = user_prompt.split("Text:\n", 1)[-1].strip("\n").split("\n")
+        header_idx = next((i for i, line in enumerate(lines) if "descr" in line.lower()), 0)
+        return {"context_rows": "\n".join(lines[:header_idx]), "header_rows": lines[header_idx] if lines else ""}
+
+    def _match_row(self, cells: List[str], prefer: Optional[Callable[[Dict], bool]] = None) -> Optional[Dict]:
+        description = _normalize_text(max(cells, key=len, default=""))
+        if len(description) < 3:
+            return None
+        quantities = {_normalize_quantity(cell) for cell in cells} - {None}
+        candidates = [
+            candidate for candidate in self.recordings["entries_by_suffix"].get(description[-SUFFIX_KEY_CHARS:], [])
+            if candidate["description"].endswith(description)
+        ]
+        # a row without the entry's quantity is a heading or a different item with the same text
+        entries = [
+            candidate["entry"] for candidate in candidates
+            if candidate["quantity"] is None or candidate["quantity"] in quantities
+        ]
+        # the same item recurs across sheets of one workbook; `prefer` picks the recording of this sheet
+        if prefer is not None:
+            entries = sorted(entries, key=lambda entry: not prefer(entry))
+        return entries[0] if entries else None
+
+    def _answer_chunk(self, user_prompt: str) -> Dict:
+        product_blocks = []
+        for cells in _table_rows(user_prompt):
+            entry = self._match_row(cells)
+            if entry is None:
+                self._count("rows_unmatched")
+                continue
+            self._count("rows_matched")
+            section_context = entry.get("section_context_for_this_product_block", "")
+            variant = {key: value for key, value in entry.items() if key != "section_context_for_this_product_block"}
+            if product_blocks and product_blocks[-1]["section_context_for_this_product_block"] == section_context:
+                product_blocks[-1]["list_of_product_variants"].append(variant)
+            else:
+                product_blocks.append({
+                    "section_context_for_this_product_block": section_context,
+                    "is_group": False,
+                    "list_of_product_variants": [variant],
+                })
+        return {"product_blocks": product_blocks}
+
+    def _find_row(self, key: str, rows_here: Dict[str, List[int]], rows_before: Dict[str, List[int]], before_row: int) -> Optional[int]:
+        # nearest row with this text above `before_row`: in the table itself, else in earlier chunks of the sheet
+        for rows in (rows_here, rows_before):
+            candidates = [row for row in rows.get(key, []) if row < before_row]
+            if candidates:
+                return max(candidates)
+        return None
+
+    def _answer_chunk_row_refs(self, user_prompt: str, omitted_fields: tuple = ()) -> Dict:
+        sheet_key = _table_header(user_prompt)
+        table_rows = []
+        for cells in _table_rows(user_prompt):
+            try:
+                table_rows.append((int(cells[0]), cells[1:]))
+            except (ValueError, IndexError):
+                continue
+        rows_here: Dict[str, List[int]] = {}
+        for row, cells in table_rows:
+            rows_here.setdefault(_row_key(cells), []).append(row)
+            rows_here.setdefault(_normalize_text(max(cells, key=len, default="")), []).append(row)
+        with self._lock:
+            rows_before = {key: list(rows) for key, rows in self._rows_seen.get(sheet_key, {}).items()}
+            seen = self._rows_seen.setdefault(sheet_key, {})
+            for key, rows in rows_here.items():
+                seen.setdefault(key, []).extend(rows)
+
+        def headings_of(entry: Dict) -> List[str]:
+            # a recorded context names several heading rows, as a list or joined ("C | RESIN PLANT; C4 | FDA SYSTEM")
+            section_context = entry.get("section_context_for_this_product_block", "")
+            headings = section_context if isinstance(section_context, list) else [section_context]
+            return [part for heading in headings if heading for part in HEADING_SEPARATOR_PATTERN.split(heading) if part]
+
+        product_blocks, block_contexts = [], []
+        for row, cells in table_rows:
+            entry = self._match_row(cells, prefer=lambda candidate: all(
+                self._find_row(_normalize_text(heading), rows_here, rows_before, row) is not None
+                for heading in headings_of(candidate)
+            ))
+            if entry is None:
+                self._count("rows_unmatched")
+                continue
+            self._count("rows_matched")
+            description = _normalize_text(entry.get("full_product_description", ""))
+            own_text = _normalize_text(max(cells, key=len, default=""))
+            description_rows = [row]
+            lead_in = description[:-len(own_text)] if own_text and description.endswith(own_text) else ""
+            if lead_in:
+                lead_in_row = self._find_row(lead_in, rows_here, rows_before, row)
+                if lead_in_row is not None:
+                    description_rows = [lead_in_row, row]
+
+            section_context = entry.get("section_context_for_this_product_block", "")
+            headings = headings_of(entry)
+            section_rows = [
+                heading_row for heading_row in (
+                    self._find_row(_normalize_text(heading), rows_here, rows_before, row) for heading in headings
+                ) if heading_row is not None
+            ]
+            self._count("headings_matched", len(section_rows))
+            self._count("headings_unmatched", len(headings) - len(section_rows))
+            variant = {
+                key: value for key, value in entry.items()
+                if key not in ("section_context_for_this_product_block", "full_product_description", *omitted_fields)
+            }
+            variant = {"description_rows": description_rows, **variant}
+            # blocks split exactly where the text-mode answer splits them
+            if product_blocks and block_contexts[-1] == section_context:
+                product_blocks[-1]["list_of_product_variants"].append(variant)
+            else:
+                block_contexts.append(section_context)
+                product_blocks.append({
+                    "section_context_rows": section_rows,
+                    "is_group": False,
+                    "list_of_product_variants": [variant],
+                })
+        return {"product_blocks": product_blocks}
+
+    def answer(self, request_body: Dict) -> Dict:
+        """Chat completion body (OpenAI JSON shape) answering `request_body`."""
+        self._count("requests")
+        system_prompt = request_body["messages"][0]["content"]
+        user_prompt = request_body["messages"][1]["content"]
+        if system_prompt.startswith(system_prompt_boq_context):
+            content = self._answer_context(user_prompt)
+        elif RECONCILIATION_MARKER in user_prompt:
+            content = json.loads(user_prompt.split(RECONCILIATION_MARKER, 1)[1])
+        elif TABLE_MARKER in user_prompt and system_prompt.startswith(system_prompt_product_entries_row_refs_mapped_columns):
+            content = self._answer_chunk_row_refs(user_prompt, omitted_fields=("quantity", "unit"))
+        elif TABLE_MARKER in user_prompt and system_prompt.startswith(system_prompt_product_entries_row_refs):
+            content = self._answer_chunk_row_refs(user_prompt)
+        elif TABLE_MARKER in user_prompt:
+            content = self._answer_chunk(user_prompt)
+        else:
+            content = {"products": []}
+
+        content_json = json.dumps(content, ensure_ascii=False)
+        prompt_tokens = count_tokens(system_prompt) + count_tokens(user_prompt)
+        completion_tokens = count_tokens(content_json)
+        return {
+            "id": "replay-" + hashlib.sha256(user_prompt.encode("utf-8")).hexdigest()[:16],
+            "object": "chat.completion",
+            "model": request_body.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content_json},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": 0},
+            },
+        }
+
+    # --- transport ---
+
+    def _next_attempt(self, request_key: str) -> int:
+        with self._lock:
+            attempt = self._attempts.get(request_key, 0)
+            self._attempts[request_key] = attempt + 1
+        return attempt
+
+    def _inject_failure(self, request_key: str, attempt: int):
+        fake_request = httpx.Request("POST", "https://replay.invalid/v1/chat/completions")
+        if self._draw(request_key, attempt, "rate_limit") < self.rate_limit_rate:
+            self._count("injected_rate_limits")
+            response = httpx.Response(429, headers={"retry-after": "1"}, request=fake_request)
+            raise RateLimitError("Injected rate limit", response=response, body=None)
+        if self._draw(request_key, attempt, "failure") < self.failure_rate:
+            self._count("injected_failures")
+            raise InternalServerError("Injected server error", response=httpx.Response(500, request=fake_request), body=None)
+
+    def respond_with_failures(self, request_body: Dict) -> Dict:
+        """answer() behind the injected failures, for the batch backend's responder."""
+        request_key = hashlib.sha256(json.dumps(request_body, sort_keys=True).encode("utf-8")).hexdigest()
+        self._inject_failure(request_key, self._next_attempt(request_key))
+        return self.answer(request_body)
+
+    async def create_raw(self, **request_body) -> "ReplayRawResponse":
+        request_key = hashlib.sha256(json.dumps(request_body, sort_keys=True).encode("utf-8")).hexdigest()
+        attempt = self._next_attempt(request_key)
+        self._inject_failure(request_key, attempt)
+        body = self.answer(request_body)
+        latency = self.latency_sec + self.sec_per_output_token * body["usage"]["completion_tokens"]
+        latency *= 1 + self.latency_jitter * (2 * self._draw(request_key, attempt, "latency") - 1)
+        await asyncio.sleep(max(0.0, latency))
+        return ReplayRawResponse(body)
+
+    def async_client(self) -> SimpleNamespace:
+        """Object with the chat.completions.with_raw_response.create() surface of AsyncOpenAI."""
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+            with_raw_response=SimpleNamespace(create=self.create_raw)
+        )))
+
+
+def _to_namespace(value):
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _to_namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_to_namespace(item) for item in value]
+    return value
+
+
+class ReplayRawResponse:
+    # no rate-limit headers: the scheduler keeps its configured RPM/TPM limits
+    headers: Dict[str, str] = {}
+
+    def __init__(self, body: Dict):
+        self.body = body
+
+    def parse(self) -> SimpleNamespace:
+        return _to_namespace(self.body)
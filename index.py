@@ -1,27 +1,169 @@
-from typing import Tuple
+from typing import Tuple, Dict, Optional
+import os
+import time
 import asyncio
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-async def BOQ_EXTRACTOR_SERVICE(file_path: str, custom_instructions: str = "") -> Tuple[str, str, float, float, list]:
+async def BOQ_EXTRACTOR_SERVICE(
+    file_path: str,
+    custom_instructions: str = "",
+    bypass_cache: bool = False,
+    run_options: Optional[Dict] = None
+) -> Tuple[str, str, float, float, list]:
+    from utils.observability.tracing import RunTrace, run_trace_var, span
+    from utils.observability.metrics import get_metrics_registry
+    from utils.boq_context_extraction.folder_helpers import get_output_root
+    from utils.common_utils.run_store import RunStore, run_store_var
+
+    # Every span of this request (phases, sheets, chunks, LLM calls, Excel/JSON I/O) is kept for its trace file
+    trace = RunTrace()
+    run_trace_var.set(trace)
+    metrics = get_metrics_registry()
+    metrics.inc("boq_runs_in_progress")
+    # Chunk results, boundary corrections and sheet metadata of this run (one SQLite file per workbook)
+    store = RunStore.open(get_output_root(file_path))
+    run_store_var.set(store)
+    status = "failed"
+    try:
+        with span("run", file_name=os.path.basename(file_path)):
+            result = await _run_boq_extraction(file_path, custom_instructions, bypass_cache, run_options)
+        status = "partial_success" if result[4] else "success"
+        return result
+    finally:
+        metrics.inc("boq_runs_in_progress", -1)
+        metrics.inc("boq_runs_total", status=status)
+        store.close()
+        try:
+            os.makedirs(get_output_root(file_path), exist_ok=True)
+            trace.save(os.path.join(get_output_root(file_path), "trace.jsonl"))
+        except OSError as e:
+            logger.warning(f"⚠️ Could not save the run trace: {e}")
+
+
+async def _run_boq_extraction(
+    file_path: str,
+    custom_instructions: str,
+    bypass_cache: bool,
+    run_options: Optional[Dict]
+) -> Tuple[str, str, float, float, list]:
     from utils.prepare_metadata.prepare_metadata_for_all_sheets import prepare_all_metadata
     from utils.process_schedule.process_all_schedules import run_all_sheets
     from utils.combine_output.combine_outputs_across_sheets import combine_boq_outputs_across_sheets
-    from utils.common_utils.token_utils import log_cost_and_processing_time
+    from utils.common_utils.token_utils import log_cost_and_processing_time, start_usage_tally
+    from utils.common_utils.workbook_cache import BOQWorkbook
+    from utils.llm_interface.scheduler import llm_priority_var, priority_for_workbook
+    from utils.llm_interface.response_cache import llm_cache_bypass_var
+    from utils.common_utils.run_options import resolve_run_options
+    from utils.common_utils.progress_events import emit_progress
+    from utils.common_utils.run_manifest import RunManifest, run_manifest_var, workbook_fingerprint
+    from utils.boq_context_extraction.folder_helpers import get_output_root, create_output_folder
+    from utils.llm_interface.calling import LLM_MODEL
+    from utils.cost_estimation.preflight_estimator import estimate_workbook, apply_cost_budget
+    from utils.common_utils.json_helpers import save_output_json
+    from utils.common_utils.token_utils import BATCH_PRICE_FACTOR
+    from utils.llm_interface.batch_collector import LLMBatchCollector, llm_batch_var
+    from utils.llm_interface.batch_backends import get_batch_backend
+    from utils.observability.tracing import run_trace_var, span
+
+    run_start = time.perf_counter()
+    run_options = resolve_run_options(run_options)
+
+    # Skip the LLM response cache for every call of this request when asked to
+    llm_cache_bypass_var.set(bypass_cache)
+    usage_tally = start_usage_tally()
+
+    # Batch mode: the LLM calls of each phase are collected into one batch job instead of being sent one by one
+    if run_options["llm_execution"] == "batch":
+        llm_batch_var.set(LLMBatchCollector(get_batch_backend(), os.path.join(get_output_root(file_path), "batches")))
+
+    # Parse the workbook once; every phase below works from this in-memory copy
+    with span("phase.load"):
+        workbook = await asyncio.to_thread(BOQWorkbook.load, file_path)
+
+    # All LLM calls of this request share one priority in the global scheduler; small uploads go first
+    llm_priority_var.set(priority_for_workbook(workbook.total_rows()))
+
+    # Checkpoint manifest keyed by the workbook's content; with resume, intact sheets/chunks of the last run are reused
+    manifest = RunManifest.open(
+        get_output_root(file_path),
+        await asyncio.to_thread(workbook_fingerprint, file_path),
+        settings={
+            "model": LLM_MODEL,
+            "extraction_mode": run_options["extraction_mode"],
+            "output_mode": run_options["output_mode"],
+            "row_prepass": run_options["row_prepass"],
+            "table_format": run_options["table_format"],
+            "header_detection": run_options["header_detection"],
+            "custom_instructions_sha256": hashlib.sha256(custom_instructions.encode("utf-8")).hexdigest(),
+        },
+        resume=run_options["resume"]
+    )
+    run_manifest_var.set(manifest)
+
+    emit_progress("workbook_loaded", sheet_names=workbook.sheet_names)
+
+    pending_sheets = []
+    for sheet_name in workbook.sheet_names:
+        if manifest.is_sheet_completed(sheet_name):
+            logger.info(f"♻️ Sheet '{sheet_name}' already completed in the previous run, skipping")
+            emit_progress("sheet_completed", sheet_name=sheet_name, resumed=True, final_json_path=os.path.join(
+                create_output_folder(file_path, sheet_name), "final_output", "final_product_entries.json"
+            ))
+        else:
+            pending_sheets.append(sheet_name)
+
+    # Pre-flight: price every planned call offline and enforce the per-request budget before spending anything
+    with span("phase.preflight", sheets=len(pending_sheets)):
+        estimate = await asyncio.to_thread(estimate_workbook, workbook, pending_sheets, custom_instructions, run_options)
+    save_output_json(os.path.join(get_output_root(file_path), "preflight_estimate.json"), estimate)
+    logger.info(
+        f"🧮 Pre-flight estimate: {estimate['calls']} calls, ~${estimate['cost_usd']:.2f}, ~{estimate['latency_sec']:.0f}s"
+    )
+    emit_progress(
+        "estimate_ready", cost_usd=estimate["cost_usd"], latency_sec=estimate["latency_sec"], calls=estimate["calls"]
+    )
+    pending_sheets, over_budget_sheets = apply_cost_budget(
+        estimate, run_options["max_cost_usd"], run_options["budget_action"]
+    )
 
     # Phase 1: Prepare all metadata
-    metadata_list = await prepare_all_metadata(file_path, custom_instructions)
+    emit_progress("phase_started", phase="metadata")
+    with span("phase.metadata", sheets=len(pending_sheets)):
+        metadata_list = await prepare_all_metadata(file_path, custom_instructions, workbook, pending_sheets, run_options)
+    emit_progress("phase_completed", phase="metadata")
 
-    # Phase 2: Process all schedules
-    prompt_tokens, completion_tokens, elapsed_time, sheet_errors = await run_all_sheets(file_path)
+    # Phase 2: Process all schedules (reuses Phase 1 metadata, re-derives only for failed sheets)
+    emit_progress("phase_started", phase="extraction")
+    with span("phase.extraction", sheets=len(pending_sheets), extraction_mode=run_options["extraction_mode"]):
+        prompt_tokens, completion_tokens, _, sheet_errors, products_by_sheet = await run_all_sheets(
+            file_path, custom_instructions, metadata_list, workbook, run_options, pending_sheets
+        )
+    emit_progress("phase_completed", phase="extraction")
+    sheet_errors += [
+        {"sheet": sheet_name, "error": "Skipped: estimated cost exceeds the request budget"}
+        for sheet_name in over_budget_sheets
+    ]
 
-    # Phase 3: Log cost and time
-    aggregate_cost_usd, total_processing_time = log_cost_and_processing_time(file_path, prompt_tokens, completion_tokens, elapsed_time)
+    # Phase 3: Combine output files
+    emit_progress("phase_started", phase="combine")
+    with span("phase.combine"):
+        combined_json_path, combined_excel_path = await asyncio.to_thread(
+            combine_boq_outputs_across_sheets, file_path,
+            [sheet_name for sheet_name in workbook.sheet_names if sheet_name not in over_budget_sheets],
+            products_by_sheet
+        )
+    emit_progress("phase_completed", phase="combine")
 
-    # Phase 4: Combine output files
-    combined_json_path, combined_excel_path = combine_boq_outputs_across_sheets(file_path)
+    # Phase 4: Log cost and time; the processing time covers the whole request (load through combine)
+    aggregate_cost_usd, total_processing_time = log_cost_and_processing_time(
+        file_path, prompt_tokens, completion_tokens, time.perf_counter() - run_start, usage_tally["cached_prompt_tokens"],
+        price_factor=BATCH_PRICE_FACTOR if run_options["llm_execution"] == "batch" else 1.0,
+        phase_times_sec=run_trace_var.get().durations_by_name("phase.")
+    )
 
     return combined_json_path, combined_excel_path, aggregate_cost_usd, total_processing_time, sheet_errors
 
@@ -1,18 +1,58 @@
+import os
+import numpy as np
 import pandas as pd
 import re
-from typing import List
+from typing import List, Optional
 import logging
 
+from utils.observability.tracing import span
+from utils.common_utils.artifact_writer import write_excel, TableRows
 
 logger = logging.getLogger(__name__)
 
+# schedule_only.xlsx (and other intermediate xlsx) and the per-chunk JSON files are debug-only artifacts; the
+# pipeline itself works from memory and the run store (utils.common_utils.run_store)
+WRITE_DEBUG_ARTIFACTS = os.getenv("BOQ_WRITE_DEBUG_ARTIFACTS", "false").strip().lower() in ("1", "true", "yes")
+
+
+NEWLINE_PATTERN = re.compile(r'\r\n|\r|\n')
+# separator for processing all cells as one string; it cannot occur in xlsx text and is not a line break
+CELL_SEPARATOR = '\x00'
+
+
+def _clean_cells_one_by_one(cells: np.ndarray) -> list:
+    return [NEWLINE_PATTERN.sub(' ', cell).strip() for cell in cells]
+
+
+def clean_sheet_df(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Missing cells become '', everything else its str() with line breaks turned into spaces and surrounding
+    whitespace stripped. Non-missing cells are stringified in one vectorized call, and the newline regex runs
+    once over all of them joined into a single string instead of once per cell.
+    """
+    values = df.to_numpy(dtype=object)
+    missing = df.isna().to_numpy()
+    # fillna('') leaves datetime columns alone, so NaT keeps rendering as 'NaT' there
+    datetime_cols = [col_idx for col_idx, dtype in enumerate(df.dtypes) if dtype.kind in "mM"]
+    missing[:, datetime_cols] = False
+
+    cleaned = np.full(values.shape, '', dtype=object)
+    present = ~missing
+    cells = pd.Series(values[present], dtype=object).astype(str).to_numpy(dtype=object)
+    if len(cells):
+        joined = CELL_SEPARATOR.join(cells)
+        if joined.count(CELL_SEPARATOR) == len(cells) - 1:
+            cleaned[present] = [cell.strip() for cell in NEWLINE_PATTERN.sub(' ', joined).split(CELL_SEPARATOR)]
+        else:
+            cleaned[present] = _clean_cells_one_by_one(cells)
+    return pd.DataFrame(cleaned, index=df.index, columns=df.columns)
+
 
 def load_and_clean_excel(file_path: str, sheet_name: str) -> pd.DataFrame:
-    df = pd.read_excel(file_path, sheet_name=sheet_name, header=None)
-    df = df.fillna('').map(lambda x: re.sub(r'\r\n|\r|\n', ' ', str(x)).strip())
-    return df
+    with span("io.excel_read", path=file_path, sheet_name=sheet_name):
+        df = pd.read_excel(file_path, sheet_name=sheet_name, header=None)
+    return clean_sheet_df(df)
 
 
-def save_output_excel(filepath: str, final_products: List[dict]):
-    df = pd.DataFrame(final_products)
-    df.to_excel(filepath, index=False)
\ No newline at end of file
+def save_output_excel(filepath: str, final_products: TableRows, columns: Optional[List] = None):
+    write_excel(filepath, [("Sheet1", final_products)], columns)
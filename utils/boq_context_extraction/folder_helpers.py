@@ -3,11 +3,16 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-def create_output_folder(file_path: str, sheet_name: str) -> str:
+def get_output_root(file_path: str) -> str:
     base_name = os.path.splitext(os.path.basename(file_path))[0]
     safe_base = "".join(c if c.isalnum() or c in ("_", "-") else "_" for c in base_name)
-    safe_sheet = "".join(c if c.isalnum() or c in ("_", "-") else "_" for c in sheet_name)
-    output_folder = os.path.join("outputs", safe_base, safe_sheet)
+    return os.path.join("outputs", safe_base)
+
+def sheet_folder_name(sheet_name: str) -> str:
+    return "".join(c if c.isalnum() or c in ("_", "-") else "_" for c in sheet_name)
+
+def create_output_folder(file_path: str, sheet_name: str) -> str:
+    output_folder = os.path.join(get_output_root(file_path), sheet_folder_name(sheet_name))
     os.makedirs(output_folder, exist_ok=True)
 
     return output_folder
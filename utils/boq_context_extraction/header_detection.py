@@ -0,0 +1,95 @@
+from typing import Dict, List, Optional
+import logging
+
+import pandas as pd
+
+from utils.boq_context_extraction.header_helpers import CONTEXT_PREVIEW_ROWS
+from utils.common_utils.markdown_helpers import rows_as_cell_strings
+from utils.process_schedule.column_roles import header_cell_role
+from utils.process_schedule.row_references import is_number
+
+logger = logging.getLogger(__name__)
+
+# The main header row names a description column and at least two other roles (sl. no., unit, qty, rate, amount)
+MIN_HEADER_ROLES = 3
+# Share of the main header row's filled cells that must name a role ("Sr No | Description | Unit | Qty | Supply |
+# Erection" has 4 of 6; project columns such as "GROUND FLOOR" or "FG WAREHOUSE" do not name one)
+MIN_KEYWORD_SHARE = 0.25
+# Rows below the main one that can still belong to the header, e.g. "Rate | Amount" under "Supply | Erection"
+MAX_SUB_HEADER_ROWS = 3
+LABEL_ROLES = ("item_no", "description")
+
+
+def _filled(cells: List[str]) -> List[str]:
+    return [cell for cell in cells if cell and cell.lower() != "nan"]
+
+
+def header_row_score(cells: List[str]) -> float:
+    """
+    Keyword density of a row as the main header row: the share of its filled cells naming a column role, or 0
+    when the row holds a number or does not name a description column and MIN_HEADER_ROLES roles in all.
+    """
+    filled = _filled(cells)
+    if len(filled) < MIN_HEADER_ROLES or any(is_number(cell) for cell in filled):
+        return 0.0
+    roles = [header_cell_role(cell) for cell in filled]
+    named = {role for role in roles if role}
+    if "description" not in named or len(named) < MIN_HEADER_ROLES:
+        return 0.0
+    share = sum(role is not None for role in roles) / len(filled)
+    return share if share >= MIN_KEYWORD_SHARE else 0.0
+
+
+def _is_sub_header_row(cells: List[str], label_cols: List[int]) -> bool:
+    # a header continuation leaves the sl. no. and description columns empty and holds no numbers;
+    # the first item or section heading of the schedule fills one of them
+    filled = _filled(cells)
+    return (
+        bool(filled) and not any(_filled([cells[col]]) for col in label_cols if col < len(cells))
+        and not any(is_number(cell) for cell in filled)
+    )
+
+
+def detect_header_rows(df: pd.DataFrame, num_rows: int = CONTEXT_PREVIEW_ROWS) -> Optional[Dict]:
+    """
+    Header and BOQ context of a sheet read off its first `num_rows` rows by rule, in the shape of the context
+    LLM call's answer ("header_rows", "context_rows", as the preview lines it is shown) plus the
+    "schedule_start_idx" the header ends at. The header is the first row with a confident header_row_score and
+    the sub-header rows right below it; everything above it is context. None when no row qualifies or the
+    header may run past the preview, in which case the LLM call decides.
+    """
+    rows = [[cell.strip() for cell in cells] for cells in rows_as_cell_strings(df.iloc[:num_rows])]
+    header_idx = next((i for i, cells in enumerate(rows) if header_row_score(cells) > 0), None)
+    if header_idx is None:
+        return None
+
+    label_cols = [col for col, cell in enumerate(rows[header_idx]) if header_cell_role(cell) in LABEL_ROLES]
+    end_idx = header_idx + 1
+    while end_idx < len(rows) and end_idx - header_idx <= MAX_SUB_HEADER_ROWS and _is_sub_header_row(rows[end_idx], label_cols):
+        end_idx += 1
+    if end_idx >= len(rows) and len(df) > len(rows):
+        return None
+
+    lines = [' | '.join(cells) for cells in rows_as_cell_strings(df.iloc[:end_idx])]
+    return {
+        "header_rows": "\n".join(lines[header_idx:]),
+        "context_rows": "\n".join(lines[:header_idx]),
+        "schedule_start_idx": end_idx,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    from utils.boq_context_extraction.excel_helpers import load_and_clean_excel
+    from utils.logging_utils.logging_config import setup_logging
+
+    setup_logging()
+
+    # python -m utils.boq_context_extraction.header_detection <workbook> [<sheet name> ...]
+    file_path = sys.argv[1]
+    for sheet_name in sys.argv[2:] or pd.ExcelFile(file_path).sheet_names:
+        detected = detect_header_rows(load_and_clean_excel(file_path, sheet_name))
+        if detected is None:
+            print(f"{sheet_name}: no confident header, falls back to the LLM call")
+        else:
+            print(f"{sheet_name}: schedule starts at row {detected['schedule_start_idx']}\n{detected['header_rows']}\n")
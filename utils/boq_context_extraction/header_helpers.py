@@ -1,12 +1,18 @@
 import pandas as pd
+import re
 import difflib
 import logging
 
+from utils.common_utils.markdown_helpers import rows_as_cell_strings
+
 logger = logging.getLogger(__name__)
 
-def load_first_n_rows_as_markdown(df: pd.DataFrame, num_rows: int = 20) -> str:
-    df_chunk = df.iloc[:num_rows]
-    markdown_lines = df_chunk.apply(lambda row: ' | '.join(row.astype(str)), axis=1).tolist()
+# Rows of each sheet shown to the context LLM call; the header block it returns must lie within them
+CONTEXT_PREVIEW_ROWS = 20
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def load_first_n_rows_as_markdown(df: pd.DataFrame, num_rows: int = CONTEXT_PREVIEW_ROWS) -> str:
+    markdown_lines = [' | '.join(cells) for cells in rows_as_cell_strings(df.iloc[:num_rows])]
     return '\n'.join(markdown_lines)
 
 def find_max_column_idx(header_md: str) -> int:
@@ -17,18 +23,64 @@ def find_max_column_idx(header_md: str) -> int:
     col_counts = [len(row.split("|")) for row in header_lines]
     return max(col_counts) if col_counts else 0
 
-def find_header_start_idx(df: pd.DataFrame, header_md: str) -> int:
+def _normalize_row(row_text: str) -> tuple:
+    # case/whitespace-insensitive cells, ignoring the empty cells the LLM tends to drop
+    cells = (" ".join(cell.split()).lower() for cell in row_text.split("|"))
+    return tuple(cell for cell in cells if cell)
+
+
+def _row_tokens(row_text: str) -> frozenset:
+    return frozenset(TOKEN_PATTERN.findall(row_text.lower()))
+
+
+class _HeaderSearchRows:
+    """
+    Joined, normalized and tokenized forms of the rows a header may start in, each computed once per sheet.
+    """
+
+    def __init__(self, df: pd.DataFrame, num_rows: int):
+        rows = df.iloc[:num_rows].astype(str).values.tolist()
+        self.joined = [' | '.join(cell.strip() for cell in row) for row in rows]
+        self.normalized = [_normalize_row(text) for text in self.joined]
+        self.tokens = [_row_tokens(text) for text in self.joined]
+
+
+def _fuzzy_block_score(block: list, header_lines: list, threshold: float) -> float:
+    matchers = [difflib.SequenceMatcher(None, a, b) for a, b in zip(block, header_lines)]
+    # cheap upper bounds first; most windows are rejected without the full ratio()
+    if sum(m.real_quick_ratio() for m in matchers) / len(matchers) < threshold:
+        return 0.0
+    if sum(m.quick_ratio() for m in matchers) / len(matchers) < threshold:
+        return 0.0
+    return sum(m.ratio() for m in matchers) / len(matchers)
+
+
+def find_header_start_idx(df: pd.DataFrame, header_md: str, search_rows: int = CONTEXT_PREVIEW_ROWS,
+                          threshold: float = 0.7) -> int:
+    """
+    Index of the first row after the header block `header_md` (as returned by the context LLM call).
+    The LLM only saw the first `search_rows` rows, so only windows starting there are considered.
+    Matching is tiered: exact text, then normalized cells, then identical token sets, then fuzzy scoring;
+    the first tier with a match wins, and within a tier the topmost window.
+    """
     header_lines = [line.strip() for line in header_md.strip().split("\n") if line.strip()]
-    header_row_blocks = [[cell.strip() for cell in row] for row in df.astype(str).values.tolist()]
-
-    for i in range(len(header_row_blocks) - len(header_lines) + 1):
-        block = header_row_blocks[i:i + len(header_lines)]
-        joined_block = [' | '.join(row) for row in block]
-        score = sum(
-            difflib.SequenceMatcher(None, a, b).ratio()
-            for a, b in zip(joined_block, header_lines)
-        ) / len(header_lines)
-        if score >= 0.7:
-            return i + len(header_lines)
-
-    raise ValueError("Header block not found")
\ No newline at end of file
+    if not header_lines:
+        raise ValueError("Header block not found")
+    num_lines = len(header_lines)
+    rows = _HeaderSearchRows(df, search_rows + num_lines - 1)
+    candidate_starts = range(max(0, len(rows.joined) - num_lines + 1))
+
+    header_normalized = [_normalize_row(line) for line in header_lines]
+    header_tokens = [_row_tokens(line) for line in header_lines]
+    tiers = (
+        lambda i: rows.joined[i:i + num_lines] == header_lines,
+        lambda i: rows.normalized[i:i + num_lines] == header_normalized,
+        lambda i: all(tokens and tokens == expected for tokens, expected in zip(rows.tokens[i:i + num_lines], header_tokens)),
+        lambda i: _fuzzy_block_score(rows.joined[i:i + num_lines], header_lines, threshold) >= threshold,
+    )
+    for matches in tiers:
+        for i in candidate_starts:
+            if matches(i):
+                return i + num_lines
+
+    raise ValueError("Header block not found")
@@ -1,5 +1,5 @@
 
-from utils.llm_interface.calling import llm_call_basic_with_llmcallfailure_exception
+from utils.llm_interface.calling import llm_call_basic_with_llmcallfailure_exception_async
 from utils.prompts.boq_context_prompts import system_prompt_boq_context, custom_instructions_boq_context
 from utils.prompts.user_prompts import user_prompt_basic
 from typing import Tuple
@@ -8,7 +8,7 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-def extract_boq_context(full_markdown_table: str, custom_instructions_user_input: str = "") -> Tuple[dict, int]:
+def build_boq_context_prompts(full_markdown_table: str, custom_instructions_user_input: str = "") -> Tuple[str, str]:
     custom_instructions = (
         custom_instructions_boq_context.format(custom_instructions=custom_instructions_user_input)
         if custom_instructions_user_input.strip() else None
@@ -17,5 +17,10 @@ def extract_boq_context(full_markdown_table: str, custom_instructions_user_input
     if custom_instructions:
         system_prompt += custom_instructions_boq_context.format(custom_instructions=custom_instructions)
     user_prompt = user_prompt_basic.format(text=full_markdown_table)
-    content, tokens_used = llm_call_basic_with_llmcallfailure_exception(system_prompt, user_prompt)
+    return system_prompt, user_prompt
+
+
+async def extract_boq_context(full_markdown_table: str, custom_instructions_user_input: str = "") -> Tuple[dict, int]:
+    system_prompt, user_prompt = build_boq_context_prompts(full_markdown_table, custom_instructions_user_input)
+    content, tokens_used = await llm_call_basic_with_llmcallfailure_exception_async(system_prompt, user_prompt)
     return content, tokens_used
@@ -1,52 +1,73 @@
 import os
 import json
 import pandas as pd
-from typing import Tuple
+from typing import Dict, Tuple, List, Optional
 import logging
 
+from utils.common_utils.artifact_writer import save_table_artifacts, BOQ_ARTIFACT_FORMATS
+from utils.common_utils.json_helpers import save_output_json
+
 logger = logging.getLogger(__name__)
 
-def combine_boq_outputs_across_sheets(file_path: str) -> Tuple[str, str]:
+# Tabs of the combined workbook: "all" (every sheet's entries in one table), "per_sheet" (one tab per source
+# sheet) or "both" (the "all" tab first, so readers of the first tab keep getting the full table)
+COMBINED_EXCEL_TAB_LAYOUTS = ("all", "per_sheet", "both")
+COMBINED_EXCEL_TABS = os.getenv("BOQ_COMBINED_EXCEL_TABS", "both").strip().lower()
+if COMBINED_EXCEL_TABS not in COMBINED_EXCEL_TAB_LAYOUTS:
+    raise ValueError(
+        f"Unknown BOQ_COMBINED_EXCEL_TABS '{COMBINED_EXCEL_TABS}', expected one of {COMBINED_EXCEL_TAB_LAYOUTS}"
+    )
+ALL_SHEETS_TAB = "All sheets"
+
+
+def _load_sheet_products(sheet_folder: str) -> Optional[List[Dict]]:
+    # sheets not processed by this run (e.g. reused from a previous run on resume) only exist on disk
+    json_path = os.path.join(sheet_folder, "final_output", "final_product_entries.json")
+    if not os.path.exists(json_path):
+        return None
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("products_entries", [])
+    except json.JSONDecodeError as e:
+        logger.warning(f"Failed to load JSON from {json_path}: {e}")
+    except Exception as e:
+        logger.warning(f"Error processing JSON from {json_path}: {e}")
+    return None
+
+
+def combine_boq_outputs_across_sheets(
+    file_path: str,
+    sheet_order: Optional[List[str]] = None,
+    products_by_sheet: Optional[Dict[str, List[Dict]]] = None
+) -> Tuple[str, str]:
+    """
+    Builds the combined JSON and xlsx in one pass over the sheets, in workbook order. Product entries come from
+    `products_by_sheet` (the merged entries Phase 2 kept in memory); only sheets missing there are read from
+    their final_product_entries.json. The xlsx (plus .csv/.parquet per BOQ_ARTIFACT_FORMATS) is written once
+    from the combined list.
+    """
     base_name = os.path.splitext(os.path.basename(file_path))[0]
     safe_base = "".join(c if c.isalnum() or c in ("_", "-") else "_" for c in base_name)
+    products_by_sheet = products_by_sheet or {}
     combined_json = []
-    combined_excel = pd.DataFrame()
+    combined_by_sheet = {}
 
-    sheet_order = pd.ExcelFile(file_path).sheet_names
+    if sheet_order is None:
+        sheet_order = pd.ExcelFile(file_path).sheet_names
 
     for sheet_name in sheet_order:
-        sheet_name_safe = "".join(c if c.isalnum() or c in ("_", "-") else "_" for c in sheet_name)
-        sheet_folder = os.path.join("outputs", safe_base, sheet_name_safe)
-        if not os.path.isdir(sheet_folder):
-            logger.warning(f"Sheet folder not found: {sheet_folder}")
-            continue
-
-        json_path = os.path.join(sheet_folder, "final_output", "final_product_entries.json")
-        excel_path = os.path.join(sheet_folder, "final_output", "final_product_entries.xlsx")
-        logger.info(f"Combining {json_path} and {excel_path}")
-        logger.info(f"sheet_name: {sheet_name_safe}")
-
-        if os.path.exists(json_path):
-            try:
-                with open(json_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    for item in data.get("products_entries", []):
-                        item["sheet_name"] = sheet_name
-                        combined_json.append(item)
-            except FileNotFoundError:
-                logger.warning(f"File not found: {json_path}")
-            except json.JSONDecodeError as e:
-                logger.warning(f"Failed to load JSON from {json_path}: {e}")
-            except Exception as e:
-                logger.warning(f"Error processing JSON from {json_path}: {e}")
-
-        if os.path.exists(excel_path):
-            try:
-                df = pd.read_excel(excel_path)
-                df["sheet_name"] = sheet_name
-                combined_excel = pd.concat([combined_excel, df], ignore_index=True)
-            except Exception as e:
-                logger.warning(f"Failed to load Excel from {excel_path}: {e}")
+        products = products_by_sheet.get(sheet_name)
+        if products is None:
+            sheet_name_safe = "".join(c if c.isalnum() or c in ("_", "-") else "_" for c in sheet_name)
+            sheet_folder = os.path.join("outputs", safe_base, sheet_name_safe)
+            if not os.path.isdir(sheet_folder):
+                logger.warning(f"Sheet folder not found: {sheet_folder}")
+                continue
+            products = _load_sheet_products(sheet_folder)
+            if products is None:
+                continue
+        combined_by_sheet[sheet_name] = [{**item, "sheet_name": sheet_name} for item in products]
+        combined_json.extend(combined_by_sheet[sheet_name])
 
     output_dir = os.path.join("outputs", safe_base)
     os.makedirs(output_dir, exist_ok=True)
@@ -54,10 +75,15 @@ def combine_boq_outputs_across_sheets(file_path: str) -> Tuple[str, str]:
     combined_json_path = os.path.join(output_dir, "product_entries_combined_across_sheets.json")
     combined_excel_path = os.path.join(output_dir, "product_entries_combined_across_sheets.xlsx")
 
-    with open(combined_json_path, "w", encoding="utf-8") as f:
-        json.dump(combined_json, f, indent=2, ensure_ascii=False)
-
-    combined_excel.to_excel(combined_excel_path, index=False)
+    save_output_json(combined_json_path, combined_json)
+    excel_tabs = []
+    if COMBINED_EXCEL_TABS in ("all", "both"):
+        excel_tabs.append((ALL_SHEETS_TAB, combined_json))
+    if COMBINED_EXCEL_TABS in ("per_sheet", "both"):
+        excel_tabs.extend(combined_by_sheet.items())
+    # the xlsx is always written: it is the download the API hands out
+    formats = ("xlsx",) + tuple(fmt for fmt in BOQ_ARTIFACT_FORMATS if fmt != "xlsx")
+    save_table_artifacts(combined_excel_path[:-len(".xlsx")], combined_json, formats, excel_tabs)
 
     logger.info(f"✅ Combined outputs saved in '{output_dir}':")
     logger.info(f"  - {os.path.basename(combined_json_path)}")
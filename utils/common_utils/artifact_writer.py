@@ -0,0 +1,159 @@
+import os
+import csv
+import math
+import itertools
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import logging
+
+import pandas as pd
+
+from utils.observability.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# pyarrow is optional: without it Parquet artifacts are skipped (with a warning), xlsx and CSV still work
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+ARTIFACT_FORMATS = ("xlsx", "csv", "parquet")
+# Formats the product-entry tables (per sheet and combined) are written in, e.g. "xlsx,csv,parquet"
+BOQ_ARTIFACT_FORMATS = tuple(
+    fmt.strip().lower() for fmt in os.getenv("BOQ_ARTIFACT_FORMATS", "xlsx").split(",") if fmt.strip()
+)
+if set(BOQ_ARTIFACT_FORMATS) - set(ARTIFACT_FORMATS):
+    raise ValueError(
+        f"Unknown BOQ_ARTIFACT_FORMATS {sorted(set(BOQ_ARTIFACT_FORMATS) - set(ARTIFACT_FORMATS))}, "
+        f"expected a comma-separated subset of {ARTIFACT_FORMATS}"
+    )
+PARQUET_ROW_GROUP_SIZE = 50_000
+
+# Rows are product-entry dicts, or a DataFrame (e.g. the schedule slice)
+TableRows = Union[List[Dict], pd.DataFrame]
+
+EXCEL_MAX_TAB_NAME = 31
+EXCEL_TAB_FORBIDDEN = str.maketrans({char: "_" for char in "[]:*?/\\"})
+
+
+def table_columns(rows: TableRows) -> List:
+    if isinstance(rows, pd.DataFrame):
+        return list(rows.columns)
+    # what a DataFrame would get: every key, in order of first appearance
+    return list(dict.fromkeys(key for row in rows for key in row))
+
+
+def iter_table_rows(rows: TableRows, columns: List) -> Iterator[list]:
+    if isinstance(rows, pd.DataFrame):
+        return (list(values) for values in rows[columns].itertuples(index=False, name=None))
+    return ([row.get(column) for column in columns] for row in rows)
+
+
+def _cell_value(value):
+    # as DataFrame.to_excel does: missing values stay empty, containers are written as their str()
+    if value is None or value is pd.NaT or value is pd.NA or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, (dict, list, tuple, set)):
+        return str(value)
+    return value
+
+
+def _text_value(value) -> Optional[str]:
+    value = _cell_value(value)
+    return None if value is None else str(value)
+
+
+def excel_tab_name(name: str, taken: set) -> str:
+    base = str(name).translate(EXCEL_TAB_FORBIDDEN).strip("'") or "Sheet"
+    tab_name = base[:EXCEL_MAX_TAB_NAME]
+    for counter in itertools.count(2):
+        if tab_name.lower() not in taken:
+            break
+        suffix = f" ({counter})"
+        tab_name = base[:EXCEL_MAX_TAB_NAME - len(suffix)] + suffix
+    taken.add(tab_name.lower())
+    return tab_name
+
+
+def write_excel(filepath: str, tables: Union[Dict[str, TableRows], List[Tuple[str, TableRows]]], columns: Optional[List] = None):
+    """
+    Writes one tab per entry of `tables` (tab name -> rows, or a list of such pairs; clashing or invalid tab
+    names are made unique and valid). Rows are streamed through openpyxl's write-only
+    mode, which keeps no cell objects in memory, so memory stays flat however many rows are written.
+    """
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    taken = set()
+    total_rows = 0
+    with span("io.excel_write", path=filepath, tabs=len(tables)) as write_stats:
+        for tab_name, rows in (tables.items() if isinstance(tables, dict) else tables):
+            tab_columns = columns or table_columns(rows)
+            worksheet = workbook.create_sheet(excel_tab_name(tab_name, taken))
+            worksheet.append(tab_columns)
+            for values in iter_table_rows(rows, tab_columns):
+                worksheet.append([_cell_value(value) for value in values])
+            total_rows += len(rows)
+        if not tables:
+            workbook.create_sheet("Sheet1")
+        workbook.save(filepath)
+        write_stats["rows"] = total_rows
+
+
+def write_csv(filepath: str, rows: TableRows, columns: Optional[List] = None):
+    columns = columns or table_columns(rows)
+    with span("io.csv_write", path=filepath, rows=len(rows)), open(filepath, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for values in iter_table_rows(rows, columns):
+            writer.writerow(["" if value is None else value for value in map(_text_value, values)])
+
+
+def write_parquet(filepath: str, rows: TableRows, columns: Optional[List] = None) -> bool:
+    # every column is stored as string: extracted fields are text, and mixed cell types cannot share a schema
+    if pq is None:
+        logger.warning(f"⚠️ pyarrow is not installed, skipping {filepath}")
+        return False
+    columns = columns or table_columns(rows)
+    schema = pa.schema([(str(column), pa.string()) for column in columns])
+    rows_iter = iter_table_rows(rows, columns)
+    with span("io.parquet_write", path=filepath, rows=len(rows)), pq.ParquetWriter(filepath, schema) as writer:
+        # one row group per PARQUET_ROW_GROUP_SIZE rows, so only one group is held in memory at a time
+        while True:
+            batch = [[_text_value(value) for value in values] for values in itertools.islice(rows_iter, PARQUET_ROW_GROUP_SIZE)]
+            if not batch:
+                break
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array([values[idx] for values in batch], type=pa.string()) for idx in range(len(columns))],
+                schema=schema
+            ))
+    return True
+
+
+def save_table_artifacts(
+    base_path: str,
+    rows: TableRows,
+    formats: Optional[tuple] = None,
+    excel_tabs: Optional[List[Tuple[str, TableRows]]] = None
+) -> Dict[str, str]:
+    """
+    Writes `rows` as <base_path>.<format> for each requested format (default BOQ_ARTIFACT_FORMATS) and returns
+    format -> path of what was written. `excel_tabs` replaces the single tab of the xlsx with several tabs.
+    """
+    formats = BOQ_ARTIFACT_FORMATS if formats is None else formats
+    columns = table_columns(rows) if len(rows) else None
+    written = {}
+    for fmt in formats:
+        path = f"{base_path}.{fmt}"
+        if fmt == "xlsx":
+            write_excel(path, excel_tabs if excel_tabs is not None else [("Sheet1", rows)], columns)
+        elif fmt == "csv":
+            write_csv(path, rows, columns)
+        elif fmt == "parquet":
+            if not write_parquet(path, rows, columns):
+                continue
+        else:
+            raise ValueError(f"Unknown artifact format '{fmt}', expected one of {ARTIFACT_FORMATS}")
+        written[fmt] = path
+    return written
@@ -1,25 +1,150 @@
+import re
+import math
 import pandas as pd
+from typing import Collection, List
 import logging
 
 logger = logging.getLogger(__name__)
 
-def format_batch_as_markdown(df_schedule: pd.DataFrame, header_md: str, start_idx: int = 0, batch_size: int = 20) -> str:
+# How chunk tables are serialized into the prompt: "markdown" repeats the header rows and every cell;
+# "compact" keeps only the chunk's non-empty columns under a one-line legend and trims empty trailing cells
+TABLE_FORMATS = ("markdown", "compact")
+# A plain decimal number whose tail ends in zeros, e.g. "1239.0", "2.50" or "12.", trimmed in the compact format
+# only where it is a number: text cells elsewhere (an item no. "13.10" next to "13.1") are kept as they are
+DECIMAL_TAIL_PATTERN = re.compile(r"^([-+]?[\d,]*\d)(?:\.0*|(\.\d*?[1-9])0+)$")
+
+
+def rows_as_cell_strings(df: pd.DataFrame) -> List[List[str]]:
+    """
+    Every row as a list of cell strings, in one pass over the frame.
+    Matches row-wise `row.astype(str)`: a row takes the frame's common dtype, so formatting is applied to
+    that 2-D block (e.g. ints next to floats render as floats) rather than column by column.
+    """
+    if df.empty:
+        return [[] for _ in range(len(df))]
+    return pd.DataFrame(df.to_numpy()).astype(str).to_numpy().tolist()
+
+def format_batch_as_markdown(
+    df_schedule: pd.DataFrame,
+    header_md: str,
+    start_idx: int = 0,
+    batch_size: int = 20,
+    row_numbers: bool = False
+) -> str:
+    """
+    Markdown table of rows [start_idx, start_idx + batch_size) under the sheet's header rows. With `row_numbers`,
+    a leading `row` column carries each row's position in df_schedule (for the row-reference output mode).
+    """
     df_batch = df_schedule.iloc[start_idx:min(start_idx + batch_size, len(df_schedule))]
 
     # Parse header and get expected number of columns
     header_lines = [line.strip() for line in header_md.strip().split("\n") if line.strip()]
     num_cols = max(line.count("|") for line in header_lines)
-    header_rows = "\n".join(header_lines)
     
     # Build proper markdown header and separator
     separator = " | ".join(["---"] * (num_cols + 1))
 
     # Sanitize batch rows to match header column count
-    markdown_rows = []
-    for _, row in df_batch.iterrows():
-        cells = list(row.astype(str))
-        cells = cells[:num_cols + 1]  # trim extra cols
-        cells += [""] * (num_cols + 1 - len(cells))  # pad missing cols
-        markdown_rows.append(" | ".join(cells))
+    padding = [""] * max(0, num_cols + 1 - df_batch.shape[1])
+    markdown_rows = [
+        " | ".join(cells[:num_cols + 1] + padding)  # trim extra cols / pad missing cols
+        for cells in rows_as_cell_strings(df_batch)
+    ]
+
+    if row_numbers:
+        header_lines = [f"{'row' if idx == 0 else ''} | {line}" for idx, line in enumerate(header_lines)]
+        separator = f"--- | {separator}"
+        markdown_rows = [f"{start_idx + offset} | {line}" for offset, line in enumerate(markdown_rows)]
 
+    header_rows = "\n".join(header_lines)
     return f"{header_rows}\n{separator}\n" + '\n'.join(markdown_rows)
+
+
+def header_labels(header_md: str) -> List[str]:
+    """One label per column of the header block; the lines of a multi-line header are joined per column."""
+    lines = [line for line in header_md.split("\n") if line.strip()]
+    split_lines = [[cell.strip() for cell in line.split("|")] for line in lines]
+    num_cols = max((len(cells) for cells in split_lines), default=0)
+    return [" ".join(cells[col] for cells in split_lines if col < len(cells) and cells[col]) for col in range(num_cols)]
+
+
+def _trim_decimal_tail(match: re.Match) -> str:
+    return match.group(1) + (match.group(2) or "")
+
+
+def compact_cell(value, trim_numbers: bool = False) -> str:
+    # missing values are left empty and runs of whitespace (line breaks included) become one space; floats, and
+    # with `trim_numbers` (the numeric columns) the number strings of the cleaned sheets, lose the zeros of their
+    # decimal tail ("1.0" -> "1", "2.50" -> "2.5")
+    if value is None or value is pd.NaT or value is pd.NA:
+        return ""
+    if isinstance(value, float):
+        if math.isnan(value):
+            return ""
+        value = repr(value)
+        trim_numbers = True
+    text = " ".join(str(value).split())
+    if text.lower() == "nan":
+        return ""
+    return DECIMAL_TAIL_PATTERN.sub(_trim_decimal_tail, text) if trim_numbers else text
+
+
+def compact_rows_as_cell_strings(df: pd.DataFrame, numeric_cols: Collection[int] = ()) -> List[List[str]]:
+    """Compact cells of every row; only the `numeric_cols` (e.g. the mapped quantity, rate and amount) trim text numbers."""
+    return [
+        [compact_cell(value, col in numeric_cols) for col, value in enumerate(row)]
+        for row in df.to_numpy(dtype=object).tolist()
+    ]
+
+
+def format_compact_table(
+    rows: List[List[str]],
+    labels: List[str],
+    first_row: int = 0,
+    row_numbers: bool = False
+) -> str:
+    """
+    Compact table of already compacted rows: a legend line naming the non-empty columns, then one line per
+    row with only those columns and without its empty trailing cells (a blank row is an empty line).
+    """
+    num_cols = max((len(cells) for cells in rows), default=0)
+    kept_cols = [col for col in range(num_cols) if any(col < len(cells) and cells[col] for cells in rows)]
+    legend = [labels[col] if col < len(labels) and labels[col] else f"column {col + 1}" for col in kept_cols]
+    lines = [" | ".join((["row"] if row_numbers else []) + legend)]
+    for offset, cells in enumerate(rows):
+        values = [cells[col] if col < len(cells) else "" for col in kept_cols]
+        while values and not values[-1]:
+            values.pop()
+        lines.append(" | ".join(([str(first_row + offset)] if row_numbers else []) + values))
+    return "\n".join(lines)
+
+
+def format_chunk_table(
+    df_schedule: pd.DataFrame,
+    header_md: str,
+    start_idx: int = 0,
+    batch_size: int = 20,
+    row_numbers: bool = False,
+    table_format: str = "markdown",
+    numeric_cols: Collection[int] = ()
+) -> str:
+    """
+    Rows [start_idx, start_idx + batch_size) of the schedule in the run's table format (TABLE_FORMATS).
+    `numeric_cols` are the columns whose numbers the compact format may trim.
+    """
+    if table_format == "markdown":
+        return format_batch_as_markdown(df_schedule, header_md, start_idx, batch_size, row_numbers)
+    df_batch = df_schedule.iloc[start_idx:min(start_idx + batch_size, len(df_schedule))]
+    return format_compact_table(
+        compact_rows_as_cell_strings(df_batch, numeric_cols), header_labels(header_md), start_idx, row_numbers
+    )
+
+
+if __name__ == "__main__":
+    # item numbers are text: "13.10" must not turn into its sibling "13.1", nor "2.0" into "2"; the quantity
+    # column is numeric, so its zeros go
+    df = pd.DataFrame([["13.1", "Cable tray", "2.50"], ["13.10", "Cable tray bend", "12.0"], ["2.0", "Earthing", 4.0]])
+    rows = compact_rows_as_cell_strings(df, numeric_cols=(2,))
+    assert [cells[0] for cells in rows] == ["13.1", "13.10", "2.0"], rows
+    assert [cells[2] for cells in rows] == ["2.5", "12", "4"], rows
+    print(format_chunk_table(df, "Sl. No. | Description | Qty", 0, len(df), table_format="compact", numeric_cols=(2,)))
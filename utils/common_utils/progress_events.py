@@ -0,0 +1,42 @@
+import time
+import asyncio
+import contextvars
+from typing import Callable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Callable receiving progress events of the current run (set by the job queue / streaming endpoint).
+# Pipeline code only calls emit_progress and never needs to know who is listening.
+progress_sink_var: contextvars.ContextVar[Optional[Callable[[dict], None]]] = contextvars.ContextVar(
+    "progress_sink", default=None
+)
+
+
+def emit_progress(event_type: str, **payload):
+    sink = progress_sink_var.get()
+    if sink is None:
+        return
+    event = {"type": event_type, "timestamp": time.time(), **payload}
+    try:
+        sink(event)
+    except Exception as e:
+        logger.warning(f"⚠️ Progress sink failed for event '{event_type}': {e}")
+
+
+def queue_sink(queue: asyncio.Queue) -> Callable[[dict], None]:
+    """
+    Sink that forwards events into an asyncio.Queue; safe to call from worker threads as well as the loop.
+    """
+    loop = asyncio.get_running_loop()
+
+    def sink(event: dict):
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is loop:
+            queue.put_nowait(event)
+        else:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+    return sink
@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import contextvars
+from typing import Dict, List, Optional
+import logging
+
+from utils.common_utils.run_store import run_store_var
+
+logger = logging.getLogger(__name__)
+
+RUN_MANIFEST_NAME = "run_manifest.json"
+MANIFEST_VERSION = 2
+
+SHEET_IN_PROGRESS = "in_progress"
+SHEET_COMPLETED = "completed"
+SHEET_FAILED = "failed"
+
+# Manifest of the current run (set by BOQ_EXTRACTOR_SERVICE); pipeline stages record their checkpoints in it
+run_manifest_var: contextvars.ContextVar[Optional["RunManifest"]] = contextvars.ContextVar(
+    "run_manifest", default=None
+)
+
+
+def file_sha256(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def workbook_fingerprint(file_path: str) -> str:
+    return file_sha256(file_path)
+
+
+def chunk_key(start_row: int, end_row: int) -> str:
+    return f"{start_row}_{end_row}"
+
+
+class RunManifest:
+    """
+    Checkpoint record of one workbook run, stored as outputs/<safe_base>/run_manifest.json.
+    Intermediate results a later stage relies on (sheet metadata, chunk results; see run_store.RunStore) are
+    recorded with the digest of their stored row, final outputs with their file sha256, so a resumed run only
+    trusts results that are still intact and re-runs the rest.
+    The manifest is only reused when the workbook fingerprint and the run settings are unchanged.
+    """
+
+    def __init__(self, output_root: str, fingerprint: str, settings: Dict, sheets: Optional[Dict] = None):
+        self.output_root = output_root
+        self.path = os.path.join(output_root, RUN_MANIFEST_NAME)
+        self.fingerprint = fingerprint
+        self.settings = settings
+        self.sheets: Dict[str, Dict] = sheets or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, output_root: str, fingerprint: str, settings: Dict, resume: bool = False) -> "RunManifest":
+        path = os.path.join(output_root, RUN_MANIFEST_NAME)
+        if resume and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") != MANIFEST_VERSION:
+                    logger.info("🔁 Run manifest has an old format, starting a fresh run")
+                elif data.get("workbook_fingerprint") != fingerprint:
+                    logger.info("🔁 Workbook changed since the last run, starting a fresh run")
+                elif data.get("settings") != settings:
+                    logger.info("🔁 Run settings changed since the last run, starting a fresh run")
+                else:
+                    logger.info(f"♻️ Resuming run from {path}")
+                    return cls(output_root, fingerprint, settings, data.get("sheets", {}))
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"⚠️ Unreadable run manifest {path}, starting a fresh run: {e}")
+
+        manifest = cls(output_root, fingerprint, settings)
+        manifest.save()
+        return manifest
+
+    def save(self):
+        with self._lock:
+            os.makedirs(self.output_root, exist_ok=True)
+            data = {
+                "version": MANIFEST_VERSION,
+                "workbook_fingerprint": self.fingerprint,
+                "settings": self.settings,
+                "updated_at": time.time(),
+                "sheets": self.sheets,
+            }
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    # --- integrity helpers ---
+
+    def _hash_files(self, paths: List[str]) -> Dict[str, str]:
+        return {os.path.relpath(path, self.output_root): file_sha256(path) for path in paths if os.path.exists(path)}
+
+    def _files_intact(self, recorded: Optional[Dict[str, str]]) -> bool:
+        if not recorded:
+            return False
+        return all(
+            file_sha256(os.path.join(self.output_root, rel_path)) == sha
+            for rel_path, sha in recorded.items()
+        )
+
+    def _sheet(self, sheet_name: str) -> Dict:
+        return self.sheets.setdefault(sheet_name, {"status": SHEET_IN_PROGRESS, "chunks": {}})
+
+    # --- metadata (Phase 1) ---
+
+    def record_metadata(self, sheet_name: str, digest: str):
+        self._sheet(sheet_name)["metadata_digest"] = digest
+        self.save()
+
+    def verified_metadata(self, sheet_name: str) -> Optional[Dict]:
+        recorded = self.sheets.get(sheet_name, {}).get("metadata_digest")
+        store = run_store_var.get()
+        stored = store.get_metadata(sheet_name) if recorded and store else None
+        if stored is None or stored[1] != recorded:
+            return None
+        return stored[0]
+
+    # --- chunks (Phase 2) ---
+
+    def record_chunk(self, sheet_name: str, start_row: int, end_row: int, digest: str, state: Optional[Dict] = None):
+        self._sheet(sheet_name)["chunks"][chunk_key(start_row, end_row)] = {
+            "digest": digest,
+            "state": state,
+        }
+        self.save()
+
+    def verified_chunk(self, sheet_name: str, start_row: int, end_row: int) -> Optional[Dict]:
+        entry = self.sheets.get(sheet_name, {}).get("chunks", {}).get(chunk_key(start_row, end_row))
+        store = run_store_var.get()
+        if entry is None or store is None or store.chunk_digest(sheet_name, start_row, end_row) != entry["digest"]:
+            return None
+        return entry
+
+    # --- sheets ---
+
+    def record_sheet_completed(self, sheet_name: str, final_paths: List[str]):
+        sheet = self._sheet(sheet_name)
+        sheet.update({"status": SHEET_COMPLETED, "final_outputs": self._hash_files(final_paths), "error": None})
+        self.save()
+
+    def record_sheet_failed(self, sheet_name: str, error: str):
+        sheet = self._sheet(sheet_name)
+        sheet.update({"status": SHEET_FAILED, "error": error})
+        self.save()
+
+    def is_sheet_completed(self, sheet_name: str) -> bool:
+        sheet = self.sheets.get(sheet_name, {})
+        return sheet.get("status") == SHEET_COMPLETED and self._files_intact(sheet.get("final_outputs"))
@@ -0,0 +1,66 @@
+import os
+from typing import Dict, Optional
+import logging
+
+from utils.common_utils.markdown_helpers import TABLE_FORMATS
+
+logger = logging.getLogger(__name__)
+
+# Per-run knobs threaded from BOQ_EXTRACTOR_SERVICE down to the sheet/chunk level.
+# Defaults come from the environment; callers override individual keys per request.
+DEFAULT_RUN_OPTIONS = {
+    # "sequential": chunks chained through the carry-over product block (one LLM round-trip per chunk)
+    # "parallel": chunks extracted concurrently, boundary blocks reconciled afterwards
+    "extraction_mode": os.getenv("BOQ_EXTRACTION_MODE", "sequential"),
+    # reuse intact checkpoints of a previous run of the same workbook (see utils.common_utils.run_manifest)
+    "resume": os.getenv("BOQ_RESUME", "false").strip().lower() in ("1", "true", "yes"),
+    # target prompt tokens of each chunk's markdown table; 0 falls back to fixed 30-row chunks
+    "chunk_token_budget": int(os.getenv("BOQ_CHUNK_TOKEN_BUDGET", "1200")),
+    # pre-flight cost cap per request in USD (0 disables it) and what to do when the estimate exceeds it:
+    # "reject" the upload, or "downscope" to the leading sheets that fit
+    "max_cost_usd": float(os.getenv("BOQ_MAX_COST_USD", "10")),
+    "budget_action": os.getenv("BOQ_BUDGET_ACTION", "reject"),
+    # "interactive": every LLM call is sent right away; "batch": the independent calls of each phase go out as
+    # one batch job (see utils.llm_interface.batch_collector) at batch pricing, for non-urgent workbooks
+    "llm_execution": os.getenv("BOQ_LLM_EXECUTION", "interactive"),
+    # "text": the model copies every description and section heading into its answer; "row_refs": it returns the
+    # row numbers of that text, which is rebuilt from the schedule (see utils.process_schedule.row_references)
+    "output_mode": os.getenv("BOQ_OUTPUT_MODE", "text"),
+    # drop blank, total and repeated header rows from the schedule before chunking
+    # (see utils.process_schedule.row_classifier)
+    "row_prepass": os.getenv("BOQ_ROW_PREPASS", "true").strip().lower() in ("1", "true", "yes"),
+    # serialization of the chunk tables in the prompt, one of TABLE_FORMATS (see utils.common_utils.markdown_helpers)
+    "table_format": os.getenv("BOQ_TABLE_FORMAT", "markdown"),
+    # "rule": each sheet's header rows are found by keyword rules (see utils.boq_context_extraction.header_detection),
+    # with the context LLM call only when no row is a confident header; "llm": the LLM call for every sheet
+    "header_detection": os.getenv("BOQ_HEADER_DETECTION", "rule"),
+}
+
+EXTRACTION_MODES = ("sequential", "parallel")
+BUDGET_ACTIONS = ("reject", "downscope")
+LLM_EXECUTIONS = ("interactive", "batch")
+OUTPUT_MODES = ("text", "row_refs")
+HEADER_DETECTIONS = ("rule", "llm")
+
+
+def resolve_run_options(run_options: Optional[Dict] = None) -> Dict:
+    resolved = dict(DEFAULT_RUN_OPTIONS)
+    resolved.update({key: value for key, value in (run_options or {}).items() if value is not None})
+
+    if resolved["extraction_mode"] not in EXTRACTION_MODES:
+        raise ValueError(f"Unknown extraction_mode '{resolved['extraction_mode']}', expected one of {EXTRACTION_MODES}")
+    if resolved["budget_action"] not in BUDGET_ACTIONS:
+        raise ValueError(f"Unknown budget_action '{resolved['budget_action']}', expected one of {BUDGET_ACTIONS}")
+    if resolved["llm_execution"] not in LLM_EXECUTIONS:
+        raise ValueError(f"Unknown llm_execution '{resolved['llm_execution']}', expected one of {LLM_EXECUTIONS}")
+    if resolved["output_mode"] not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output_mode '{resolved['output_mode']}', expected one of {OUTPUT_MODES}")
+    if resolved["table_format"] not in TABLE_FORMATS:
+        raise ValueError(f"Unknown table_format '{resolved['table_format']}', expected one of {TABLE_FORMATS}")
+    if resolved["header_detection"] not in HEADER_DETECTIONS:
+        raise ValueError(f"Unknown header_detection '{resolved['header_detection']}', expected one of {HEADER_DETECTIONS}")
+    if resolved["llm_execution"] == "batch" and resolved["extraction_mode"] == "sequential":
+        # sequential chunks wait on each other's answers, which would mean one batch round-trip per chunk
+        logger.info("📦 Batch execution extracts chunks in parallel mode")
+        resolved["extraction_mode"] = "parallel"
+    return resolved
@@ -0,0 +1,335 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextvars
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+RUN_STORE_NAME = "run_store.sqlite"
+
+# Store of the current run (set by BOQ_EXTRACTOR_SERVICE); chunk results and boundary corrections go here
+run_store_var: contextvars.ContextVar[Optional["RunStore"]] = contextvars.ContextVar("run_store", default=None)
+
+
+def _json_default(value):
+    # numpy scalars (row labels, cell values) -> plain Python values
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+def _dumps(value) -> Optional[str]:
+    return None if value is None else json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_json_default)
+
+
+def _loads(text: Optional[str]):
+    return None if text is None else json.loads(text)
+
+
+def _digest(*payloads: Optional[str]) -> str:
+    digest = hashlib.sha256()
+    for payload in payloads:
+        digest.update((payload or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def flatten_product_blocks(product_blocks: List[Dict]) -> List[Dict]:
+    product_entries = []
+    for block in product_blocks:
+        section_context = block.get("section_context_for_this_product_block", "")
+        for variant in block.get("list_of_product_variants", []):
+            product_entries.append({
+                "section_context_for_this_product_block": section_context,
+                **variant,  # unpack existing fields
+            })
+    return product_entries
+
+
+def compact_original_rows(original_rows_info: Dict) -> Dict:
+    # {"row_range", "original_rows": [{column: value}, ...]} -> column names once, then one value list per row
+    rows = original_rows_info.get("original_rows", [])
+    columns = list(rows[0].keys()) if rows else []
+    return {
+        "row_range": original_rows_info.get("row_range"),
+        "columns": columns,
+        "rows": [[row.get(column) for column in columns] for row in rows],
+    }
+
+
+def expand_original_rows(compact: Dict) -> Dict:
+    return {
+        "row_range": compact.get("row_range"),
+        "original_rows": [dict(zip(compact.get("columns", []), values)) for values in compact.get("rows", [])],
+    }
+
+
+class RunStore:
+    """
+    Intermediate results of one workbook run in a single SQLite file, outputs/<safe_base>/run_store.sqlite:
+    sheet metadata (BOQ context and header, stored once per sheet), the raw result of every chunk and the
+    boundary-corrected product entries the sheet outputs are merged from. Rows are compact JSON, replaced
+    when a chunk is re-run. export() writes the same data back out as the per-chunk JSON folder layout.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS sheets (
+                    sheet_name TEXT PRIMARY KEY,
+                    metadata TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    updated_at REAL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_results (
+                    sheet_name TEXT NOT NULL,
+                    start_row INTEGER NOT NULL,
+                    end_row INTEGER NOT NULL,
+                    product_entries TEXT,
+                    product_blocks TEXT,
+                    original_rows TEXT,
+                    prompt_tokens INTEGER,
+                    completion_tokens INTEGER,
+                    digest TEXT NOT NULL,
+                    updated_at REAL,
+                    PRIMARY KEY (sheet_name, start_row, end_row)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS corrected_chunks (
+                    sheet_name TEXT NOT NULL,
+                    start_row INTEGER NOT NULL,
+                    end_row INTEGER NOT NULL,
+                    product_entries TEXT NOT NULL,
+                    updated_at REAL,
+                    PRIMARY KEY (sheet_name, start_row, end_row)
+                )
+            """)
+            self._conn.commit()
+
+    @classmethod
+    def open(cls, output_root: str) -> "RunStore":
+        return cls(os.path.join(output_root, RUN_STORE_NAME))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- metadata (Phase 1) ---
+
+    def put_metadata(self, sheet_name: str, metadata: Dict) -> str:
+        payload = _dumps(metadata)
+        digest = _digest(payload)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sheets VALUES (?, ?, ?, ?)", (sheet_name, payload, digest, time.time())
+            )
+            self._conn.commit()
+        return digest
+
+    def get_metadata(self, sheet_name: str) -> Optional[Tuple[Dict, str]]:
+        """(metadata, digest) of the sheet, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT metadata, digest FROM sheets WHERE sheet_name = ?", (sheet_name,)
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def all_metadata(self) -> Dict[str, Dict]:
+        """Metadata of every sheet in the store, by sheet name."""
+        with self._lock:
+            rows = self._conn.execute("SELECT sheet_name, metadata FROM sheets").fetchall()
+        return {sheet_name: json.loads(metadata) for sheet_name, metadata in rows}
+
+    # --- chunks (Phase 2) ---
+
+    def put_chunk_result(
+        self,
+        sheet_name: str,
+        start_row: int,
+        end_row: int,
+        original_rows_info: Dict,
+        tokens_used: Tuple[int, int],
+        product_entries: Optional[List[Dict]] = None,
+        product_blocks: Optional[List[Dict]] = None
+    ) -> str:
+        """Stores the extraction result of one chunk and returns its digest (for the run manifest)."""
+        entries_payload = _dumps(product_entries)
+        blocks_payload = _dumps(product_blocks)
+        rows_payload = _dumps(compact_original_rows(original_rows_info))
+        digest = _digest(entries_payload, blocks_payload, rows_payload)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunk_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (sheet_name, start_row, end_row, entries_payload, blocks_payload, rows_payload,
+                 tokens_used[0], tokens_used[1], digest, time.time())
+            )
+            self._conn.commit()
+        return digest
+
+    def get_chunk_result(self, sheet_name: str, start_row: int, end_row: int) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT product_entries, product_blocks, original_rows, prompt_tokens, completion_tokens, digest "
+                "FROM chunk_results WHERE sheet_name = ? AND start_row = ? AND end_row = ?",
+                (sheet_name, start_row, end_row)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "product_entries": _loads(row[0]),
+            "product_blocks": _loads(row[1]),
+            "original_rows_info": expand_original_rows(_loads(row[2]) or {}),
+            "token_usage": {"prompt_tokens": row[3], "completion_tokens": row[4]},
+            "digest": row[5],
+        }
+
+    def chunk_digest(self, sheet_name: str, start_row: int, end_row: int) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest FROM chunk_results WHERE sheet_name = ? AND start_row = ? AND end_row = ?",
+                (sheet_name, start_row, end_row)
+            ).fetchone()
+        return row[0] if row else None
+
+    def all_chunk_entries(self) -> List[Tuple[str, List[Dict]]]:
+        """(sheet name, product entries) of every stored chunk result in table order, blocks flattened."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sheet_name, product_entries, product_blocks FROM chunk_results ORDER BY sheet_name, start_row"
+            ).fetchall()
+        return [
+            (sheet_name, _loads(entries) if entries is not None else flatten_product_blocks(_loads(blocks) or []))
+            for sheet_name, entries, blocks in rows
+        ]
+
+    # --- boundary-corrected chunks (merged into the sheet outputs) ---
+
+    def put_corrected_chunk(self, sheet_name: str, start_row: int, end_row: int, product_entries: List[Dict]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO corrected_chunks VALUES (?, ?, ?, ?, ?)",
+                (sheet_name, start_row, end_row, _dumps(product_entries), time.time())
+            )
+            self._conn.commit()
+
+    def delete_corrected_chunk(self, sheet_name: str, start_row: int, end_row: int):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM corrected_chunks WHERE sheet_name = ? AND start_row = ? AND end_row = ?",
+                (sheet_name, start_row, end_row)
+            )
+            self._conn.commit()
+
+    def get_corrected_chunk(self, sheet_name: str, start_row: int, end_row: int) -> Optional[List[Dict]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT product_entries FROM corrected_chunks WHERE sheet_name = ? AND start_row = ? AND end_row = ?",
+                (sheet_name, start_row, end_row)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # --- export ---
+
+    def export(self, output_root: str) -> int:
+        """
+        Regenerates the debugging layout of earlier versions under `output_root`: <sheet>/metadata.json,
+        <sheet>/chunking/chunk_outputs/page_output_<s>_<e>.json and
+        <sheet>/boundaries/page_output_dropped_last_product_entry_<s>_<e>.json. Returns the number of files written.
+        """
+        from utils.boq_context_extraction.folder_helpers import sheet_folder_name
+        from utils.common_utils.json_helpers import save_output_json
+
+        with self._lock:
+            sheets = {name: json.loads(metadata) for name, metadata in self._conn.execute("SELECT sheet_name, metadata FROM sheets")}
+            chunk_keys = self._conn.execute(
+                "SELECT sheet_name, start_row, end_row FROM chunk_results ORDER BY sheet_name, start_row"
+            ).fetchall()
+            corrected_keys = self._conn.execute(
+                "SELECT sheet_name, start_row, end_row FROM corrected_chunks ORDER BY sheet_name, start_row"
+            ).fetchall()
+
+        files_written = 0
+        for sheet_name, metadata in sheets.items():
+            sheet_folder = os.path.join(output_root, sheet_folder_name(sheet_name))
+            os.makedirs(sheet_folder, exist_ok=True)
+            save_output_json(os.path.join(sheet_folder, "metadata.json"), metadata)
+            files_written += 1
+
+        def chunk_document(sheet_name: str, result: Optional[Dict], product_entries: List[Dict]) -> Dict:
+            result = result or {}
+            return {
+                "sheet_name": sheet_name,
+                "boq_context": sheets.get(sheet_name, {}).get("context_md", ""),
+                "product_entries": product_entries,
+                "original_rows_info": result.get("original_rows_info"),
+                "token_usage": result.get("token_usage"),
+            }
+
+        for sheet_name, start_row, end_row in chunk_keys:
+            result = self.get_chunk_result(sheet_name, start_row, end_row)
+            product_entries = result["product_entries"]
+            if product_entries is None:
+                product_entries = flatten_product_blocks(result["product_blocks"] or [])
+            document = chunk_document(sheet_name, result, product_entries)
+            if result["product_blocks"] is not None:
+                document["product_blocks"] = result["product_blocks"]
+            folder = os.path.join(output_root, sheet_folder_name(sheet_name), "chunking", "chunk_outputs")
+            os.makedirs(folder, exist_ok=True)
+            save_output_json(os.path.join(folder, f"page_output_{start_row}_{end_row}.json"), document)
+            files_written += 1
+
+        for sheet_name, start_row, end_row in corrected_keys:
+            document = chunk_document(
+                sheet_name, self.get_chunk_result(sheet_name, start_row, end_row),
+                self.get_corrected_chunk(sheet_name, start_row, end_row)
+            )
+            folder = os.path.join(output_root, sheet_folder_name(sheet_name), "boundaries")
+            os.makedirs(folder, exist_ok=True)
+            save_output_json(os.path.join(folder, f"page_output_dropped_last_product_entry_{start_row}_{end_row}.json"), document)
+            files_written += 1
+
+        return files_written
+
+
+def current_run_store(sheet_output_folder: str) -> RunStore:
+    """
+    Store of the current run; outside a run (the modules' __main__ entry points) the store of the workbook
+    folder that `sheet_output_folder` belongs to.
+    """
+    store = run_store_var.get()
+    if store is None:
+        store = RunStore.open(os.path.dirname(os.path.normpath(sheet_output_folder)))
+        run_store_var.set(store)
+    return store
+
+
+if __name__ == "__main__":
+    # python -m utils.common_utils.run_store outputs/<safe_base> [export_dir]
+    from utils.logging_utils.logging_config import setup_logging
+    setup_logging()
+
+    if len(sys.argv) < 2:
+        print("usage: python -m utils.common_utils.run_store <workbook output folder> [export folder]")
+        sys.exit(1)
+    output_root = sys.argv[1]
+    export_root = sys.argv[2] if len(sys.argv) > 2 else output_root
+    store_path = os.path.join(output_root, RUN_STORE_NAME)
+    if not os.path.exists(store_path):
+        print(f"No run store at {store_path}")
+        sys.exit(1)
+
+    files_written = RunStore(store_path).export(export_root)
+    logger.info(f"📤 Exported {files_written} intermediate files from {store_path} to {export_root}")
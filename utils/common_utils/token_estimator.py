@@ -0,0 +1,42 @@
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+# tiktoken (in requirements.txt) makes token counts exact for the configured model; an install without it, or
+# without its encoding files, falls back to ~4 chars per token, which the pre-flight estimate and the
+# BOQ_MAX_COST_USD check then rely on
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CHARS_PER_TOKEN = 4
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    # cached per model, so the fallback warning is logged once
+    if tiktoken is None:
+        logger.warning(f"⚠️ tiktoken is not installed: token counts for {model} are guessed at {CHARS_PER_TOKEN} chars per token")
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"⚠️ No tiktoken encoding for {model} ({e}): token counts are guessed at {CHARS_PER_TOKEN} chars per token")
+        return None
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    if not text:
+        return 0
+    if model is None:
+        from utils.llm_interface.calling import LLM_MODEL
+        model = LLM_MODEL
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
@@ -1,12 +1,31 @@
 import logging
 import os
+import threading
+import contextvars
+from typing import Dict, Optional
 
 from utils.common_utils.json_helpers import save_output_json
 
 logger = logging.getLogger(__name__)
 
-input_cost_gpt_4o = 2.5 # per million input tokens
-output_cost_gpt_4o = 10 # per million output tokens
+# USD per million tokens, keyed by the model name sent to the API (dated snapshots match by prefix)
+MODEL_PRICES_PER_MILLION = {
+    "gpt-4.1": {"input": 2.0, "cached_input": 0.5, "output": 8.0},
+    "gpt-4.1-mini": {"input": 0.4, "cached_input": 0.1, "output": 1.6},
+    "gpt-4.1-nano": {"input": 0.1, "cached_input": 0.025, "output": 0.4},
+    "gpt-4o": {"input": 2.5, "cached_input": 1.25, "output": 10.0},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.6},
+}
+DEFAULT_PRICING_MODEL = "gpt-4.1"
+# Batch API requests are billed at a fraction of the interactive price
+BATCH_PRICE_FACTOR = float(os.getenv("BOQ_BATCH_PRICE_FACTOR", "0.5"))
+
+# Usage the token tuples do not carry, tallied per request (set by BOQ_EXTRACTOR_SERVICE):
+# prompt tokens the provider served from its prompt cache, billed at the cached_input price
+llm_usage_tally_var: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar(
+    "llm_usage_tally", default=None
+)
+_tally_lock = threading.Lock()
 
 def aggregate_token_usage(results):
     total_prompt, total_completion = 0, 0
@@ -19,22 +38,63 @@ def reverse_tokens(tokens_used_tuple):
     return tokens_used_tuple[1], tokens_used_tuple[0]
 
 
-def log_costs(prompt_tokens: int, completion_tokens: int):
-    cost_prompt = (prompt_tokens / 1_000_000) * input_cost_gpt_4o
-    cost_completion = (completion_tokens / 1_000_000) * output_cost_gpt_4o
-    total_cost = cost_prompt + cost_completion
-    logger.info(f"🧠 Prompt tokens: {prompt_tokens}, Completion tokens: {completion_tokens}")
+def start_usage_tally() -> Dict[str, int]:
+    tally = {"cached_prompt_tokens": 0}
+    llm_usage_tally_var.set(tally)
+    return tally
+
+
+def record_cached_prompt_tokens(cached_prompt_tokens: int):
+    tally = llm_usage_tally_var.get()
+    if tally is None or not cached_prompt_tokens:
+        return
+    with _tally_lock:  # sync calls may record from worker threads
+        tally["cached_prompt_tokens"] += cached_prompt_tokens
+
+
+def get_model_prices(model: Optional[str] = None) -> Dict[str, float]:
+    if model is None:
+        from utils.llm_interface.calling import LLM_MODEL
+        model = LLM_MODEL
+    if model in MODEL_PRICES_PER_MILLION:
+        return MODEL_PRICES_PER_MILLION[model]
+    prefixes = [name for name in MODEL_PRICES_PER_MILLION if model.startswith(name)]
+    if prefixes:
+        return MODEL_PRICES_PER_MILLION[max(prefixes, key=len)]
+    logger.warning(f"⚠️ No price entry for model '{model}', using {DEFAULT_PRICING_MODEL} prices")
+    return MODEL_PRICES_PER_MILLION[DEFAULT_PRICING_MODEL]
+
+
+def compute_costs(prompt_tokens: int, completion_tokens: int, model: Optional[str] = None, cached_prompt_tokens: int = 0,
+                  price_factor: float = 1.0):
+    # cached_prompt_tokens are part of prompt_tokens, just billed at the discounted rate
+    prices = get_model_prices(model)
+    cost_prompt = price_factor * (((prompt_tokens - cached_prompt_tokens) / 1_000_000) * prices["input"] +
+                                  (cached_prompt_tokens / 1_000_000) * prices["cached_input"])
+    cost_completion = price_factor * (completion_tokens / 1_000_000) * prices["output"]
+    return cost_prompt + cost_completion, cost_prompt, cost_completion
+
+
+def log_costs(prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0, price_factor: float = 1.0):
+    total_cost, cost_prompt, cost_completion = compute_costs(
+        prompt_tokens, completion_tokens, cached_prompt_tokens=cached_prompt_tokens, price_factor=price_factor
+    )
+    logger.info(f"🧠 Prompt tokens: {prompt_tokens} ({cached_prompt_tokens} cached), Completion tokens: {completion_tokens}")
     logger.info(f"💰 Estimated Cost: ${total_cost:.4f} (Prompt: ${cost_prompt:.4f}, Completion: ${cost_completion:.4f})")
 
     return total_cost  # ✅ added return value
 
-def summarize_cost_and_processing_time(file_path: str, total_prompt_tokens: int, total_completion_tokens: int, total_cost: float, total_processing_time: float):
+def summarize_cost_and_processing_time(file_path: str, total_prompt_tokens: int, total_completion_tokens: int, total_cost: float, total_processing_time: float, total_cached_prompt_tokens: int = 0,
+                                       phase_times_sec: Optional[Dict[str, float]] = None):
     summary_data = {
         "total_prompt_tokens": total_prompt_tokens,
+        "total_cached_prompt_tokens": total_cached_prompt_tokens,
         "total_completion_tokens": total_completion_tokens,
         "aggregate_cost_usd": round(total_cost, 4),
         "total_processing_time": total_processing_time
     }
+    if phase_times_sec:
+        summary_data["phase_times_sec"] = phase_times_sec
     base_name = os.path.splitext(os.path.basename(file_path))[0]
     safe_base = "".join(c if c.isalnum() or c in ("_", "-") else "_" for c in base_name)
     os.makedirs(os.path.join("outputs", safe_base), exist_ok=True)
@@ -43,11 +103,16 @@ def summarize_cost_and_processing_time(file_path: str, total_prompt_tokens: int,
     return summary_data["aggregate_cost_usd"], summary_data["total_processing_time"]
 
 
-def log_cost_and_processing_time(file_path: str, prompt_tokens: int, completion_tokens: int, elapsed_time: float):
+def log_cost_and_processing_time(file_path: str, prompt_tokens: int, completion_tokens: int, elapsed_time: float, cached_prompt_tokens: int = 0,
+                                 price_factor: float = 1.0, phase_times_sec: Optional[Dict[str, float]] = None):
     logger.info("===== Aggregate Token and Cost Summary  for extraction part =====")
-    total_cost = log_costs(prompt_tokens, completion_tokens)
+    total_cost = log_costs(prompt_tokens, completion_tokens, cached_prompt_tokens, price_factor)
     logger.info("================================================================")
-    logger.info(f"✅ All sheets processed in {elapsed_time:.2f} seconds")
+    logger.info(f"✅ Workbook processed in {elapsed_time:.2f} seconds")
+    for phase, seconds in (phase_times_sec or {}).items():
+        logger.info(f"   ⏱️ {phase}: {seconds:.2f}s")
 
-    aggregate_cost_usd, total_processing_time = summarize_cost_and_processing_time(file_path, prompt_tokens, completion_tokens, total_cost, elapsed_time)
+    aggregate_cost_usd, total_processing_time = summarize_cost_and_processing_time(
+        file_path, prompt_tokens, completion_tokens, total_cost, elapsed_time, cached_prompt_tokens, phase_times_sec
+    )
     return aggregate_cost_usd, total_processing_time
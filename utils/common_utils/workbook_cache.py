@@ -0,0 +1,47 @@
+import pandas as pd
+from typing import Dict, List, Optional
+import logging
+
+from utils.boq_context_extraction.excel_helpers import clean_sheet_df
+from utils.observability.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class BOQWorkbook:
+    """
+    Parse-once, in-memory view of an uploaded BOQ workbook.
+    Every sheet is read in a single pass; cleaned sheets and schedule slices are kept here
+    and handed from phase to phase instead of being re-read from disk.
+    """
+
+    def __init__(self, file_path: str, raw_sheets: Dict[str, pd.DataFrame]):
+        self.file_path = file_path
+        self.sheet_names: List[str] = list(raw_sheets.keys())
+        self._raw_sheets = raw_sheets
+        self._cleaned_sheets: Dict[str, pd.DataFrame] = {}
+        self._schedules: Dict[str, pd.DataFrame] = {}
+
+    @classmethod
+    def load(cls, file_path: str) -> "BOQWorkbook":
+        with span("io.excel_read", path=file_path):
+            raw_sheets = pd.read_excel(file_path, sheet_name=None, header=None)
+        logger.info(f"📖 Loaded {len(raw_sheets)} sheets from {file_path}")
+        return cls(file_path, raw_sheets)
+
+    def total_rows(self) -> int:
+        return sum(len(df) for df in self._raw_sheets.values()) + sum(len(df) for df in self._cleaned_sheets.values())
+
+    def get_cleaned_sheet(self, sheet_name: str) -> pd.DataFrame:
+        if sheet_name not in self._cleaned_sheets:
+            with span("sheet.clean", sheet_name=sheet_name):
+                self._cleaned_sheets[sheet_name] = clean_sheet_df(self._raw_sheets[sheet_name])
+            # the raw frame is no longer needed once cleaned
+            self._raw_sheets.pop(sheet_name, None)
+        return self._cleaned_sheets[sheet_name]
+
+    def set_schedule(self, sheet_name: str, df_schedule: pd.DataFrame):
+        self._schedules[sheet_name] = df_schedule
+
+    def get_schedule(self, sheet_name: str) -> Optional[pd.DataFrame]:
+        return self._schedules.get(sheet_name)
@@ -0,0 +1,189 @@
+import os
+import functools
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from utils.boq_context_extraction.header_helpers import load_first_n_rows_as_markdown
+from utils.boq_context_extraction.llm_helpers import build_boq_context_prompts
+from utils.boq_context_extraction.header_detection import detect_header_rows
+from utils.common_utils.token_estimator import count_tokens
+from utils.common_utils.token_utils import compute_costs, BATCH_PRICE_FACTOR
+from utils.common_utils.workbook_cache import BOQWorkbook
+from utils.process_schedule.row_classifier import classify_rows, DROPPED_ROW_TAGS
+from utils.process_schedule.generate_chunk_ranges import get_adaptive_chunk_ranges, get_chunk_ranges, render_schedule_rows
+from utils.prompts.user_prompts import build_chunk_user_prompt
+from utils.prompts.variant_extraction_prompts import system_prompt_product_entries_v2n_2, system_prompt_product_entries_row_refs
+from utils.prompts.variant_merging_prompts import system_prompt_reconcile_boundary_product_blocks
+from utils.llm_interface.scheduler import get_llm_scheduler
+from utils.llm_interface.calling import LLM_MODEL
+
+logger = logging.getLogger(__name__)
+
+# Output-side heuristics: every item row comes back as a JSON variant (its text plus ~60 tokens of keys/structure)
+COMPLETION_TOKENS_PER_ITEM_ROW = int(os.getenv("BOQ_ESTIMATE_COMPLETION_TOKENS_PER_ROW", "60"))
+# Row-reference mode: descriptions come back as row numbers, only the extracted fields still copy part of the row
+ROW_REFS_TEXT_SHARE = float(os.getenv("BOQ_ESTIMATE_ROW_REFS_TEXT_SHARE", "0.5"))
+ROW_NUMBER_TOKENS = 2
+CARRY_OVER_TOKENS = int(os.getenv("BOQ_ESTIMATE_CARRY_OVER_TOKENS", "200"))
+# Latency model of a single call: fixed overhead + prompt processing + generation
+CALL_OVERHEAD_SEC = float(os.getenv("BOQ_ESTIMATE_CALL_OVERHEAD_SEC", "1.5"))
+PROMPT_TOKENS_PER_SEC = float(os.getenv("BOQ_ESTIMATE_PROMPT_TOKENS_PER_SEC", "5000"))
+OUTPUT_TOKENS_PER_SEC = float(os.getenv("BOQ_ESTIMATE_OUTPUT_TOKENS_PER_SEC", "60"))
+
+FIXED_CHUNK_SIZE = 30
+
+
+class BudgetExceededError(Exception):
+    def __init__(self, message: str, estimate: Dict):
+        super().__init__(message)
+        self.estimate = estimate
+
+
+@functools.lru_cache(maxsize=32)
+def _prompt_tokens(prompt: str) -> int:
+    # system prompts are sent with every call; tokenize each of them once
+    return count_tokens(prompt)
+
+
+def estimate_call_latency(prompt_tokens: int, completion_tokens: int) -> float:
+    return CALL_OVERHEAD_SEC + prompt_tokens / PROMPT_TOKENS_PER_SEC + completion_tokens / OUTPUT_TOKENS_PER_SEC
+
+
+def estimate_sheet(workbook: BOQWorkbook, sheet_name: str, custom_instructions: str, run_options: Dict) -> Dict:
+    """
+    Tokens, cost and latency of every call one sheet will make, computed offline from the prompts themselves.
+    The schedule header is only known after the context call, so the whole sheet over all of its columns is
+    priced as the schedule and the first rows as its BOQ context (an upper bound). The context call itself is
+    left out when the header is found by rule, as the run will.
+    """
+    cleaned_df = workbook.get_cleaned_sheet(sheet_name)
+    calls = []  # (stage, prompt_tokens, completion_tokens)
+
+    # Phase 1: context/header call on the first rows
+    first_rows_md = load_first_n_rows_as_markdown(cleaned_df)
+    header_by_rule = (
+        run_options["header_detection"] == "rule" and not custom_instructions.strip()
+        and detect_header_rows(cleaned_df) is not None
+    )
+    if not header_by_rule:
+        system_prompt, user_prompt = build_boq_context_prompts(first_rows_md, custom_instructions)
+        calls.append(("context", _prompt_tokens(system_prompt) + count_tokens(user_prompt), count_tokens(first_rows_md)))
+
+    # Phase 2: one extraction call per chunk
+    chunk_latencies, reconcile_latencies = [], []
+    if len(cleaned_df) and cleaned_df.shape[1]:
+        header_md = " | ".join(["column"] * cleaned_df.shape[1])
+        if run_options["row_prepass"]:
+            cleaned_df = cleaned_df[~classify_rows(cleaned_df, header_md).isin(DROPPED_ROW_TAGS)]
+        if run_options["chunk_token_budget"]:
+            chunk_ranges = get_adaptive_chunk_ranges(
+                cleaned_df, header_md, run_options["chunk_token_budget"], table_format=run_options["table_format"]
+            )
+        else:
+            chunk_ranges = get_chunk_ranges(len(cleaned_df), FIXED_CHUNK_SIZE)
+        header_block, row_lines = render_schedule_rows(cleaned_df, header_md, run_options["table_format"])
+        row_refs = run_options["output_mode"] == "row_refs"
+        system_tokens = _prompt_tokens(system_prompt_product_entries_row_refs if row_refs else system_prompt_product_entries_v2n_2)
+        text_share = ROW_REFS_TEXT_SHARE if row_refs else 1.0
+        sequential = run_options["extraction_mode"] == "sequential"
+
+        for chunk_idx, (start_row, end_row) in enumerate(chunk_ranges):
+            lines = row_lines[start_row:end_row]
+            table = header_block + "\n" + "\n".join(lines)
+            prompt_tokens = system_tokens + count_tokens(build_chunk_user_prompt(table, first_rows_md))
+            if sequential and chunk_idx > 0:
+                prompt_tokens += CARRY_OVER_TOKENS
+            if row_refs:
+                prompt_tokens += ROW_NUMBER_TOKENS * len(lines)
+            item_lines = [line for line in lines if line.replace("|", "").strip()]
+            completion_tokens = sum(
+                int(text_share * count_tokens(line)) + COMPLETION_TOKENS_PER_ITEM_ROW for line in item_lines
+            )
+            calls.append(("chunk", prompt_tokens, completion_tokens))
+            chunk_latencies.append(estimate_call_latency(prompt_tokens, completion_tokens))
+
+        if not sequential:
+            # one reconciliation per chunk boundary, each carrying about two product blocks each way
+            reconcile_prompt = _prompt_tokens(system_prompt_reconcile_boundary_product_blocks) + 2 * CARRY_OVER_TOKENS
+            for _ in range(len(chunk_ranges) - 1):
+                calls.append(("reconcile", reconcile_prompt, 2 * CARRY_OVER_TOKENS))
+                reconcile_latencies.append(estimate_call_latency(reconcile_prompt, 2 * CARRY_OVER_TOKENS))
+
+    prompt_tokens = sum(call[1] for call in calls)
+    completion_tokens = sum(call[2] for call in calls)
+    price_factor = BATCH_PRICE_FACTOR if run_options["llm_execution"] == "batch" else 1.0
+    context_latency = 0.0 if header_by_rule else estimate_call_latency(calls[0][1], calls[0][2])
+    if run_options["extraction_mode"] == "sequential":
+        extraction_latency = sum(chunk_latencies)
+    else:
+        extraction_latency = max(chunk_latencies, default=0.0) + max(reconcile_latencies, default=0.0)
+
+    return {
+        "sheet_name": sheet_name,
+        "rows": len(cleaned_df),
+        "calls": len(calls),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost_usd": round(compute_costs(prompt_tokens, completion_tokens, LLM_MODEL, price_factor=price_factor)[0], 4),
+        "context_latency_sec": round(context_latency, 1),
+        "extraction_latency_sec": round(extraction_latency, 1),
+    }
+
+
+def estimate_workbook(
+    workbook: BOQWorkbook,
+    sheet_names: Optional[List[str]],
+    custom_instructions: str,
+    run_options: Dict
+) -> Dict:
+    if sheet_names is None:
+        sheet_names = workbook.sheet_names
+    sheets = [estimate_sheet(workbook, sheet_name, custom_instructions, run_options) for sheet_name in sheet_names]
+
+    total_calls = sum(sheet["calls"] for sheet in sheets)
+    prompt_tokens = sum(sheet["prompt_tokens"] for sheet in sheets)
+    completion_tokens = sum(sheet["completion_tokens"] for sheet in sheets)
+    # sheets run concurrently: the slowest sheet bounds each phase, unless the provider quota is the bottleneck
+    critical_path = max((sheet["context_latency_sec"] for sheet in sheets), default=0.0) + \
+        max((sheet["extraction_latency_sec"] for sheet in sheets), default=0.0)
+    scheduler = get_llm_scheduler()
+    quota_floor = 60.0 * max(total_calls / scheduler.rpm_limit, (prompt_tokens + completion_tokens) / scheduler.tpm_limit)
+
+    return {
+        "model": LLM_MODEL,
+        "extraction_mode": run_options["extraction_mode"],
+        "llm_execution": run_options["llm_execution"],
+        "sheets": sheets,
+        "calls": total_calls,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost_usd": round(sum(sheet["cost_usd"] for sheet in sheets), 4),
+        "latency_sec": round(max(critical_path, quota_floor), 1),
+    }
+
+
+def apply_cost_budget(estimate: Dict, max_cost_usd: float, budget_action: str) -> Tuple[List[str], List[str]]:
+    """
+    Sheets to run and sheets skipped under the budget. "downscope" keeps the leading sheets (workbook order)
+    that fit; "reject", or a budget not even the first sheet fits into, raises BudgetExceededError.
+    """
+    sheet_names = [sheet["sheet_name"] for sheet in estimate["sheets"]]
+    if not max_cost_usd or estimate["cost_usd"] <= max_cost_usd:
+        return sheet_names, []
+
+    message = f"Estimated cost ${estimate['cost_usd']:.2f} exceeds the budget of ${max_cost_usd:.2f}"
+    if budget_action != "downscope":
+        raise BudgetExceededError(message, estimate)
+
+    selected, running_cost = [], 0.0
+    for sheet in estimate["sheets"]:
+        if running_cost + sheet["cost_usd"] > max_cost_usd:
+            break
+        selected.append(sheet["sheet_name"])
+        running_cost += sheet["cost_usd"]
+    if not selected:
+        raise BudgetExceededError(message + " (not even the first sheet fits)", estimate)
+
+    skipped = sheet_names[len(selected):]
+    logger.warning(f"✂️ {message}; running {len(selected)} sheets (${running_cost:.2f}), skipping {len(skipped)}")
+    return selected, skipped
@@ -0,0 +1,108 @@
+import os
+import shutil
+import asyncio
+from typing import BinaryIO, Dict, Optional
+import logging
+
+from utils.jobs.job_store import JobStore, JOB_SUCCEEDED, JOB_PARTIAL, JOB_FAILED
+from utils.common_utils.progress_events import progress_sink_var
+
+logger = logging.getLogger(__name__)
+
+BOQ_JOB_CONCURRENCY = int(os.getenv("BOQ_JOB_CONCURRENCY", "2"))
+BOQ_JOB_INPUT_DIR = os.getenv("BOQ_JOB_INPUT_DIR", os.path.join("jobs", "inputs"))
+
+
+class BOQJobQueue:
+    """
+    Bounded pool of asyncio workers running BOQ_EXTRACTOR_SERVICE for submitted jobs.
+    Jobs and their uploaded files are persisted first, so unfinished jobs are picked up again after a restart.
+    """
+
+    def __init__(self, store: JobStore, concurrency: int = BOQ_JOB_CONCURRENCY, input_dir: str = BOQ_JOB_INPUT_DIR):
+        self.store = store
+        self.concurrency = concurrency
+        self.input_dir = input_dir
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        for job in self.store.list_unfinished_jobs():
+            if not os.path.exists(job["input_path"] or ""):
+                self.store.mark_finished(job["job_id"], JOB_FAILED, error="Input file lost before the job could run")
+                continue
+            logger.info(f"🔁 Re-queuing unfinished job {job['job_id']} ({job['file_name']})")
+            self.store.mark_queued(job["job_id"])
+            self._queue.put_nowait(job["job_id"])
+
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        logger.info(f"Started {self.concurrency} BOQ job workers")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, file_name: str, file_obj: BinaryIO, custom_instructions: str = "",
+                     options: Optional[Dict] = None) -> str:
+        file_name = os.path.basename(file_name)
+        job_id = self.store.create_job(file_name, input_path="", custom_instructions=custom_instructions, options=options)
+
+        job_input_dir = os.path.join(self.input_dir, job_id)
+        os.makedirs(job_input_dir, exist_ok=True)
+        input_path = os.path.join(job_input_dir, file_name)
+        with open(input_path, "wb") as buffer:
+            shutil.copyfileobj(file_obj, buffer)
+        self.store.set_input_path(job_id, input_path)
+
+        self._queue.put_nowait(job_id)
+        logger.info(f"📥 Queued job {job_id} for {file_name} ({self._queue.qsize()} waiting)")
+        return job_id
+
+    async def _worker(self, worker_idx: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                logger.error(f"❌ Worker {worker_idx} crashed on job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str):
+        from index import BOQ_EXTRACTOR_SERVICE
+
+        job = self.store.get_job(job_id)
+        if job is None:
+            return
+        options = job["options"]
+        run_options = dict(options.get("run_options") or {})
+        if job["started_at"]:
+            # interrupted by a restart: pick up the checkpoints the earlier attempt left behind
+            run_options["resume"] = True
+        self.store.mark_running(job_id)
+
+        token = progress_sink_var.set(lambda event: self.store.record_progress(job_id, event))
+        try:
+            combined_json_path, combined_excel_path, cost_usd, elapsed_time, sheet_errors = await BOQ_EXTRACTOR_SERVICE(
+                job["input_path"], job["custom_instructions"] or "",
+                options.get("bypass_cache", False),
+                run_options=run_options
+            )
+            self.store.mark_finished(job_id, JOB_PARTIAL if sheet_errors else JOB_SUCCEEDED, result={
+                "combined_json_path": combined_json_path,
+                "combined_excel_path": combined_excel_path,
+                "cost_usd": cost_usd,
+                "time_sec": round(elapsed_time, 2),
+                "failed_sheets": sheet_errors
+            })
+            # the upload is only kept around for jobs that may need to be re-run
+            shutil.rmtree(os.path.dirname(job["input_path"]), ignore_errors=True)
+            logger.info(f"✅ Job {job_id} finished")
+        except Exception as e:
+            logger.error(f"❌ Job {job_id} failed: {e}")
+            self.store.mark_finished(job_id, JOB_FAILED, error=str(e))
+        finally:
+            progress_sink_var.reset(token)
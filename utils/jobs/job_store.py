@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+BOQ_JOB_DB_PATH = os.getenv("BOQ_JOB_DB_PATH", os.path.join("jobs", "jobs.sqlite"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_PARTIAL = "partial_success"
+JOB_FAILED = "failed"
+UNFINISHED_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+
+def _empty_progress() -> Dict:
+    return {"phase": None, "phases": {}, "sheets": {}}
+
+
+def apply_progress_event(progress: Dict, event: Dict) -> Dict:
+    """
+    Fold one pipeline progress event (see utils.common_utils.progress_events) into a job's progress summary.
+    """
+    event_type = event.get("type")
+    sheet_name = event.get("sheet_name")
+    sheets = progress.setdefault("sheets", {})
+    sheet = sheets.setdefault(sheet_name, {"status": "pending", "chunks_completed": 0}) if sheet_name else None
+
+    if event_type == "workbook_loaded":
+        for name in event.get("sheet_names", []):
+            sheets.setdefault(name, {"status": "pending", "chunks_completed": 0})
+    elif event_type == "phase_started":
+        progress["phase"] = event["phase"]
+        progress.setdefault("phases", {})[event["phase"]] = "running"
+    elif event_type == "phase_completed":
+        progress.setdefault("phases", {})[event["phase"]] = "completed"
+    elif event_type == "sheet_metadata_ready":
+        sheet["status"] = "metadata_ready"
+        sheet["schedule_rows"] = event.get("schedule_rows")
+    elif event_type == "sheet_started":
+        sheet["status"] = "extracting"
+    elif event_type == "chunk_completed":
+        sheet["chunks_completed"] = sheet.get("chunks_completed", 0) + 1
+        sheet["last_row_range"] = event.get("row_range")
+    elif event_type == "sheet_completed":
+        sheet["status"] = "completed"
+        sheet["final_json_path"] = event.get("final_json_path")
+    elif event_type == "sheet_failed":
+        sheet["status"] = "failed"
+        sheet["error"] = event.get("error")
+    return progress
+
+
+class JobStore:
+    """
+    Persistent job table (SQLite) for background /jobs processing, so queued and running jobs survive restarts.
+    """
+
+    def __init__(self, path: str = BOQ_JOB_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    file_name TEXT,
+                    input_path TEXT,
+                    custom_instructions TEXT,
+                    options_json TEXT,
+                    progress_json TEXT,
+                    result_json TEXT,
+                    error TEXT,
+                    created_at REAL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            self._conn.commit()
+
+    def create_job(self, file_name: str, input_path: str, custom_instructions: str = "",
+                   options: Optional[Dict] = None, job_id: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, status, file_name, input_path, custom_instructions, options_json, "
+                "progress_json, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, file_name, input_path, custom_instructions,
+                 json.dumps(options or {}), json.dumps(_empty_progress()), time.time())
+            )
+            self._conn.commit()
+        return job_id
+
+    def _row_to_job(self, row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job["options"] = json.loads(job.pop("options_json") or "{}")
+        job["progress"] = json.loads(job.pop("progress_json") or "{}")
+        job["result"] = json.loads(job.pop("result_json") or "null")
+        return job
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list_jobs(self, limit: int = 50) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def list_unfinished_jobs(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs WHERE status IN ({', '.join('?' * len(UNFINISHED_STATUSES))}) ORDER BY created_at",
+                UNFINISHED_STATUSES
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def set_input_path(self, job_id: str, input_path: str):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET input_path = ? WHERE job_id = ?", (input_path, job_id))
+            self._conn.commit()
+
+    def mark_running(self, job_id: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE job_id = ?", (JOB_RUNNING, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def mark_queued(self, job_id: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, progress_json = ? WHERE job_id = ?",
+                (JOB_QUEUED, json.dumps(_empty_progress()), job_id)
+            )
+            self._conn.commit()
+
+    def record_progress(self, job_id: str, event: Dict):
+        with self._lock:
+            row = self._conn.execute("SELECT progress_json FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            progress = apply_progress_event(json.loads(row["progress_json"] or "{}"), event)
+            self._conn.execute("UPDATE jobs SET progress_json = ? WHERE job_id = ?", (json.dumps(progress), job_id))
+            self._conn.commit()
+
+    def mark_finished(self, job_id: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result_json = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+            self._conn.commit()
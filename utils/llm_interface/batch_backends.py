@@ -0,0 +1,154 @@
+import os
+import abc
+import json
+import time
+import shutil
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Which batch backend BOQ runs in batch mode submit to: "openai" (Batch API) or "local" (file-based stand-in)
+BOQ_BATCH_BACKEND = os.getenv("BOQ_BATCH_BACKEND", "openai")
+BOQ_BATCH_LOCAL_DIR = os.getenv("BOQ_BATCH_LOCAL_DIR", os.path.join("cache", "local_batches"))
+BOQ_BATCH_COMPLETION_WINDOW = os.getenv("BOQ_BATCH_COMPLETION_WINDOW", "24h")
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+BATCH_COMPLETED = "completed"
+# states after which a batch will not produce (more) results
+BATCH_TERMINAL_STATES = (BATCH_COMPLETED, "failed", "expired", "cancelled")
+
+
+class BatchBackend(abc.ABC):
+    """
+    Where a JSONL batch of chat-completion requests (OpenAI batch input format) is executed.
+    submit() returns a batch id, poll() its state, fetch_results() the output lines
+    ({"custom_id", "response": {"status_code", "body"}, "error"}) once the state is terminal.
+    """
+
+    @abc.abstractmethod
+    def submit(self, input_path: str) -> str:
+        ...
+
+    @abc.abstractmethod
+    def poll(self, batch_id: str) -> str:
+        ...
+
+    @abc.abstractmethod
+    def fetch_results(self, batch_id: str) -> List[Dict]:
+        ...
+
+
+def _parse_jsonl(text: str) -> List[Dict]:
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class OpenAIBatchBackend(BatchBackend):
+    def __init__(self, completion_window: str = BOQ_BATCH_COMPLETION_WINDOW):
+        from utils.llm_interface.calling import client
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, input_path: str) -> str:
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def fetch_results(self, batch_id: str) -> List[Dict]:
+        batch = self.client.batches.retrieve(batch_id)
+        results = []
+        # successful lines land in the output file, failed ones in the error file
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                results.extend(_parse_jsonl(self.client.files.content(file_id).text))
+        return results
+
+
+class LocalFileBatchBackend(BatchBackend):
+    """
+    Offline stand-in for the Batch API. Each batch is a folder under `root` holding input.jsonl and status.json;
+    output.jsonl appears once the batch is answered. With a `responder` (request body -> chat completion body)
+    the batch is answered in a background thread; without one the folder waits for an external process to
+    write output.jsonl, e.g. a replay of recorded responses.
+    """
+
+    def __init__(self, root: str = BOQ_BATCH_LOCAL_DIR, responder: Optional[Callable[[Dict], Dict]] = None):
+        self.root = root
+        self.responder = responder
+
+    def _batch_folder(self, batch_id: str) -> str:
+        return os.path.join(self.root, batch_id)
+
+    def _write_status(self, batch_id: str, status: str):
+        tmp_path = os.path.join(self._batch_folder(batch_id), "status.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"status": status, "updated_at": time.time()}, f)
+        os.replace(tmp_path, os.path.join(self._batch_folder(batch_id), "status.json"))
+
+    def submit(self, input_path: str) -> str:
+        with open(input_path, "rb") as f:
+            batch_id = "local_batch_" + hashlib.sha256(f.read()).hexdigest()[:16] + f"_{time.time_ns()}"
+        os.makedirs(self._batch_folder(batch_id), exist_ok=True)
+        shutil.copyfile(input_path, os.path.join(self._batch_folder(batch_id), "input.jsonl"))
+        self._write_status(batch_id, "in_progress")
+        if self.responder is not None:
+            threading.Thread(target=self._answer, args=(batch_id,), daemon=True).start()
+        return batch_id
+
+    def _answer(self, batch_id: str):
+        with open(os.path.join(self._batch_folder(batch_id), "input.jsonl"), "r", encoding="utf-8") as f:
+            requests = _parse_jsonl(f.read())
+        output_lines = []
+        for request in requests:
+            try:
+                response = {"status_code": 200, "body": self.responder(request["body"])}
+                output_lines.append({"custom_id": request["custom_id"], "response": response, "error": None})
+            except Exception as e:
+                output_lines.append({"custom_id": request["custom_id"], "response": None, "error": {"message": str(e)}})
+        output_path = os.path.join(self._batch_folder(batch_id), "output.jsonl")
+        with open(output_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in output_lines))
+        os.replace(output_path + ".tmp", output_path)
+        self._write_status(batch_id, BATCH_COMPLETED)
+
+    def poll(self, batch_id: str) -> str:
+        if os.path.exists(os.path.join(self._batch_folder(batch_id), "output.jsonl")):
+            return BATCH_COMPLETED
+        with open(os.path.join(self._batch_folder(batch_id), "status.json"), "r", encoding="utf-8") as f:
+            return json.load(f)["status"]
+
+    def fetch_results(self, batch_id: str) -> List[Dict]:
+        output_path = os.path.join(self._batch_folder(batch_id), "output.jsonl")
+        if not os.path.exists(output_path):
+            return []
+        with open(output_path, "r", encoding="utf-8") as f:
+            return _parse_jsonl(f.read())
+
+
+# name -> zero-argument factory; register_batch_backend() plugs in other providers (or a configured local one)
+BATCH_BACKENDS: Dict[str, Callable[[], BatchBackend]] = {
+    "openai": OpenAIBatchBackend,
+    "local": LocalFileBatchBackend,
+}
+
+
+def register_batch_backend(name: str, factory: Callable[[], BatchBackend]):
+    BATCH_BACKENDS[name] = factory
+
+
+def get_batch_backend(name: Optional[str] = None) -> BatchBackend:
+    name = name or BOQ_BATCH_BACKEND
+    if name not in BATCH_BACKENDS:
+        raise ValueError(f"Unknown batch backend '{name}', expected one of {tuple(BATCH_BACKENDS)}")
+    return BATCH_BACKENDS[name]()
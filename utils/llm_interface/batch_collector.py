@@ -0,0 +1,147 @@
+import os
+import json
+import asyncio
+import hashlib
+import contextvars
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from utils.common_utils.json_helpers import save_output_json
+from utils.common_utils.progress_events import emit_progress
+from utils.llm_interface.batch_backends import (
+    BatchBackend, BATCH_ENDPOINT, BATCH_COMPLETED, BATCH_TERMINAL_STATES
+)
+
+logger = logging.getLogger(__name__)
+
+# A phase's calls are launched together (asyncio.gather), so once no new call arrived for this long the batch is complete
+BOQ_BATCH_COLLECT_IDLE_SEC = float(os.getenv("BOQ_BATCH_COLLECT_IDLE_SEC", "2"))
+BOQ_BATCH_POLL_SEC = float(os.getenv("BOQ_BATCH_POLL_SEC", "30"))
+
+SUBMITTED_BATCHES_NAME = "submitted_batches.json"
+
+# Batch collector of the current run (set by BOQ_EXTRACTOR_SERVICE in batch mode); when set, LLM calls are
+# answered through the batch backend instead of being sent one by one
+llm_batch_var: contextvars.ContextVar[Optional["LLMBatchCollector"]] = contextvars.ContextVar(
+    "llm_batch", default=None
+)
+
+
+class BatchRequestError(Exception):
+    pass
+
+
+def make_custom_id(request_body: Dict) -> str:
+    # content-addressed, so identical requests are sent once and an unchanged batch file is byte-identical
+    return hashlib.sha256(json.dumps(request_body, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:32]
+
+
+class LLMBatchCollector:
+    """
+    Turns the concurrent LLM calls of one run into batch jobs. Calls are parked until the run goes idle (every
+    independent call of the current phase has been issued), written to batches/batch_NNN_input.jsonl, submitted
+    through the backend and polled; each call then resumes with its own response body. Results are kept next to
+    the input as batch_NNN_output.jsonl. A restarted run that produces the same batch file re-attaches to the
+    batch submitted before instead of paying for it twice.
+    """
+
+    def __init__(self, backend: BatchBackend, work_folder: str,
+                 idle_sec: float = BOQ_BATCH_COLLECT_IDLE_SEC, poll_sec: float = BOQ_BATCH_POLL_SEC):
+        self.backend = backend
+        self.work_folder = work_folder
+        self.idle_sec = idle_sec
+        self.poll_sec = poll_sec
+        self._pending: Dict[str, Tuple[Dict, List[asyncio.Future]]] = {}
+        self._last_enqueued_at = 0.0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._batch_count = 0
+
+    async def call(self, request_body: Dict) -> Dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(make_custom_id(request_body), (request_body, []))[1].append(future)
+        self._last_enqueued_at = loop.time()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_when_idle())
+        return await future
+
+    async def _flush_when_idle(self):
+        loop = asyncio.get_running_loop()
+        while loop.time() - self._last_enqueued_at < self.idle_sec:
+            await asyncio.sleep(self.idle_sec - (loop.time() - self._last_enqueued_at))
+        # calls arriving from here on (e.g. the next phase) start the next batch
+        pending, self._pending, self._flush_task = self._pending, {}, None
+
+        try:
+            results, failure = await self._run_batch(pending), None
+        except Exception as e:
+            logger.error(f"❌ Batch of {len(pending)} requests failed: {e}")
+            results, failure = {}, str(e)
+
+        for custom_id, (_, futures) in pending.items():
+            line = results.get(custom_id)
+            response = (line or {}).get("response") or {}
+            for future in futures:
+                if future.done():  # the waiting call was cancelled
+                    continue
+                if response.get("status_code") == 200:
+                    future.set_result(response["body"])
+                else:
+                    reason = failure or (line or {}).get("error") or response.get("body") or "no result in batch output"
+                    future.set_exception(BatchRequestError(f"Batch request {custom_id} failed: {reason}"))
+
+    def _load_submitted(self) -> Dict[str, str]:
+        path = os.path.join(self.work_folder, SUBMITTED_BATCHES_NAME)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    async def _reusable_batch_id(self, batch_id: Optional[str]) -> Optional[str]:
+        if batch_id is None:
+            return None
+        try:
+            status = await asyncio.to_thread(self.backend.poll, batch_id)
+        except Exception as e:
+            logger.info(f"🔁 Previously submitted batch {batch_id} is unavailable, submitting again: {e}")
+            return None
+        if status in BATCH_TERMINAL_STATES and status != BATCH_COMPLETED:
+            logger.info(f"🔁 Previously submitted batch {batch_id} ended '{status}', submitting again")
+            return None
+        return batch_id
+
+    async def _run_batch(self, pending: Dict[str, Tuple[Dict, List[asyncio.Future]]]) -> Dict[str, Dict]:
+        self._batch_count += 1
+        os.makedirs(self.work_folder, exist_ok=True)
+        input_path = os.path.join(self.work_folder, f"batch_{self._batch_count:03d}_input.jsonl")
+        batch_file = "".join(
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}, ensure_ascii=False) + "\n"
+            for custom_id, (body, _) in sorted(pending.items())
+        )
+        with open(input_path, "w", encoding="utf-8") as f:
+            f.write(batch_file)
+
+        submitted = self._load_submitted()
+        digest = hashlib.sha256(batch_file.encode("utf-8")).hexdigest()
+        batch_id = await self._reusable_batch_id(submitted.get(digest))
+        if batch_id is not None:
+            logger.info(f"♻️ Re-attaching to batch {batch_id} submitted by an earlier run")
+        else:
+            batch_id = await asyncio.to_thread(self.backend.submit, input_path)
+            submitted[digest] = batch_id
+            save_output_json(os.path.join(self.work_folder, SUBMITTED_BATCHES_NAME), submitted)
+            logger.info(f"📦 Submitted batch {batch_id} with {len(pending)} requests")
+        emit_progress("batch_submitted", batch_id=batch_id, requests=len(pending))
+
+        while True:
+            status = await asyncio.to_thread(self.backend.poll, batch_id)
+            if status in BATCH_TERMINAL_STATES:
+                break
+            await asyncio.sleep(self.poll_sec)
+
+        results = await asyncio.to_thread(self.backend.fetch_results, batch_id)
+        with open(os.path.join(self.work_folder, f"batch_{self._batch_count:03d}_output.jsonl"), "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in results))
+        logger.info(f"📬 Batch {batch_id} {status}: {len(results)}/{len(pending)} results")
+        emit_progress("batch_completed", batch_id=batch_id, status=status, results=len(results))
+        return {line["custom_id"]: line for line in results}
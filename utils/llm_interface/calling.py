@@ -1,11 +1,79 @@
 import json
 import logging
-from openai import OpenAI
+import asyncio
+import httpx
+from openai import OpenAI, AsyncOpenAI, RateLimitError
 import os
+
+from utils.llm_interface.scheduler import get_llm_scheduler, estimate_prompt_tokens
+from utils.llm_interface.response_cache import get_llm_response_cache, make_cache_key, llm_cache_bypass_var
+from utils.common_utils.progress_events import emit_progress
+from utils.common_utils.token_utils import record_cached_prompt_tokens
+from utils.llm_interface.batch_collector import llm_batch_var
+from utils.observability.tracing import span
+from utils.observability.metrics import get_metrics_registry
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 logger = logging.getLogger(__name__)
 
+LLM_MODEL = "gpt-4.1" # "gpt-4o"
+LLM_TEMPERATURE = 0.1
+
+# Connection pool for the async client; one pool is shared by every in-flight call of the event loop
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "50"))
+LLM_TIMEOUT_SEC = float(os.getenv("LLM_TIMEOUT_SEC", "600"))
+# 429s are waited out by the scheduler and do not consume the regular retry budget
+LLM_MAX_RATE_LIMIT_RETRIES = int(os.getenv("LLM_MAX_RATE_LIMIT_RETRIES", "8"))
+
+_async_client = None
+_async_client_loop = None
+# Stand-in for the OpenAI client with the same chat.completions.with_raw_response.create() surface, e.g. the
+# replay backend of the offline benchmarks (benchmarks/replay_backend.py); None sends calls to the API
+_async_client_override = None
+
+
+def set_async_client_override(async_client) -> None:
+    global _async_client_override
+    _async_client_override = async_client
+
+
+def get_async_client() -> AsyncOpenAI:
+    if _async_client_override is not None:
+        return _async_client_override
+    # httpx pools are bound to the loop they were first used on, so rebuild the client for a new loop
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(LLM_TIMEOUT_SEC, connect=10.0)
+        )
+        _async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client, max_retries=0)
+        _async_client_loop = loop
+    return _async_client
+
+def build_chat_request(system_prompt: str, user_prompt: str) -> dict:
+    # request body shared by direct calls and batch files
+    return {
+        "model": LLM_MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": LLM_TEMPERATURE,
+        "max_tokens": 16000,
+        "response_format": {"type": "json_object"}
+    }
+
+def get_cached_prompt_tokens(usage) -> int:
+    # share of the prompt served from the provider's automatic prompt cache (absent on older API versions)
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None) or 0
+
 def parse_llm_response(content: str) -> dict:
     try:
         return json.loads(content)
@@ -20,24 +88,40 @@ import random
 class LLMCallFailure(Exception):
     pass
 
-def llm_call_basic_with_llmcallfailure_exception(system_prompt, user_prompt, max_retries=3):
+
+def _get_cache_and_key(system_prompt, user_prompt, use_cache):
+    # Identical prompts (e.g. unchanged chunks of a re-uploaded BOQ) are answered from the local cache.
+    # Hits report (0, 0) tokens since nothing was spent on them.
+    if not use_cache or llm_cache_bypass_var.get():
+        return None, None
+    cache = get_llm_response_cache()
+    if cache is None:
+        return None, None
+    return cache, make_cache_key(LLM_MODEL, LLM_TEMPERATURE, system_prompt, user_prompt)
+
+
+def _store_in_cache(cache, cache_key, content, tokens_used):
+    if cache is not None and "ERROR" not in content:
+        cache.put(cache_key, LLM_MODEL, content, tokens_used)
+
+def llm_call_basic_with_llmcallfailure_exception(system_prompt, user_prompt, max_retries=3, use_cache=True):
     attempt = 0
     content = None
 
+    cache, cache_key = _get_cache_and_key(system_prompt, user_prompt, use_cache)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"♻️ LLM cache hit (saved {sum(cached[1])} tokens)")
+            return cached[0], (0, 0)
+
     while attempt < max_retries:
         try:
-            response = client.chat.completions.create(
-                model="gpt-4.1", # "gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.1,
-                max_tokens=16000,
-                response_format={"type": "json_object"}
-            )
+            response = client.chat.completions.create(**build_chat_request(system_prompt, user_prompt))
             content = parse_llm_response(response.choices[0].message.content)
             tokens_used = (response.usage.prompt_tokens, response.usage.completion_tokens)
+            record_cached_prompt_tokens(get_cached_prompt_tokens(response.usage))
+            _store_in_cache(cache, cache_key, content, tokens_used)
             return content, tokens_used
 
         except Exception as e:
@@ -50,3 +134,138 @@ def llm_call_basic_with_llmcallfailure_exception(system_prompt, user_prompt, max
     raise LLMCallFailure("LLM call failed after retries")
 
 
+def _retry_after_seconds(error: RateLimitError):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+async def _llm_call_through_batch(batch, system_prompt, user_prompt, cache, cache_key, call_stats):
+    # batch mode: the call is answered by the run's batch job, outside the interactive RPM/TPM budget
+    try:
+        body = await batch.call(build_chat_request(system_prompt, user_prompt))
+    except Exception as e:
+        raise LLMCallFailure(f"LLM batch call failed: {e}") from e
+    content = parse_llm_response(body["choices"][0]["message"]["content"])
+    usage = body.get("usage") or {}
+    tokens_used = (usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+    cached_prompt_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    record_cached_prompt_tokens(cached_prompt_tokens)
+    _store_in_cache(cache, cache_key, content, tokens_used)
+    emit_progress(
+        "llm_usage", prompt_tokens=tokens_used[0], completion_tokens=tokens_used[1],
+        cached_prompt_tokens=cached_prompt_tokens
+    )
+    call_stats.update(
+        outcome="batch", prompt_tokens=tokens_used[0], completion_tokens=tokens_used[1],
+        cached_prompt_tokens=cached_prompt_tokens
+    )
+    return content, tokens_used
+
+
+def _record_llm_call_metrics(call_stats: dict):
+    metrics = get_metrics_registry()
+    metrics.inc("boq_llm_calls_total", outcome=call_stats.get("outcome", "failed"))
+    for kind in ("prompt", "completion", "cached_prompt"):
+        if call_stats.get(f"{kind}_tokens"):
+            metrics.inc("boq_llm_tokens_total", call_stats[f"{kind}_tokens"], kind=kind)
+    for reason in ("rate_limit", "error"):
+        if call_stats.get(f"{reason}_retries"):
+            metrics.inc("boq_llm_retries_total", call_stats[f"{reason}_retries"], reason=reason)
+    if call_stats.get("queue_wait_sec") is not None:
+        metrics.observe("boq_llm_queue_wait_seconds", call_stats["queue_wait_sec"])
+    if call_stats.get("latency_sec") is not None:
+        metrics.observe("boq_llm_latency_seconds", call_stats["latency_sec"])
+
+
+async def llm_call_basic_with_llmcallfailure_exception_async(system_prompt, user_prompt, max_retries=3, use_cache=True):
+    # Every call is an "llm.call" span: queue wait, provider latency, retries and tokens go to the run trace
+    # and to /metrics
+    with span("llm.call", model=LLM_MODEL) as call_stats:
+        try:
+            return await _llm_call_async(system_prompt, user_prompt, max_retries, use_cache, call_stats)
+        finally:
+            _record_llm_call_metrics(call_stats)
+
+
+async def _llm_call_async(system_prompt, user_prompt, max_retries, use_cache, call_stats):
+    # Same contract as the sync call, but awaits the pooled AsyncOpenAI client and backs off without blocking
+    # the event loop. Cancelling the awaiting task cancels the in-flight request as well.
+    # Every call is admitted by the process-wide scheduler, which meters RPM/TPM across all requests.
+    cache, cache_key = _get_cache_and_key(system_prompt, user_prompt, use_cache)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"♻️ LLM cache hit (saved {sum(cached[1])} tokens)")
+            call_stats["outcome"] = "cache_hit"
+            return cached[0], (0, 0)
+
+    batch = llm_batch_var.get()
+    if batch is not None:
+        return await _llm_call_through_batch(batch, system_prompt, user_prompt, cache, cache_key, call_stats)
+
+    scheduler = get_llm_scheduler()
+    estimated_tokens = estimate_prompt_tokens(system_prompt, user_prompt)
+    attempt = 0
+    rate_limit_retries = 0
+    call_stats.update(queue_wait_sec=0.0, rate_limit_retries=0, error_retries=0)
+
+    while attempt < max_retries:
+        wait_start = time.perf_counter()
+        slot = await scheduler.acquire(estimated_tokens)
+        call_stats["queue_wait_sec"] += time.perf_counter() - wait_start
+        actual_tokens = None
+        backoff_sec = None
+        try:
+            request_start = time.perf_counter()
+            raw_response = await get_async_client().chat.completions.with_raw_response.create(
+                **build_chat_request(system_prompt, user_prompt)
+            )
+            call_stats["latency_sec"] = time.perf_counter() - request_start
+            scheduler.on_rate_limit_headers(raw_response.headers)
+            response = raw_response.parse()
+            content = parse_llm_response(response.choices[0].message.content)
+            tokens_used = (response.usage.prompt_tokens, response.usage.completion_tokens)
+            actual_tokens = tokens_used[0] + tokens_used[1]
+            cached_prompt_tokens = get_cached_prompt_tokens(response.usage)
+            record_cached_prompt_tokens(cached_prompt_tokens)
+            _store_in_cache(cache, cache_key, content, tokens_used)
+            emit_progress(
+                "llm_usage", prompt_tokens=tokens_used[0], completion_tokens=tokens_used[1],
+                cached_prompt_tokens=cached_prompt_tokens
+            )
+            call_stats.update(
+                outcome="ok", prompt_tokens=tokens_used[0], completion_tokens=tokens_used[1],
+                cached_prompt_tokens=cached_prompt_tokens
+            )
+            return content, tokens_used
+
+        except RateLimitError as e:
+            scheduler.on_rate_limited(_retry_after_seconds(e))
+            rate_limit_retries += 1
+            call_stats["rate_limit_retries"] = rate_limit_retries
+            if rate_limit_retries > LLM_MAX_RATE_LIMIT_RETRIES:
+                logger.warning(f"Giving up after {rate_limit_retries} rate-limited attempts: {e}")
+                break
+
+        except Exception as e:
+            logger.warning(f"Attempt {attempt + 1} failed: {e}")
+            backoff_sec = 2 ** attempt + random.uniform(0, 1)
+            attempt += 1
+            call_stats["error_retries"] = attempt
+
+        finally:
+            await scheduler.release(slot, actual_tokens, succeeded=actual_tokens is not None)
+
+        # back off only after the slot is released, so other calls can use it meanwhile
+        if backoff_sec is not None and attempt < max_retries:
+            await asyncio.sleep(backoff_sec)
+
+    # Final failure
+    raise LLMCallFailure("LLM call failed after retries")
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextvars
+from typing import Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join("cache", "llm_response_cache.sqlite"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+LLM_CACHE_MAX_AGE_DAYS = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30"))
+
+# Set to True for a request that must always go to the model (e.g. a forced re-extraction)
+llm_cache_bypass_var = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+EVICT_EVERY_N_PUTS = 200
+
+
+def make_cache_key(model: str, temperature: float, system_prompt: str, user_prompt: str) -> str:
+    payload = json.dumps([model, temperature, system_prompt, user_prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Content-addressed store of parsed LLM responses and their token usage, backed by a single SQLite file.
+    Entries are evicted by age and, least-recently-used first, by total size.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_bytes: int = LLM_CACHE_MAX_BYTES,
+                 max_age_days: float = LLM_CACHE_MAX_AGE_DAYS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_sec = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_evict = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    content TEXT NOT NULL,
+                    prompt_tokens INTEGER,
+                    completion_tokens INTEGER,
+                    size_bytes INTEGER,
+                    created_at REAL,
+                    last_access REAL
+                )
+            """)
+            self._conn.commit()
+        self.evict()
+
+    def get(self, key: str) -> Optional[Tuple[dict, Tuple[int, int]]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, prompt_tokens, completion_tokens, created_at FROM llm_responses WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is None or time.time() - row[3] > self.max_age_sec:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0]), (row[1], row[2])
+
+    def put(self, key: str, model: str, content: dict, tokens_used: Tuple[int, int]):
+        serialized = json.dumps(content, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, serialized, tokens_used[0], tokens_used[1], len(serialized.encode("utf-8")), now, now)
+            )
+            self._conn.commit()
+            self._puts_since_evict += 1
+            should_evict = self._puts_since_evict >= EVICT_EVERY_N_PUTS
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            self._puts_since_evict = 0
+            self._conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (time.time() - self.max_age_sec,))
+            total_bytes = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM llm_responses").fetchone()[0]
+            if total_bytes > self.max_bytes:
+                excess = total_bytes - self.max_bytes
+                freed = 0
+                stale_keys = []
+                for key, size_bytes in self._conn.execute("SELECT key, size_bytes FROM llm_responses ORDER BY last_access"):
+                    if freed >= excess:
+                        break
+                    stale_keys.append((key,))
+                    freed += size_bytes
+                self._conn.executemany("DELETE FROM llm_responses WHERE key = ?", stale_keys)
+                logger.info(f"🧹 Evicted {len(stale_keys)} cached LLM responses ({freed} bytes)")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total_bytes}
+
+
+_cache = None
+
+
+def get_llm_response_cache() -> Optional[LLMResponseCache]:
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = LLMResponseCache()
+        logger.info(f"Using LLM response cache at {_cache.path}")
+    return _cache
@@ -0,0 +1,216 @@
+import os
+import time
+import asyncio
+import itertools
+import contextvars
+from collections import deque
+from typing import Optional, Mapping
+import logging
+
+from utils.observability.metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Provider quota budgets (per minute) and a hard cap on simultaneous in-flight calls for the whole process
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "500"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "300000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+# Seconds of waiting that promote a queued call by one priority level, so big jobs are slowed, never starved
+LLM_PRIORITY_AGING_SEC = float(os.getenv("LLM_PRIORITY_AGING_SEC", "30"))
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10
+
+# Priority of LLM calls issued from the current task (set once per request, inherited by child tasks)
+llm_priority_var = contextvars.ContextVar("llm_priority", default=PRIORITY_NORMAL)
+
+WINDOW_SEC = 60.0
+
+
+def estimate_prompt_tokens(*texts: str) -> int:
+    # ~4 characters per token is close enough for metering; actual usage is reconciled on release
+    return sum(len(text or "") for text in texts) // 4 + 1
+
+
+def priority_for_workbook(total_rows: int) -> int:
+    """
+    Smaller uploads get a better (lower) priority so they are not queued behind a huge workbook.
+    """
+    if total_rows <= 200:
+        return PRIORITY_HIGH
+    if total_rows <= 2000:
+        return PRIORITY_NORMAL
+    return PRIORITY_LOW
+
+
+def _parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    # OpenAI reports resets like "1s", "6m0s", "250ms"
+    if not value:
+        return None
+    total, number = 0.0, ""
+    i = 0
+    try:
+        while i < len(value):
+            ch = value[i]
+            if ch.isdigit() or ch == ".":
+                number += ch
+            elif value.startswith("ms", i):
+                total += float(number) / 1000
+                number = ""
+                i += 1
+            elif ch in "hms":
+                total += float(number) * {"h": 3600, "m": 60, "s": 1}[ch]
+                number = ""
+            i += 1
+        if number:
+            total += float(number)
+        return total
+    except ValueError:
+        return None
+
+
+class LLMScheduler:
+    """
+    Process-wide admission control for LLM calls.
+    Meters requests and estimated tokens against RPM/TPM budgets over a sliding minute, caps in-flight calls,
+    serves waiters by (aged) priority, and backs off when the provider reports 429s or exhausted quota headers.
+    """
+
+    def __init__(self, rpm_limit: int = LLM_RPM_LIMIT, tpm_limit: int = LLM_TPM_LIMIT,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.max_concurrency = max_concurrency
+
+        self._window = deque()      # [timestamp, tokens] per admitted call in the last minute
+        self._waiting = []          # [priority, seq, enqueued_at, tokens]
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._rate_factor = 1.0     # shrinks on 429s, recovers on success
+        self._condition = None
+        self._condition_loop = None
+
+        self.stats = {"admitted": 0, "rate_limited": 0, "queue_wait_sec": 0.0}
+
+    def _get_condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._condition_loop is not loop:
+            self._condition = asyncio.Condition()
+            self._condition_loop = loop
+        return self._condition
+
+    def _prune_window(self, now: float):
+        while self._window and now - self._window[0][0] >= WINDOW_SEC:
+            self._window.popleft()
+
+    def _next_waiter(self, now: float):
+        return min(
+            self._waiting,
+            key=lambda w: (w[0] - (now - w[2]) / LLM_PRIORITY_AGING_SEC, w[1])
+        )
+
+    def _seconds_until_capacity(self, tokens: int, now: float) -> Optional[float]:
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._in_flight >= self.max_concurrency:
+            return None  # woken up by release()
+
+        rpm = max(1, int(self.rpm_limit * self._rate_factor))
+        tpm = max(1, int(self.tpm_limit * self._rate_factor))
+        used_tokens = sum(entry[1] for entry in self._window)
+        # an empty window always admits, even if a single prompt exceeds the token budget
+        if len(self._window) < rpm and (not self._window or used_tokens + tokens <= tpm):
+            return 0.0
+        return max(0.01, self._window[0][0] + WINDOW_SEC - now)
+
+    async def acquire(self, estimated_tokens: int, priority: Optional[int] = None) -> list:
+        if priority is None:
+            priority = llm_priority_var.get()
+        condition = self._get_condition()
+        enqueued_at = time.monotonic()
+        waiter = [priority, next(self._seq), enqueued_at, estimated_tokens]
+
+        async with condition:
+            self._waiting.append(waiter)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._prune_window(now)
+                    # non-head waiters re-check periodically because aging can reorder the queue
+                    wait_sec = 1.0
+                    if self._next_waiter(now) is waiter:
+                        wait_sec = self._seconds_until_capacity(estimated_tokens, now)
+                        if wait_sec == 0.0:
+                            break
+                    try:
+                        await asyncio.wait_for(condition.wait(), timeout=wait_sec)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._waiting.remove(waiter)
+                condition.notify_all()
+
+            entry = [time.monotonic(), estimated_tokens]
+            self._window.append(entry)
+            self._in_flight += 1
+            self.stats["admitted"] += 1
+            self.stats["queue_wait_sec"] += entry[0] - enqueued_at
+            return entry
+
+    async def release(self, entry: list, actual_tokens: Optional[int] = None, succeeded: bool = True):
+        if actual_tokens is not None:
+            entry[1] = actual_tokens
+        if succeeded:
+            self._rate_factor = min(1.0, self._rate_factor + 0.02)
+        condition = self._get_condition()
+        async with condition:
+            self._in_flight -= 1
+            condition.notify_all()
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        self.stats["rate_limited"] += 1
+        self._rate_factor = max(0.2, self._rate_factor * 0.7)
+        pause = retry_after if retry_after else 5.0
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        logger.warning(f"🚦 Rate limited by provider; pausing LLM calls for {pause:.1f}s (rate factor {self._rate_factor:.2f})")
+
+    def on_rate_limit_headers(self, headers: Mapping[str, str]):
+        try:
+            limit_requests = headers.get("x-ratelimit-limit-requests")
+            limit_tokens = headers.get("x-ratelimit-limit-tokens")
+            if limit_requests:
+                self.rpm_limit = min(self.rpm_limit, int(limit_requests))
+            if limit_tokens:
+                self.tpm_limit = min(self.tpm_limit, int(limit_tokens))
+
+            remaining_requests = headers.get("x-ratelimit-remaining-requests")
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            pause = None
+            if remaining_requests is not None and int(remaining_requests) <= 0:
+                pause = _parse_reset_duration(headers.get("x-ratelimit-reset-requests"))
+            if remaining_tokens is not None and int(remaining_tokens) < self.tpm_limit * 0.02:
+                reset_tokens = _parse_reset_duration(headers.get("x-ratelimit-reset-tokens"))
+                pause = max(pause or 0.0, reset_tokens or 0.0)
+            if pause:
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        except (TypeError, ValueError) as e:
+            logger.debug(f"Ignoring unparsable rate-limit headers: {e}")
+
+
+_scheduler = None
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+        metrics = get_metrics_registry()
+        metrics.register_gauge_callback("boq_llm_in_flight", lambda: _scheduler._in_flight)
+        metrics.register_gauge_callback("boq_llm_waiting", lambda: len(_scheduler._waiting))
+        logger.info(
+            f"Using LLM scheduler: {_scheduler.rpm_limit} RPM, {_scheduler.tpm_limit} TPM, "
+            f"max {_scheduler.max_concurrency} in flight"
+        )
+    return _scheduler
@@ -0,0 +1,110 @@
+import bisect
+import threading
+from typing import Callable, Dict, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans range from millisecond JSON writes to multi-minute sheets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# name -> (type, help); every metric the service exports is declared here
+METRICS = {
+    "boq_span_duration_seconds": ("histogram", "Duration of instrumented spans (run, phases, sheets, chunks, LLM calls, I/O)"),
+    "boq_llm_calls_total": ("counter", "LLM calls by outcome (ok, failed, cache_hit, batch)"),
+    "boq_llm_tokens_total": ("counter", "LLM tokens by kind (prompt, completion, cached_prompt)"),
+    "boq_llm_retries_total": ("counter", "LLM call retries by reason (rate_limit, error)"),
+    "boq_llm_queue_wait_seconds": ("histogram", "Time LLM calls waited for admission by the scheduler"),
+    "boq_llm_latency_seconds": ("histogram", "Provider latency of successful LLM requests"),
+    "boq_header_detection_total": ("counter", "Sheet headers found by path (rule, llm)"),
+    "boq_runs_total": ("counter", "BOQ runs by final status"),
+    "boq_runs_in_progress": ("gauge", "BOQ runs currently executing"),
+}
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(label_key: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = label_key + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process Prometheus registry (counters, gauges, histograms with labels), rendered in the
+    text exposition format by /metrics. Thread-safe, since pipeline code also runs in worker threads.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._values: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, Dict]] = {}
+        self._gauge_callbacks: Dict[str, Callable[[], float]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._values.setdefault(name, {})[_label_key(labels)] = value
+
+    def register_gauge_callback(self, name: str, callback: Callable[[], float]):
+        # gauges read at scrape time (e.g. the scheduler's queue length)
+        self._gauge_callbacks[name] = callback
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.setdefault(_label_key(labels), {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, (metric_type, help_text) in METRICS.items():
+                if name not in self._values and name not in self._histograms:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for label_key, value in sorted(self._values.get(name, {}).items()):
+                    lines.append(f"{name}{_format_labels(label_key)} {value:g}")
+                for label_key, histogram in sorted(self._histograms.get(name, {}).items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, histogram["buckets"]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(label_key, (('le', f'{bound:g}'),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(label_key, (('le', '+Inf'),))} {histogram['count']}")
+                    lines.append(f"{name}_sum{_format_labels(label_key)} {histogram['sum']:.6f}")
+                    lines.append(f"{name}_count{_format_labels(label_key)} {histogram['count']}")
+        for name, callback in self._gauge_callbacks.items():
+            try:
+                value = callback()
+            except Exception as e:
+                logger.debug(f"Gauge callback '{name}' failed: {e}")
+                continue
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+_registry = None
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    global _registry
+    if _registry is None:
+        _registry = MetricsRegistry()
+    return _registry
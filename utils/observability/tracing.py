@@ -0,0 +1,88 @@
+import json
+import time
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import logging
+
+from utils.observability.metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Trace of the current run (set by BOQ_EXTRACTOR_SERVICE); spans opened outside a run only feed /metrics
+run_trace_var: contextvars.ContextVar[Optional["RunTrace"]] = contextvars.ContextVar("run_trace", default=None)
+# Innermost open span of the current task/thread, used as the parent of new spans
+_current_span_var: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("current_span", default=None)
+
+_span_ids = itertools.count(1)
+
+
+class RunTrace:
+    """
+    Finished spans of one run, saved as one JSON object per line (trace.jsonl) in start order;
+    span_id/parent_id rebuild the tree.
+    """
+
+    def __init__(self):
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict):
+        with self._lock:
+            self.spans.append(record)
+
+    def durations_by_name(self, prefix: str = "") -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for record in self.spans:
+                if record["name"].startswith(prefix):
+                    totals[record["name"]] = totals.get(record["name"], 0.0) + record["duration_sec"]
+        return {name: round(total, 3) for name, total in totals.items()}
+
+    def save(self, path: str):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda record: record["start_time"])
+        with open(path, "w", encoding="utf-8") as f:
+            for record in spans:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times the enclosed block as a span named `name` (e.g. "phase.metadata", "llm.call"). Yields the span's
+    attribute dict so the block can attach measurements (tokens, retries, ...). The duration always lands in
+    the boq_span_duration_seconds histogram and, inside a run, in the run's trace.
+    """
+    span_id = next(_span_ids)
+    parent_id = _current_span_var.get()
+    token = _current_span_var.set(span_id)
+    start_time = time.time()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield attributes
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        status = "cancelled"
+        raise
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current_span_var.reset(token)
+        get_metrics_registry().observe("boq_span_duration_seconds", duration, span=name, status=status)
+        trace = run_trace_var.get()
+        if trace is not None:
+            trace.add({
+                "span_id": span_id,
+                "parent_id": parent_id,
+                "name": name,
+                "start_time": start_time,
+                "duration_sec": round(duration, 6),
+                "status": status,
+                "attributes": attributes,
+            })
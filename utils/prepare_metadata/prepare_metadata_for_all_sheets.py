@@ -1,33 +1,39 @@
 import pandas as pd
 import asyncio
-from typing import List, Dict
+from typing import List, Dict, Optional
 import os
 from utils.prepare_metadata.prepare_metadata_for_one_sheet import prepare_metadata_for_one_sheet
-from utils.common_utils.dynamic_semaphore import get_dynamic_semaphore
+from utils.common_utils.workbook_cache import BOQWorkbook
+from utils.observability.tracing import span
 # from utils.logging_utils.logging_config import sheet_name_var
 import logging
 logger = logging.getLogger(__name__)
 
 
-async def prepare_all_metadata(file_path: str, custom_instructions: str = "") -> List[Dict]:
+async def prepare_all_metadata(
+    file_path: str,
+    custom_instructions: str = "",
+    workbook: Optional[BOQWorkbook] = None,
+    sheet_names: Optional[List[str]] = None,
+    run_options: Optional[Dict] = None
+) -> List[Dict]:
     # logger.info(f"========= Phase 1: Metadata creation for all sheets=========")
     # start_time = asyncio.get_event_loop().time()
-    xls = pd.ExcelFile(file_path)
-    dynamic_concurrency = get_dynamic_semaphore()
-    sem = asyncio.Semaphore(dynamic_concurrency)
-
-    async def prepare_with_limit(sheet_name):
+    if workbook is None:
+        workbook = await asyncio.to_thread(BOQWorkbook.load, file_path)
+    # LLM concurrency is bounded process-wide by the LLM scheduler, so all sheets are started at once
+    async def prepare_one(sheet_name):
         # sheet_name_var.set(sheet_name) #TODO:
-        async with sem:
-            try:
-                return await asyncio.to_thread(
-                    prepare_metadata_for_one_sheet, file_path, sheet_name, custom_instructions
-                )
-            except Exception as e:
-                logger.warning(f"⚠️ Error preparing metadata for sheet '{sheet_name}': {e}")
-                return (sheet_name, e)
-
-    tasks = [prepare_with_limit(sheet_name) for sheet_name in xls.sheet_names]
+        try:
+            with span("sheet.metadata", sheet_name=sheet_name):
+                return await prepare_metadata_for_one_sheet(file_path, sheet_name, custom_instructions, workbook, run_options)
+        except Exception as e:
+            logger.warning(f"⚠️ Error preparing metadata for sheet '{sheet_name}': {e}")
+            return (sheet_name, e)
+
+    if sheet_names is None:
+        sheet_names = workbook.sheet_names
+    tasks = [prepare_one(sheet_name) for sheet_name in sheet_names]
     results = await asyncio.gather(*tasks)
 
     metadata_list = []
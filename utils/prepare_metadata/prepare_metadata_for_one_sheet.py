@@ -2,44 +2,117 @@ import os
 import time
 import pandas as pd
 import json
-from typing import Dict
+from typing import Dict, Optional, Tuple
 import asyncio
 
-from utils.boq_context_extraction.excel_helpers import load_and_clean_excel, save_output_excel
+from utils.boq_context_extraction.excel_helpers import load_and_clean_excel, save_output_excel, WRITE_DEBUG_ARTIFACTS
 from utils.boq_context_extraction.folder_helpers import create_output_folder
 from utils.boq_context_extraction.llm_helpers import extract_boq_context
-from utils.boq_context_extraction.header_helpers import load_first_n_rows_as_markdown, find_header_start_idx, find_max_column_idx
+from utils.boq_context_extraction.header_detection import detect_header_rows
+from utils.boq_context_extraction.header_helpers import (
+    load_first_n_rows_as_markdown, find_header_start_idx, find_max_column_idx, CONTEXT_PREVIEW_ROWS
+)
+from utils.common_utils.workbook_cache import BOQWorkbook
+from utils.common_utils.progress_events import emit_progress
+from utils.common_utils.run_manifest import run_manifest_var
+from utils.common_utils.run_store import current_run_store
+from utils.common_utils.run_options import resolve_run_options
+from utils.observability.metrics import get_metrics_registry
 import logging
 logger = logging.getLogger(__name__)
 
-def prepare_metadata_for_one_sheet(file_path: str, sheet_name: str, custom_instructions: str = "") -> Dict:
-    start_time = time.time()
 
-    # Step 1: Create output folder for this sheet
-    output_folder = create_output_folder(file_path, sheet_name)
+def slice_schedule(cleaned_df: pd.DataFrame, schedule_start_idx: int, max_col_idx: int) -> pd.DataFrame:
+    # Defensive slicing to keep only real columns
+    df_schedule = cleaned_df.iloc[schedule_start_idx:, :max_col_idx].reset_index(drop=True)
+
+    # Drop trailing blank rows (a round-trip through xlsx used to do this implicitly)
+    non_blank_rows = (df_schedule != "").any(axis=1)
+    last_row = non_blank_rows[non_blank_rows].index.max() if non_blank_rows.any() else -1
+    return df_schedule.iloc[:last_row + 1]
 
-    # Step 2: Load and clean sheet
+
+def load_prepared_schedule(file_path: str, sheet_name: str) -> Tuple[Dict, pd.DataFrame]:
+    """
+    Metadata of a sheet prepared by an earlier run (from the workbook's run store) and the schedule slice it
+    describes, as the pipeline hands it over. For the modules' __main__ entry points; metadata.json and
+    schedule_only.xlsx are only written as debug artifacts.
+    """
+    output_folder = create_output_folder(file_path, sheet_name)
+    stored = current_run_store(output_folder).get_metadata(sheet_name)
+    if stored is None:
+        raise ValueError(f"No metadata of sheet '{sheet_name}' in the run store of {file_path}; prepare it first")
+    metadata = stored[0]
     cleaned_df = load_and_clean_excel(file_path, sheet_name)
+    return metadata, slice_schedule(cleaned_df, metadata["schedule_start_idx"], metadata["max_col_idx"])
 
-    # Step 3: Extract context and header
-    first_rows_md = load_first_n_rows_as_markdown(cleaned_df, num_rows=20)
-    content, tokens_used_ctx = extract_boq_context(first_rows_md, custom_instructions)
 
-    header_md = content.get("header_rows", "")
-    context_md = content.get("context_rows", "")
+async def prepare_metadata_for_one_sheet(
+    file_path: str,
+    sheet_name: str,
+    custom_instructions: str = "",
+    workbook: Optional[BOQWorkbook] = None,
+    run_options: Optional[Dict] = None
+) -> Dict:
+    start_time = time.time()
+    run_options = resolve_run_options(run_options)
+
+    # Step 1: Create output folder for this sheet
+    output_folder = create_output_folder(file_path, sheet_name)
 
-    # Step 4: Find schedule start and isolate the product schedule
-    schedule_start_idx = find_header_start_idx(cleaned_df, header_md)
+    # Step 2: Load and clean sheet (from the shared in-memory workbook when available)
+    if workbook is not None:
+        cleaned_df = await asyncio.to_thread(workbook.get_cleaned_sheet, sheet_name)
+    else:
+        cleaned_df = await asyncio.to_thread(load_and_clean_excel, file_path, sheet_name)
+
+    # Resumed run: the metadata of a previous run is still intact, so only the schedule slice is rebuilt
+    manifest = run_manifest_var.get()
+    previous_metadata = manifest.verified_metadata(sheet_name) if manifest else None
+    if previous_metadata is not None:
+        df_schedule = slice_schedule(cleaned_df, previous_metadata["schedule_start_idx"], previous_metadata["max_col_idx"])
+        if workbook is not None:
+            workbook.set_schedule(sheet_name, df_schedule)
+        logger.info(f"♻️ Reusing metadata of sheet '{sheet_name}' from the previous run")
+        emit_progress("sheet_metadata_ready", sheet_name=sheet_name, schedule_rows=len(df_schedule), resumed=True)
+        # the context call was already paid for by the previous run
+        return {**previous_metadata, "tokens_used_ctx": (0, 0)}
+
+    # Step 3: Extract context and header; by rule when the first rows hold a confident header (custom
+    # instructions are addressed to the LLM call, so they always go through it)
+    detected = None
+    if run_options["header_detection"] == "rule" and not custom_instructions.strip():
+        detected = detect_header_rows(cleaned_df, num_rows=CONTEXT_PREVIEW_ROWS)
+
+    if detected is not None:
+        header_md, context_md = detected["header_rows"], detected["context_rows"]
+        schedule_start_idx = detected["schedule_start_idx"]
+        tokens_used_ctx = (0, 0)
+        logger.info(f"📏 Header of sheet '{sheet_name}' found by rule, ending at row {schedule_start_idx}")
+    else:
+        first_rows_md = load_first_n_rows_as_markdown(cleaned_df, num_rows=CONTEXT_PREVIEW_ROWS)
+        content, tokens_used_ctx = await extract_boq_context(first_rows_md, custom_instructions)
+
+        header_md = content.get("header_rows", "")
+        context_md = content.get("context_rows", "")
+        schedule_start_idx = await asyncio.to_thread(find_header_start_idx, cleaned_df, header_md)
+    get_metrics_registry().inc("boq_header_detection_total", path="rule" if detected is not None else "llm")
+
+    # Step 4: Isolate the product schedule
     max_col_idx = find_max_column_idx(header_md)
     
-    # Defensive slicing to keep only real columns
-    df_schedule = cleaned_df.iloc[schedule_start_idx:, :max_col_idx].reset_index(drop=True)
+    df_schedule = slice_schedule(cleaned_df, schedule_start_idx, max_col_idx)
+
+    if workbook is not None:
+        workbook.set_schedule(sheet_name, df_schedule)
 
-    schedule_path = os.path.join(output_folder, "schedule_only.xlsx")
-    save_output_excel(schedule_path, df_schedule)
-    logger.info(f"✅ Schedule saved to {schedule_path}")
+    schedule_path = None
+    if WRITE_DEBUG_ARTIFACTS or workbook is None:
+        schedule_path = os.path.join(output_folder, "schedule_only.xlsx")
+        await asyncio.to_thread(save_output_excel, schedule_path, df_schedule)
+        logger.info(f"✅ Schedule saved to {schedule_path}")
 
-    # Step 5: Save extracted metadata into a small JSON
+    # Step 5: Save extracted metadata in the run store (metadata.json is a debug copy)
     metadata = {
         "file_path": file_path,
         "sheet_name": sheet_name,
@@ -52,11 +125,15 @@ def prepare_metadata_for_one_sheet(file_path: str, sheet_name: str, custom_instr
         "tokens_used_ctx": tokens_used_ctx,
     }
 
-    metadata_path = os.path.join(output_folder, "metadata.json")
-    with open(metadata_path, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2)
+    metadata_digest = current_run_store(output_folder).put_metadata(sheet_name, metadata)
+    if WRITE_DEBUG_ARTIFACTS or workbook is None:
+        with open(os.path.join(output_folder, "metadata.json"), "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2)
+    if manifest:
+        manifest.record_metadata(sheet_name, metadata_digest)
 
     logger.info(f"✅ Metadata prepared for sheet '{sheet_name}' in {time.time() - start_time:.2f}s")
+    emit_progress("sheet_metadata_ready", sheet_name=sheet_name, schedule_rows=len(df_schedule))
 
     return metadata
 
@@ -67,7 +144,7 @@ if __name__ == "__main__":
     sheet_name = "FIRE PUMP ROOM"
     custom_instructions = ""
 
-    metadata = prepare_metadata_for_one_sheet(file_path, sheet_name, custom_instructions)
+    metadata = asyncio.run(prepare_metadata_for_one_sheet(file_path, sheet_name, custom_instructions))
 
     logger.info("\n✅ Returned Metadata:")
     for k, v in metadata.items():
@@ -0,0 +1,180 @@
+import re
+import functools
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import pandas as pd
+
+from utils.common_utils.markdown_helpers import header_labels
+from utils.process_schedule.row_references import (
+    ROW_REFERENCES_KEY, cell_text, description_column, is_number, quantity_text
+)
+
+logger = logging.getLogger(__name__)
+
+# Roles a header cell can name, checked in this order: "Unit Rate" is a rate and "Total Qty" a quantity,
+# not a unit or an amount
+COLUMN_ROLE_PATTERNS: Tuple[Tuple[str, re.Pattern], ...] = (
+    ("rate", re.compile(r"\b(rate|unit price|price per unit)\b")),
+    ("amount", re.compile(r"\b(amount|amt|total price|total cost|value)\b")),
+    ("quantity", re.compile(r"\b(qty|qnty|quantity|quantities)\b")),
+    ("unit", re.compile(r"^(unit|units|uom|u/m|unit of measure|unit of measurement)$")),
+    ("item_no", re.compile(r"^(s ?l|s ?r|s|item|serial|ser)(ial)? ?(no|nos|number|#)$|^(no|#|s/n|sn)$")),
+    ("description", re.compile(r"\b(description|descriptions|particulars|item of work|items? description)\b")),
+)
+# Entry fields filled from the mapped columns, and the role each is read from
+MAPPED_FIELDS = {"item_no": "item_no", "quantity": "quantity", "unit": "unit"}
+# Roles whose columns hold numbers; the compact table format trims the decimal tails of these columns only
+NUMERIC_ROLES = ("quantity", "rate", "amount")
+# Share of a column's non-empty cells that must look like its role for the mapping to be trusted
+MIN_ROLE_MATCH_SHARE = 0.8
+MAX_UNIT_CHARS = 15
+MAX_ITEM_NO_CHARS = 10
+
+
+def _normalize_header_cell(text: str) -> str:
+    text = re.sub(r"[^0-9a-z/#]+", " ", text.lower().replace(".", " "))
+    return " ".join(text.split())
+
+
+def header_columns(header_md: str) -> List[str]:
+    """
+    One label per column of the header block: multi-line headers are read column by column
+    (e.g. "Supply" over "Rate" gives "supply rate").
+    """
+    return [_normalize_header_cell(label) for label in header_labels(header_md)]
+
+
+def header_cell_role(label: str) -> Optional[str]:
+    """Role (see COLUMN_ROLE_PATTERNS) a single header cell names, or None."""
+    label = _normalize_header_cell(label)
+    if not label:
+        return None
+    return next((role for role, pattern in COLUMN_ROLE_PATTERNS if pattern.search(label)), None)
+
+
+@functools.lru_cache(maxsize=256)
+def _header_roles(header_signature: Tuple[str, ...]) -> Dict[str, Tuple[int, ...]]:
+    candidates: Dict[str, List[int]] = {}
+    for col, label in enumerate(header_signature):
+        role = header_cell_role(label)
+        if role:
+            candidates.setdefault(role, []).append(col)
+    return {role: tuple(cols) for role, cols in candidates.items()}
+
+
+def _column_fits_role(values: List[str], role: str) -> bool:
+    # the header is as the context LLM rendered it, so a mapping is only kept when the column's cells agree
+    values = [value for value in values if value]
+    if not values:
+        return False
+    if role in NUMERIC_ROLES:
+        fits = sum(is_number(value) or value.upper() == "R/O" for value in values)
+    elif role == "unit":
+        fits = sum(not is_number(value) and len(value) <= MAX_UNIT_CHARS for value in values)
+    elif role == "item_no":
+        fits = sum(len(value) <= MAX_ITEM_NO_CHARS for value in values)
+    else:
+        fits = sum(not is_number(value) for value in values)
+    return fits >= MIN_ROLE_MATCH_SHARE * len(values)
+
+
+def map_column_roles(header_md: str, df_schedule: pd.DataFrame) -> Dict[str, int]:
+    """
+    Column position of each role (item_no, description, unit, quantity, rate, amount) of the schedule, from
+    its header labels (parsed once per header signature) checked against the schedule's cells. A role whose
+    label is missing, whose column does not hold that kind of value, or that several columns fit (e.g. design
+    and purchase quantities) is left out.
+    """
+    roles = {}
+    for role, cols in _header_roles(tuple(header_columns(header_md))).items():
+        fitting = [
+            col for col in cols
+            if col < df_schedule.shape[1] and _column_fits_role([cell_text(value) for value in df_schedule.iloc[:, col]], role)
+        ]
+        if len(fitting) == 1:
+            roles[role] = fitting[0]
+    if roles:
+        logger.info(f"🧭 Column roles: {', '.join(f'{role}={col}' for role, col in roles.items())}")
+    return roles
+
+
+def numeric_columns(header_md: str, df_schedule: pd.DataFrame) -> List[int]:
+    """Positions of the schedule's mapped quantity, rate and amount columns (NUMERIC_ROLES)."""
+    column_roles = map_column_roles(header_md, df_schedule)
+    return sorted(column_roles[role] for role in NUMERIC_ROLES if role in column_roles)
+
+
+def read_mapped_columns(df_schedule: pd.DataFrame, column_roles: Dict[str, int]) -> Dict[str, List[str]]:
+    """Text of each mapped field per schedule row (by position), read column-wise in one pass."""
+    mapped = {}
+    for field, role in MAPPED_FIELDS.items():
+        if role not in column_roles:
+            continue
+        column = df_schedule.iloc[:, column_roles[role]]
+        # 1.0 -> "1", as an integral quantity reads in the sheet; anything else (1234.5678, "R/O") is kept as it is
+        to_text = quantity_text if role == "quantity" else cell_text
+        mapped[field] = [to_text(value) for value in column]
+    return mapped
+
+
+def row_refs_columns(df_schedule: pd.DataFrame, header_md: str) -> Tuple[int, Dict[str, List[str]]]:
+    """Per-sheet inputs of the row-reference mode: the description column and the mapped field values."""
+    column_roles = map_column_roles(header_md, df_schedule)
+    description_col = column_roles["description"] if "description" in column_roles else description_column(df_schedule)
+    return description_col, read_mapped_columns(df_schedule, column_roles)
+
+
+def _item_row(description_rows: List, mapped: Dict[str, List[str]]) -> Optional[int]:
+    # the variant's own row is the last referenced one that carries a quantity (a shared lead-in row has none)
+    rows = []
+    for reference in description_rows:
+        if isinstance(reference, (list, tuple)):
+            reference = reference[0] if reference else None
+        try:
+            rows.append(int(reference))
+        except (TypeError, ValueError):
+            continue
+    num_rows = len(next(iter(mapped.values())))
+    rows = [row for row in rows if 0 <= row < num_rows]
+    if not rows:
+        return None
+    quantities = mapped.get("quantity")
+    if quantities:
+        rows_with_quantity = [row for row in rows if quantities[row]]
+        if rows_with_quantity:
+            return rows_with_quantity[-1]
+    return rows[-1]
+
+
+def fill_mapped_fields(product_blocks: List[Dict], mapped: Dict[str, List[str]]) -> List[Dict]:
+    """
+    Sets the mapped fields (item_no, quantity, unit) of every variant of resolved row-reference blocks from the
+    row its description_rows point at, in place. Variants without row references keep what the model returned.
+    """
+    if not mapped:
+        return product_blocks
+    for block in product_blocks:
+        description_rows = (block.get(ROW_REFERENCES_KEY) or {}).get("description_rows", [])
+        for variant, references in zip(block.get("list_of_product_variants", []), description_rows):
+            row = _item_row(references, mapped)
+            if row is None:
+                continue
+            for field, values in mapped.items():
+                variant[field] = values[row]
+    return product_blocks
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+    from utils.logging_utils.logging_config import setup_logging
+
+    setup_logging()
+
+    from utils.prepare_metadata.prepare_metadata_for_one_sheet import load_prepared_schedule
+
+    # python -m utils.process_schedule.column_roles <workbook> <sheet name>  (after a run of that workbook)
+    metadata, df = load_prepared_schedule(sys.argv[1], sys.argv[2])
+    print(header_columns(metadata["header_md"]))
+    print(json.dumps(map_column_roles(metadata["header_md"], df), indent=2))
@@ -1,30 +1,114 @@
 import os
+import re
 import json
-from typing import List, Tuple
+from typing import List, Tuple, Optional
 import logging
+import pandas as pd
 
 from utils.boq_context_extraction.folder_helpers import create_output_folder
+from utils.common_utils.markdown_helpers import compact_rows_as_cell_strings, format_compact_table, header_labels, rows_as_cell_strings
+from utils.common_utils.token_estimator import count_tokens
+from utils.process_schedule.column_roles import numeric_columns
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on rows per adaptive chunk, which keeps the size of the model's JSON answer in check
+BOQ_CHUNK_MAX_ROWS = int(os.getenv("BOQ_CHUNK_MAX_ROWS", "60"))
+NUMBER_PATTERN = re.compile(r"[-+]?[\d,]*\.?\d+")
+
 def get_chunk_ranges(total_rows: int, chunk_size: int) -> List[Tuple[int, int]]:
     return [(i, min(i + chunk_size, total_rows)) for i in range(0, total_rows, chunk_size)]
 
+
+def render_schedule_rows(df_schedule: pd.DataFrame, header_md: str, table_format: str = "markdown") -> Tuple[str, List[str]]:
+    """
+    Header block and one markdown line per schedule row, exactly as format_batch_as_markdown renders them.
+    In the compact format, the legend and lines of the whole sheet as one table (a chunk drops at most more
+    empty columns).
+    """
+    if table_format == "compact":
+        header_block, *row_lines = format_compact_table(
+            compact_rows_as_cell_strings(df_schedule, numeric_columns(header_md, df_schedule)), header_labels(header_md)
+        ).split("\n")
+        return header_block, row_lines
+    header_lines = [line.strip() for line in header_md.strip().split("\n") if line.strip()]
+    num_cols = max(line.count("|") for line in header_lines)
+    separator = " | ".join(["---"] * (num_cols + 1))
+    padding = [""] * max(0, num_cols + 1 - df_schedule.shape[1])
+    row_lines = [" | ".join(cells[:num_cols + 1] + padding) for cells in rows_as_cell_strings(df_schedule)]
+    return "\n".join(header_lines) + "\n" + separator, row_lines
+
+
+def _is_blank_row(cells: List[str]) -> bool:
+    return not any(cell.strip() for cell in cells)
+
+
+def _is_section_heading(cells: List[str]) -> bool:
+    # e.g. "B | PUMP HOUSE PIPING |  |  |" - a short label with no quantities/rates next to it
+    filled = [cell.strip() for cell in cells if cell.strip()]
+    if not 1 <= len(filled) <= 2 or not any(ch.isalpha() for ch in filled[-1]):
+        return False
+    return not any(NUMBER_PATTERN.fullmatch(cell) for cell in filled[1:])
+
+
+def get_adaptive_chunk_ranges(
+    df_schedule: pd.DataFrame,
+    header_md: str,
+    token_budget: int,
+    max_rows: int = BOQ_CHUNK_MAX_ROWS,
+    table_format: str = "markdown"
+) -> List[Tuple[int, int]]:
+    """
+    Chunks sized by the prompt tokens of their rendered table (in `table_format`) instead of a fixed row count.
+    A chunk grows until the next row would exceed `token_budget` (or `max_rows`); the cut is then moved back,
+    at most to the middle of the chunk, to just after a blank row or just before a section heading.
+    A single row larger than the budget still gets a chunk of its own.
+    """
+    total_rows = len(df_schedule)
+    if total_rows == 0:
+        return []
+    header_block, row_lines = render_schedule_rows(df_schedule, header_md, table_format)
+    header_tokens = count_tokens(header_block)
+    row_tokens = [count_tokens(line) + 1 for line in row_lines]  # + newline
+    row_cells = [line.split(" | ") for line in row_lines]
+
+    chunk_ranges = []
+    start = 0
+    while start < total_rows:
+        end, used_tokens = start, header_tokens
+        while end < total_rows and end - start < max_rows and (end == start or used_tokens + row_tokens[end] <= token_budget):
+            used_tokens += row_tokens[end]
+            end += 1
+
+        if end < total_rows:
+            earliest_cut = start + max(1, (end - start) // 2)
+            natural_cut = next((cut for cut in range(end, earliest_cut - 1, -1) if _is_blank_row(row_cells[cut - 1])), None)
+            if natural_cut is None:
+                natural_cut = next((cut for cut in range(end, earliest_cut - 1, -1) if _is_section_heading(row_cells[cut])), None)
+            end = natural_cut or end
+
+        chunk_ranges.append((start, end))
+        start = end
+    return chunk_ranges
+
+
 def generate_and_save_chunk_ranges(
-    schedule_path: str,
+    df_schedule: pd.DataFrame,
     output_folder: str,
-    chunk_size: int = 20
+    chunk_size: int = 20,
+    header_md: Optional[str] = None,
+    token_budget: Optional[int] = None,
+    table_format: str = "markdown"
 ) -> List[Tuple[int, int]]:
 
     # Double-check folders exist
     # create_output_folder(output_folder, sheet_name="dummy")  # sheet_name unused here safely
 
-    # Load schedule
-    import pandas as pd
-    df_schedule = pd.read_excel(schedule_path)
-
     total_rows = len(df_schedule)
-    chunk_ranges = get_chunk_ranges(total_rows, chunk_size)
+    if token_budget and header_md and header_md.strip():
+        chunk_ranges = get_adaptive_chunk_ranges(df_schedule, header_md, token_budget, table_format=table_format)
+    else:
+        chunk_ranges = get_chunk_ranges(total_rows, chunk_size)
 
     # Save chunk_ranges to JSON
     chunking_folder = os.path.join(output_folder, "chunking")
@@ -44,5 +128,5 @@ if __name__ == "__main__":
     output_folder = "/home/student2/Documents/GitHub/1st_AI_Project_Kothari/boq_extraction_2/pipeline copy/outputs/R4_ELECTRICAL_OFFER__CITCO__2_/FIRE_PUMP_ROOM"
     chunk_size = 20
 
-    generate_and_save_chunk_ranges(schedule_path, output_folder, chunk_size)
+    generate_and_save_chunk_ranges(pd.read_excel(schedule_path), output_folder, chunk_size)
 
@@ -3,27 +3,23 @@ import json
 import pandas as pd
 from typing import List, Tuple, Dict
 
-from utils.boq_context_extraction.excel_helpers import save_output_excel
+from utils.common_utils.artifact_writer import save_table_artifacts, BOQ_ARTIFACT_FORMATS
 from utils.common_utils.json_helpers import save_output_json
+from utils.common_utils.run_store import RunStore, current_run_store
 
 import logging
 logger = logging.getLogger(__name__)
 
-def load_corrected_chunk(boundaries_folder: str, start: int, end: int) -> List[Dict]:
-    file_path = os.path.join(boundaries_folder, f"page_output_dropped_last_product_entry_{start}_{end}.json")
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data.get("product_entries", [])
-    except FileNotFoundError:
-        logger.warning(f"Missing corrected chunk output: {file_path}")
-        return []
-    except json.JSONDecodeError:
-        logger.error(f"Corrupted JSON in corrected chunk: {file_path}")
-        return []
-    except Exception as e:
-        logger.error(f"Unexpected error loading corrected chunk: {file_path}, Error: {str(e)}")
+# The per-sheet final_product_entries.xlsx (and .csv/.parquet with BOQ_ARTIFACT_FORMATS) are convenience copies
+# of the JSON; the combined outputs are built from memory, so the xlsx can be switched off
+WRITE_SHEET_EXCEL = os.getenv("BOQ_WRITE_SHEET_EXCEL", "true").strip().lower() in ("1", "true", "yes")
+
+def load_corrected_chunk(store: RunStore, sheet_name: str, start: int, end: int) -> List[Dict]:
+    product_entries = store.get_corrected_chunk(sheet_name, start, end)
+    if product_entries is None:
+        logger.warning(f"Missing corrected chunk output: sheet '{sheet_name}', rows {start} to {end}")
         return []
+    return product_entries
 
 def merge_final_outputs(
     output_folder: str,
@@ -31,19 +27,19 @@ def merge_final_outputs(
     sheet_name: str,
     boq_context_md: str,
     boq_header_md: str
-):
-    boundaries_folder = os.path.join(output_folder, "boundaries")
+) -> Tuple[List[Dict], List[str]]:
+    """Returns the sheet's merged product entries and the paths of the files written for them."""
+    store = current_run_store(output_folder)
     final_output_folder = os.path.join(output_folder, "final_output")
 
     final_products = []
 
     for start, end in chunk_ranges:
-        chunk_products = load_corrected_chunk(boundaries_folder, start, end)
+        chunk_products = load_corrected_chunk(store, sheet_name, start, end)
         final_products.extend(chunk_products)
 
     # Save final merged outputs
     final_json_path = os.path.join(final_output_folder, "final_product_entries.json")
-    final_excel_path = os.path.join(final_output_folder, "final_product_entries.xlsx")
 
     save_output_json(final_json_path, {
         "sheet_name": sheet_name,
@@ -52,9 +48,12 @@ def merge_final_outputs(
         "products_entries": final_products
     })
 
-    save_output_excel(final_excel_path, final_products)
+    formats = tuple(fmt for fmt in BOQ_ARTIFACT_FORMATS if WRITE_SHEET_EXCEL or fmt != "xlsx")
+    table_paths = save_table_artifacts(os.path.join(final_output_folder, "final_product_entries"), final_products, formats)
+    final_paths = [final_json_path, *table_paths.values()]
 
-    logger.info(f"✅ Merged final output saved at {final_json_path} and {final_excel_path}")
+    logger.info(f"✅ Merged final output saved at {', '.join(final_paths)}")
+    return final_products, final_paths
 
 
 
@@ -63,24 +62,20 @@ if __name__ == "__main__":
     import os
     import json
     from utils.logging_utils.logging_config import setup_logging
+    from utils.prepare_metadata.prepare_metadata_for_one_sheet import load_prepared_schedule
 
     setup_logging()
     logging.getLogger("httpx").setLevel(logging.WARNING)  # suppress HTTP 200 logs
 
-    # Change this path to your sheet's output folder
-    output_folder = "/home/student2/Documents/GitHub/1st_AI_Project_Kothari/boq_extraction_2/pipeline copy/outputs/R4_ELECTRICAL_OFFER__CITCO__2_/FIRE_PUMP_ROOM"
+    # Change these to the workbook and sheet of an earlier run
+    file_path = os.path.join("inputs", "R4_ELECTRICAL OFFER  CITCO (2).xlsx")
+    metadata, _ = load_prepared_schedule(file_path, "FIRE PUMP ROOM")
+    output_folder = metadata["output_folder"]
 
-    # Paths
-    chunk_ranges_path = os.path.join(output_folder, "chunking", "chunk_ranges.json")
-    metadata_path = os.path.join(output_folder, "metadata.json")
-
-    # Load required files
-    with open(chunk_ranges_path, "r", encoding="utf-8") as f:
+    # chunk_ranges.json is written on every run
+    with open(os.path.join(output_folder, "chunking", "chunk_ranges.json"), "r", encoding="utf-8") as f:
         chunk_ranges = json.load(f)
 
-    with open(metadata_path, "r", encoding="utf-8") as f:
-        metadata = json.load(f)
-
     # Merge and save
     merge_final_outputs(
         output_folder=output_folder,
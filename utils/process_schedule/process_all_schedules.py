@@ -2,44 +2,70 @@ import os
 import pandas as pd
 import asyncio
 import json
-from typing import Tuple, List
+from typing import Tuple, List, Dict, Optional
 
 # from utils.logging_utils.logging_config import sheet_name_var
 from utils.prepare_metadata.prepare_metadata_for_one_sheet import prepare_metadata_for_one_sheet
 from utils.process_schedule.process_one_schedule import process_one_schedule
-from utils.common_utils.dynamic_semaphore import get_dynamic_semaphore
+from utils.common_utils.workbook_cache import BOQWorkbook
+from utils.common_utils.progress_events import emit_progress
+from utils.common_utils.run_manifest import run_manifest_var
+from utils.observability.tracing import span
 
 import logging
 logger = logging.getLogger(__name__)
 
-async def run_all_sheets(file_path: str, custom_instructions: str = "") -> Tuple[int, int, float, List[dict]]:
+async def run_all_sheets(
+    file_path: str,
+    custom_instructions: str = "",
+    metadata_list: Optional[List[Dict]] = None,
+    workbook: Optional[BOQWorkbook] = None,
+    run_options: Optional[Dict] = None,
+    sheet_names: Optional[List[str]] = None
+) -> Tuple[int, int, float, List[dict], Dict[str, List[Dict]]]:
     start_time = asyncio.get_event_loop().time()
     # logger.info(f"========= Phase 2: Schedules processing for all sheets=========")
 
-    xls = pd.ExcelFile(file_path)
+    if workbook is None:
+        workbook = await asyncio.to_thread(BOQWorkbook.load, file_path)
+    if sheet_names is None:
+        sheet_names = workbook.sheet_names
+    manifest = run_manifest_var.get()
 
     total_prompt_tokens = 0
     total_completion_tokens = 0
     sheet_errors = []
+    # merged product entries of every sheet that completed, handed to the combiner in memory
+    products_by_sheet = {}
 
-    dynamic_concurrency = get_dynamic_semaphore()
-    sem = asyncio.Semaphore(dynamic_concurrency)
-    # sem = asyncio.Semaphore(3)  # Limit concurrency if needed
+    # Reuse Phase 1 metadata; only sheets that failed (or were never prepared) get re-derived below
+    metadata_by_sheet = {metadata["sheet_name"]: metadata for metadata in (metadata_list or [])}
 
+    # LLM concurrency is bounded process-wide by the LLM scheduler, so all sheets are started at once
     async def run_single_sheet(sheet_name: str):
         # sheet_name_var.set(sheet_name)
-        async with sem:
-            try:
-                metadata = prepare_metadata_for_one_sheet(file_path, sheet_name, custom_instructions)
-                prompt_tokens, completion_tokens = await asyncio.to_thread(process_one_schedule, metadata)
-                return prompt_tokens, completion_tokens, None
-            except Exception as e:
-                return 0, 0, str(e)
-
-    tasks = [run_single_sheet(sheet) for sheet in xls.sheet_names]
+        try:
+            metadata = metadata_by_sheet.get(sheet_name)
+            if metadata is None:
+                logger.info(f"🔁 Re-deriving metadata for sheet '{sheet_name}' (not available from Phase 1)")
+                metadata = await prepare_metadata_for_one_sheet(file_path, sheet_name, custom_instructions, workbook, run_options)
+            with span("sheet.extraction", sheet_name=sheet_name) as sheet_stats:
+                prompt_tokens, completion_tokens, final_products = await process_one_schedule(
+                    metadata, workbook.get_schedule(sheet_name), run_options
+                )
+                sheet_stats.update(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            products_by_sheet[sheet_name] = final_products
+            return prompt_tokens, completion_tokens, None
+        except Exception as e:
+            if manifest:
+                manifest.record_sheet_failed(sheet_name, str(e))
+            emit_progress("sheet_failed", sheet_name=sheet_name, error=str(e))
+            return 0, 0, str(e)
+
+    tasks = [run_single_sheet(sheet) for sheet in sheet_names]
     results = await asyncio.gather(*tasks)
 
-    for sheet_name, result in zip(xls.sheet_names, results):
+    for sheet_name, result in zip(sheet_names, results):
         prompt_tokens, completion_tokens, error = result
         if error:
             logger.warning(f"⚠️ Skipping sheet '{sheet_name}' due to error: {error}")
@@ -52,7 +78,7 @@ async def run_all_sheets(file_path: str, custom_instructions: str = "") -> Tuple
 
     # logger.info(f"=========Phase 2 completed: All sheets processed in {elapsed_time:.2f} seconds=========")
 
-    return total_prompt_tokens, total_completion_tokens, elapsed_time, sheet_errors
+    return total_prompt_tokens, total_completion_tokens, elapsed_time, sheet_errors, products_by_sheet
 
 
 if __name__ == "__main__":
@@ -64,7 +90,7 @@ if __name__ == "__main__":
     file_path = "/path/to/your/full_boQ_file.xlsx"  # 🛠️ Change this
 
     results = asyncio.run(run_all_sheets(file_path))
-    prompt_tokens, completion_tokens, elapsed_time, sheet_errors = results
+    prompt_tokens, completion_tokens, elapsed_time, sheet_errors, products_by_sheet = results
 
     print("\n✅ All sheets processed!")
     print(f"🧮 Total Prompt Tokens Used: {prompt_tokens}")
@@ -13,7 +13,7 @@ from utils.process_schedule.process_boundaries_helpers import (
 logger = logging.getLogger(__name__)
 
 
-def _process_one_boundary_sync(
+async def _process_one_boundary(
     i: int,
     chunk_output_folder: str,
     boundaries_folder: str,
@@ -27,7 +27,7 @@ def _process_one_boundary_sync(
             logger.warning(f"No boundary entries for chunks {start1}-{end1} and {start2}-{end2}")
             return 0, 0
 
-        corrected_entries, tokens_used = call_llm_for_boundary_merge(last_entry, spec_only_entries)
+        corrected_entries, tokens_used = await call_llm_for_boundary_merge(last_entry, spec_only_entries)
 
         is_first_pair = (i == 0)
         is_last_pair = (i == len(chunk_ranges) - 2)
@@ -49,10 +49,7 @@ async def process_chunk_boundaries(output_folder: str, chunk_ranges: List[Tuple[
     total_prompt_tokens, total_completion_tokens = 0, 0
 
     async def process_boundary(i: int):
-        return await asyncio.to_thread(
-            _process_one_boundary_sync,
-            i, chunk_output_folder, boundaries_folder, chunk_ranges
-        )
+        return await _process_one_boundary(i, chunk_output_folder, boundaries_folder, chunk_ranges)
 
     tasks = [process_boundary(i) for i in range(len(chunk_ranges) - 1)]
     results = await asyncio.gather(*tasks)
@@ -3,7 +3,7 @@ import json
 from typing import List, Tuple, Dict
 import logging
 
-from utils.llm_interface.calling import llm_call_basic_with_llmcallfailure_exception
+from utils.llm_interface.calling import llm_call_basic_with_llmcallfailure_exception_async
 from utils.prompts.variant_merging_prompts import (
     system_prompt_merge_product_entries, make_user_prompt_for_merge
 )
@@ -34,9 +34,9 @@ def prepare_boundary_merge_request(data1: Dict, data2: Dict) -> Tuple[Dict, List
     spec_only_entries = [prod for prod in data2["products"] if prod.get("is_only_product_specs_entry") == "Y"] or None
     return last_entry, spec_only_entries
 
-def call_llm_for_boundary_merge(last_entry: Dict, spec_only_entries: List[Dict]) -> Tuple[List[Dict], Tuple[int, int]]:
+async def call_llm_for_boundary_merge(last_entry: Dict, spec_only_entries: List[Dict]) -> Tuple[List[Dict], Tuple[int, int]]:
     user_prompt = make_user_prompt_for_merge(last_entry, spec_only_entries)
-    response, tokens_used = llm_call_basic_with_llmcallfailure_exception(
+    response, tokens_used = await llm_call_basic_with_llmcallfailure_exception_async(
         system_prompt_merge_product_entries,
         user_prompt
     )
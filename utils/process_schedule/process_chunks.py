@@ -5,7 +5,7 @@ import pandas as pd
 from typing import List, Tuple
 import logging
 
-from utils.llm_interface.calling import llm_call_basic_with_llmcallfailure_exception
+from utils.llm_interface.calling import llm_call_basic_with_llmcallfailure_exception_async
 from utils.prompts.user_prompts import user_prompt_basic
 from utils.prompts.variant_extraction_prompts import system_prompt_product_entries_my_version
 from utils.boq_context_extraction.folder_helpers import create_output_folder
@@ -15,7 +15,7 @@ from utils.process_schedule.generate_chunk_ranges import generate_and_save_chunk
 
 logger = logging.getLogger(__name__)
 
-def call_llm_for_one_chunk(
+async def call_llm_for_one_chunk(
     df_schedule: pd.DataFrame,
     start_row: int,
     chunk_size: int,
@@ -40,7 +40,7 @@ def call_llm_for_one_chunk(
     }
 
     # LLM call
-    content, tokens_used = llm_call_basic_with_llmcallfailure_exception(
+    content, tokens_used = await llm_call_basic_with_llmcallfailure_exception_async(
         system_prompt_product_entries_my_version,
         user_prompt_basic.format(text=markdown_table),
     )
@@ -64,7 +64,7 @@ def call_llm_for_one_chunk(
 
 
 async def process_all_chunks(
-    schedule_path: str,
+    df_schedule: pd.DataFrame,
     output_folder: str,
     sheet_name: str,
     boq_context_md: str,
@@ -73,11 +73,8 @@ async def process_all_chunks(
 ) -> Tuple[List[Tuple[int, int]], int, int]:
     # create_output_folder(output_folder, sheet_name="dummy")  # Just double-check folders, this has to be at sheet level
 
-    # Load schedule
-    df_schedule = pd.read_excel(schedule_path)
-
     # Generate chunk ranges and save
-    chunk_ranges = generate_and_save_chunk_ranges(schedule_path, output_folder, chunk_size)
+    chunk_ranges = generate_and_save_chunk_ranges(df_schedule, output_folder, chunk_size)
 
     chunk_output_folder = os.path.join(output_folder, "chunking", "chunk_outputs")
 
@@ -85,8 +82,7 @@ async def process_all_chunks(
 
     # Async process each chunk
     async def process_chunk(start_idx, is_first):
-        return await asyncio.to_thread(
-            call_llm_for_one_chunk,
+        return await call_llm_for_one_chunk(
             df_schedule, start_idx, chunk_size, sheet_name,
             chunk_output_folder, boq_context_md, boq_header_md, is_first
         )
@@ -126,6 +122,6 @@ if __name__ == "__main__":
     boq_header_md = metadata.get("header_md", "")
 
     asyncio.run(process_all_chunks(
-        schedule_path, output_folder, sheet_name,
+        pd.read_excel(schedule_path), output_folder, sheet_name,
         boq_context_md, boq_header_md, chunk_size
     ))
\ No newline at end of file
@@ -1,26 +1,32 @@
 import os
-import json
 import asyncio
 import pandas as pd
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional, Sequence
 import logging
 
-from utils.llm_interface.calling import llm_call_basic_with_llmcallfailure_exception
-from utils.prompts.user_prompts import user_prompt_basic
+from utils.llm_interface.calling import llm_call_basic_with_llmcallfailure_exception_async
+from utils.prompts.user_prompts import build_chunk_user_prompt
 # from utils.prompts.variant_extraction_prompts import system_prompt_product_entries_my_version
 # from utils.prompts.variant_extraction_prompts import system_prompt_product_entries_v2n
 from utils.prompts.variant_extraction_prompts import system_prompt_product_entries_v2n_2
 from utils.boq_context_extraction.folder_helpers import create_output_folder
 from utils.common_utils.json_helpers import save_output_json
-from utils.common_utils.markdown_helpers import format_batch_as_markdown
+from utils.common_utils.markdown_helpers import format_chunk_table
+from utils.common_utils.progress_events import emit_progress
+from utils.common_utils.run_manifest import run_manifest_var
+from utils.common_utils.run_store import current_run_store
+from utils.boq_context_extraction.excel_helpers import WRITE_DEBUG_ARTIFACTS
 from utils.process_schedule.generate_chunk_ranges import generate_and_save_chunk_ranges
+from utils.process_schedule.row_references import chunk_system_prompt, description_column, resolve_row_references
+from utils.process_schedule.column_roles import fill_mapped_fields, numeric_columns, row_refs_columns
+from utils.observability.tracing import span
 
 logger = logging.getLogger(__name__)
 
-def call_llm_for_one_chunk(
+async def call_llm_for_one_chunk(
     df_schedule: pd.DataFrame,
     start_row: int,
-    chunk_size: int,
+    end_row: int,
     sheet_name: str,
     boundaries_folder: str,
     chunk_output_folder: str,
@@ -31,14 +37,19 @@ def call_llm_for_one_chunk(
     section_context_from_last_extracted_product_block_in_previous_chunk: str,
     last_extracted_product_block_in_previous_chunk: Dict,
     is_first_chunk: bool,
-    is_last_chunk: bool
+    is_last_chunk: bool,
+    output_mode: str = "text",
+    description_col: Optional[int] = None,
+    mapped_columns: Optional[Dict[str, List[str]]] = None,
+    table_format: str = "markdown",
+    numeric_cols: Sequence[int] = ()
 ) -> Tuple[int, int, Dict, str]:
-    end_row = min(start_row + chunk_size, len(df_schedule))
-
+    row_refs = output_mode == "row_refs"
     # Format batch into markdown table
-    markdown_table = format_batch_as_markdown(
+    markdown_table = format_chunk_table(
         df_schedule, boq_header_md,
-        start_idx=start_row, batch_size=chunk_size
+        start_idx=start_row, batch_size=end_row - start_row, row_numbers=row_refs, table_format=table_format,
+        numeric_cols=numeric_cols
     )
 
     original_rows_info = {
@@ -48,19 +59,15 @@ def call_llm_for_one_chunk(
 
     # system_prompt = system_prompt_product_entries_my_version 
     # system_prompt = system_prompt_product_entries_v2n
-    system_prompt = system_prompt_product_entries_v2n_2
-    user_prompt = user_prompt_basic.format(text=f"Markdown Table: \n{markdown_table}")
-    if not is_first_chunk:
-        # if last_extracted_product_entry_from_previous_chunk:
-        #     user_prompt = f"""last_extracted_product_entry_from_previous_chunk: {last_extracted_product_entry_from_previous_chunk}\n\n""" + user_prompt
-        # if context_from_previous_chunk:
-        #     user_prompt = f"""context_from_previous_chunk: {context_from_previous_chunk}\n\n""" + user_prompt
-        if last_extracted_product_block_in_previous_chunk:
-            user_prompt = f"""last_extracted_product_block_in_previous_chunk: {last_extracted_product_block_in_previous_chunk}\n\n""" + user_prompt
-        if section_context_from_last_extracted_product_block_in_previous_chunk:
-            user_prompt = f"""section_context_from_last_extracted_product_block_in_previous_chunk: {section_context_from_last_extracted_product_block_in_previous_chunk}\n\n""" + user_prompt
-
-    content, tokens_used = llm_call_basic_with_llmcallfailure_exception(
+    system_prompt = chunk_system_prompt(output_mode, mapped_columns)
+    # carry-over goes after the table so the system prompt, BOQ context and header rows stay a cacheable prefix
+    user_prompt = build_chunk_user_prompt(
+        markdown_table, boq_context_md,
+        None if is_first_chunk else section_context_from_last_extracted_product_block_in_previous_chunk,
+        None if is_first_chunk else last_extracted_product_block_in_previous_chunk
+    )
+
+    content, tokens_used = await llm_call_basic_with_llmcallfailure_exception_async(
         system_prompt,
         user_prompt
     )
@@ -70,6 +77,13 @@ def call_llm_for_one_chunk(
         print(f"user_prompt: {user_prompt}")
         print(f"content: {content}")
 
+    if row_refs:
+        content["product_blocks"] = resolve_row_references(
+            content["product_blocks"], df_schedule,
+            description_column(df_schedule) if description_col is None else description_col
+        )
+        fill_mapped_fields(content["product_blocks"], mapped_columns or {})
+
     # Extract product entries from product blocks
     final_product_entries = []
     last_extracted_product_block_in_previous_chunk = content["product_blocks"][-1]
@@ -101,8 +115,13 @@ def call_llm_for_one_chunk(
         }
     }
 
-    output_path = os.path.join(chunk_output_folder, f"page_output_{start_row}_{end_row}.json")
-    save_output_json(output_path, final_output)
+    # boundaries_folder is <sheet folder>/boundaries
+    store = current_run_store(os.path.dirname(boundaries_folder))
+    store.put_chunk_result(
+        sheet_name, start_row, end_row, original_rows_info, tokens_used, product_entries=final_product_entries
+    )
+    if WRITE_DEBUG_ARTIFACTS:
+        save_output_json(os.path.join(chunk_output_folder, f"page_output_{start_row}_{end_row}.json"), final_output)
 
     output_path_dropped_last_product_entry = os.path.join(boundaries_folder, f"page_output_dropped_last_product_entry_{start_row}_{end_row}.json")
 
@@ -113,7 +132,9 @@ def call_llm_for_one_chunk(
             return None, None, tokens_used[0], tokens_used[1]
         elif last_extracted_product_block_in_previous_chunk:
             if not is_last_chunk:
-                save_output_json(output_path_dropped_last_product_entry, final_output)
+                store.put_corrected_chunk(sheet_name, start_row, end_row, final_product_entries)
+                if WRITE_DEBUG_ARTIFACTS:
+                    save_output_json(output_path_dropped_last_product_entry, final_output)
             elif is_last_chunk:
                 for variant in last_extracted_product_block_in_previous_chunk["list_of_product_variants"]:
                     variant_entry = {
@@ -134,7 +155,14 @@ def call_llm_for_one_chunk(
                     }
                 }
 
-                save_output_json(output_path_dropped_last_product_entry, final_output_)
+                store.put_corrected_chunk(sheet_name, start_row, end_row, final_product_entries)
+                if WRITE_DEBUG_ARTIFACTS:
+                    save_output_json(output_path_dropped_last_product_entry, final_output_)
+            emit_progress(
+                "product_entries", sheet_name=sheet_name, row_range=[start_row, end_row],
+                product_entries=final_product_entries
+            )
+            emit_progress("chunk_completed", sheet_name=sheet_name, row_range=[start_row, end_row])
             logging.info(f"Processed rows {start_row} to {end_row}")
             return section_context_from_last_extracted_product_block_in_previous_chunk, last_extracted_product_block_in_previous_chunk, tokens_used[0], tokens_used[1]
     else:
@@ -173,17 +201,23 @@ def call_llm_for_one_chunk(
     #     return None, None, tokens_used[0], tokens_used[1]
 
 
-def process_all_chunks(
-    schedule_path: str,
+async def process_all_chunks(
+    df_schedule: pd.DataFrame,
     output_folder: str,
     sheet_name: str,
     boq_context_md: str,
     boq_header_md: str,
-    chunk_size: int = 20
+    chunk_size: int = 20,
+    token_budget: Optional[int] = None,
+    output_mode: str = "text",
+    table_format: str = "markdown"
 ) -> Tuple[List[Tuple[int, int]], int, int]:
 
-    df_schedule = pd.read_excel(schedule_path)
-    chunk_ranges = generate_and_save_chunk_ranges(schedule_path, output_folder, chunk_size)
+    chunk_ranges = generate_and_save_chunk_ranges(
+        df_schedule, output_folder, chunk_size, boq_header_md, token_budget, table_format
+    )
+    description_col, mapped_columns = row_refs_columns(df_schedule, boq_header_md) if output_mode == "row_refs" else (None, {})
+    numeric_cols = numeric_columns(boq_header_md, df_schedule) if table_format == "compact" else []
     chunk_output_folder = os.path.join(output_folder, "chunking", "chunk_outputs")
     boundaries_folder = os.path.join(output_folder, "boundaries")
 
@@ -193,9 +227,30 @@ def process_all_chunks(
     # context_from_previous_chunk = "dummy_string"
     section_context_from_last_extracted_product_block_in_previous_chunk = "dummy_string"
     last_extracted_product_block_in_previous_chunk = "dummy_string"
-    
 
-    for idx, (start_idx, _) in enumerate(chunk_ranges):
+    manifest = run_manifest_var.get()
+    store = current_run_store(output_folder)
+    # chunks are chained through the carry-over block, so only an unbroken prefix of intact chunks is reused
+    resuming = manifest is not None
+
+    for idx, (start_idx, end_idx) in enumerate(chunk_ranges):
+        checkpoint = manifest.verified_chunk(sheet_name, start_idx, end_idx) if resuming else None
+        if checkpoint is not None:
+            section_context_from_last_extracted_product_block_in_previous_chunk = checkpoint["state"]["section_context"]
+            last_extracted_product_block_in_previous_chunk = checkpoint["state"]["last_product_block"]
+            corrected_entries = store.get_corrected_chunk(sheet_name, start_idx, end_idx)
+            if corrected_entries is not None:
+                emit_progress(
+                    "product_entries", sheet_name=sheet_name, row_range=[start_idx, end_idx],
+                    product_entries=corrected_entries, resumed=True
+                )
+            emit_progress("chunk_completed", sheet_name=sheet_name, row_range=[start_idx, end_idx], resumed=True)
+            logger.info(f"♻️ Reusing rows {start_idx} to {end_idx} of sheet '{sheet_name}' from the previous run")
+            continue
+        resuming = False
+        # stale corrected entries from an earlier run must not be merged or checkpointed
+        store.delete_corrected_chunk(sheet_name, start_idx, end_idx)
+
         if start_idx==20 or start_idx==40:
             print(f"start_idx: {start_idx}")
             # print(f"last_product_entry: {last_product_entry}")
@@ -204,16 +259,23 @@ def process_all_chunks(
             print(f"last_extracted_product_block_in_previous_chunk: {last_extracted_product_block_in_previous_chunk}")
 
         if last_extracted_product_block_in_previous_chunk is not None:
-            section_context_from_last_extracted_product_block_in_previous_chunk, last_extracted_product_block_in_previous_chunk, \
-            prompt_tokens, completion_tokens = call_llm_for_one_chunk(
-                df_schedule, start_idx, chunk_size, sheet_name,
-                boundaries_folder, chunk_output_folder,
-                boq_context_md, boq_header_md,
-                section_context_from_last_extracted_product_block_in_previous_chunk,
-                last_extracted_product_block_in_previous_chunk,
-                is_first_chunk=(idx == 0),
-                is_last_chunk=(idx==len(chunk_ranges)-1)
-            )
+            with span("chunk.extract", sheet_name=sheet_name, row_range=[start_idx, end_idx]) as chunk_stats:
+                section_context_from_last_extracted_product_block_in_previous_chunk, last_extracted_product_block_in_previous_chunk, \
+                prompt_tokens, completion_tokens = await call_llm_for_one_chunk(
+                    df_schedule, start_idx, end_idx, sheet_name,
+                    boundaries_folder, chunk_output_folder,
+                    boq_context_md, boq_header_md,
+                    section_context_from_last_extracted_product_block_in_previous_chunk,
+                    last_extracted_product_block_in_previous_chunk,
+                    is_first_chunk=(idx == 0),
+                    is_last_chunk=(idx==len(chunk_ranges)-1),
+                    output_mode=output_mode,
+                    description_col=description_col,
+                    mapped_columns=mapped_columns,
+                    table_format=table_format,
+                    numeric_cols=numeric_cols
+                )
+                chunk_stats.update(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
 
         # if last_product_entry is not None:
         #     context_from_previous_chunk, last_product_entry, prompt_tokens, completion_tokens = call_llm_for_one_chunk(
@@ -228,6 +290,12 @@ def process_all_chunks(
             
             total_prompt_tokens += prompt_tokens
             total_completion_tokens += completion_tokens
+
+            if manifest:
+                manifest.record_chunk(sheet_name, start_idx, end_idx, store.chunk_digest(sheet_name, start_idx, end_idx), state={
+                    "section_context": section_context_from_last_extracted_product_block_in_previous_chunk,
+                    "last_product_block": last_extracted_product_block_in_previous_chunk,
+                })
         else:
             # logger.info(f"Skipping further processing on this sheet {sheet_name}\n because either content.get('product_entries') or content['product_entries'][-1] is None")
             logger.info(f"Skipping further processing on this sheet {sheet_name}\n because last_extracted_product_block_in_previous_chunk is None")
@@ -240,21 +308,19 @@ if __name__ == "__main__":
     setup_logging()
     logging.getLogger("httpx").setLevel(logging.WARNING)
 
-    output_folder = "/home/student2/Documents/GitHub/1st_AI_Project_Kothari/boq_extraction_2/pipeline_copy_2/outputs/R4_ELECTRICAL_OFFER__CITCO__2_/FIRE_PUMP_ROOM"
-    schedule_path = os.path.join(output_folder, "schedule_only.xlsx")
+    from utils.prepare_metadata.prepare_metadata_for_one_sheet import load_prepared_schedule
+
+    file_path = os.path.join("inputs", "R4_ELECTRICAL OFFER  CITCO (2).xlsx")
     sheet_name = "FIRE PUMP ROOM"
     chunk_size = 20
-
-    metadata_path = os.path.join(output_folder, "metadata.json")
-    with open(metadata_path, "r", encoding="utf-8") as f:
-        metadata = json.load(f)
+    metadata, df_schedule = load_prepared_schedule(file_path, sheet_name)
 
     boq_context_md = metadata.get("context_md", "")
     boq_header_md = metadata.get("header_md", "")
 
-    chunk_ranges, total_prompt_tokens, total_completion_tokens = process_all_chunks(
-        schedule_path, output_folder, sheet_name,
+    chunk_ranges, total_prompt_tokens, total_completion_tokens = asyncio.run(process_all_chunks(
+        df_schedule, metadata["output_folder"], sheet_name,
         boq_context_md, boq_header_md, chunk_size
-    )
+    ))
     print(f"Total prompt tokens: {total_prompt_tokens}")
     print(f"Total completion tokens: {total_completion_tokens}")
\ No newline at end of file
@@ -0,0 +1,258 @@
+import os
+import json
+import asyncio
+import pandas as pd
+from typing import List, Tuple, Dict, Optional, Sequence
+import logging
+
+from utils.llm_interface.calling import llm_call_basic_with_llmcallfailure_exception_async, LLMCallFailure
+from utils.prompts.user_prompts import build_chunk_user_prompt
+from utils.prompts.variant_merging_prompts import (
+    system_prompt_reconcile_boundary_product_blocks, make_user_prompt_for_block_reconciliation
+)
+from utils.common_utils.json_helpers import save_output_json
+from utils.common_utils.markdown_helpers import format_chunk_table
+from utils.common_utils.progress_events import emit_progress
+from utils.common_utils.run_manifest import run_manifest_var
+from utils.common_utils.run_store import current_run_store, flatten_product_blocks
+from utils.boq_context_extraction.excel_helpers import WRITE_DEBUG_ARTIFACTS
+from utils.process_schedule.generate_chunk_ranges import generate_and_save_chunk_ranges
+from utils.process_schedule.row_references import chunk_system_prompt, description_column, resolve_row_references, ROW_REFERENCES_KEY
+from utils.process_schedule.column_roles import fill_mapped_fields, numeric_columns, row_refs_columns
+from utils.observability.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Parallel counterpart of process_chunks_copy.process_all_chunks:
+# every chunk is extracted concurrently without carry-over, then the product blocks that straddle chunk
+# boundaries are reconciled in a second, much smaller round of concurrent LLM calls.
+
+
+async def extract_one_chunk_independently(
+    df_schedule: pd.DataFrame,
+    start_row: int,
+    end_row: int,
+    sheet_name: str,
+    chunk_output_folder: str,
+    boq_context_md: str,
+    boq_header_md: str,
+    output_mode: str = "text",
+    description_col: Optional[int] = None,
+    mapped_columns: Optional[Dict[str, List[str]]] = None,
+    table_format: str = "markdown",
+    numeric_cols: Sequence[int] = ()
+) -> Tuple[List[Dict], Dict, Tuple[int, int]]:
+    # chunk_output_folder is <sheet folder>/chunking/chunk_outputs
+    store = current_run_store(os.path.dirname(os.path.dirname(chunk_output_folder)))
+    manifest = run_manifest_var.get()
+    if manifest and manifest.verified_chunk(sheet_name, start_row, end_row):
+        previous_output = store.get_chunk_result(sheet_name, start_row, end_row)
+        logger.info(f"♻️ Reusing rows {start_row} to {end_row} of sheet '{sheet_name}' from the previous run")
+        return previous_output["product_blocks"], previous_output["original_rows_info"], (0, 0)
+
+    row_refs = output_mode == "row_refs"
+    markdown_table = format_chunk_table(
+        df_schedule, boq_header_md,
+        start_idx=start_row, batch_size=end_row - start_row, row_numbers=row_refs, table_format=table_format,
+        numeric_cols=numeric_cols
+    )
+
+    original_rows_info = {
+        "row_range": [df_schedule.iloc[start_row].name, df_schedule.iloc[end_row - 1].name],
+        "original_rows": df_schedule.iloc[start_row:end_row].to_dict(orient="records")
+    }
+
+    user_prompt = build_chunk_user_prompt(markdown_table, boq_context_md)
+    content, tokens_used = await llm_call_basic_with_llmcallfailure_exception_async(
+        chunk_system_prompt(output_mode, mapped_columns),
+        user_prompt
+    )
+    product_blocks = content.get("product_blocks", [])
+    if row_refs:
+        product_blocks = resolve_row_references(
+            product_blocks, df_schedule,
+            description_column(df_schedule) if description_col is None else description_col
+        )
+        fill_mapped_fields(product_blocks, mapped_columns or {})
+
+    # product blocks are kept so a resumed run can reconcile boundaries without re-extracting
+    digest = store.put_chunk_result(
+        sheet_name, start_row, end_row, original_rows_info, tokens_used, product_blocks=product_blocks
+    )
+    if WRITE_DEBUG_ARTIFACTS:
+        save_output_json(os.path.join(chunk_output_folder, f"page_output_{start_row}_{end_row}.json"), {
+            "sheet_name": sheet_name,
+            "boq_context": boq_context_md,
+            "product_entries": flatten_product_blocks(product_blocks),
+            "product_blocks": product_blocks,
+            "original_rows_info": original_rows_info,
+            "token_usage": {
+                "prompt_tokens": tokens_used[0],
+                "completion_tokens": tokens_used[1]
+            }
+        })
+    if manifest:
+        manifest.record_chunk(sheet_name, start_row, end_row, digest)
+    logger.info(f"Extracted rows {start_row} to {end_row} ({len(product_blocks)} product blocks)")
+
+    return product_blocks, original_rows_info, tokens_used
+
+
+def plan_boundary_groups(blocks_per_chunk: List[List[Dict]]) -> List[List[Tuple[int, int]]]:
+    """
+    Group the blocks that touch a chunk boundary: the last block of a chunk, plus the first block of the next
+    non-empty chunk. A chunk holding a single block is both, so its neighbours' boundaries join into one group.
+    Each group is a list of (chunk_idx, block_idx) positions in table order.
+    """
+    groups = []
+    current = None
+    for chunk_idx, blocks in enumerate(blocks_per_chunk):
+        if not blocks:
+            continue
+        if current is None:
+            current = [(chunk_idx, len(blocks) - 1)]
+            continue
+        current.append((chunk_idx, 0))
+        if len(blocks) == 1:
+            continue
+        groups.append(current)
+        current = [(chunk_idx, len(blocks) - 1)]
+    if current and len(current) > 1:
+        groups.append(current)
+    return groups
+
+
+def _inherit_section_context(product_blocks: List[Dict]) -> List[Dict]:
+    # Deterministic fallback used when reconciliation cannot be done by the LLM
+    previous_context = ""
+    for block in product_blocks:
+        if not block.get("section_context_for_this_product_block"):
+            block["section_context_for_this_product_block"] = previous_context
+        previous_context = block.get("section_context_for_this_product_block", "")
+    return product_blocks
+
+
+async def reconcile_boundary_group(product_blocks: List[Dict]) -> Tuple[List[Dict], Tuple[int, int]]:
+    if sum(1 for block in product_blocks if block.get("list_of_product_variants")) < 2:
+        return _inherit_section_context(product_blocks), (0, 0)
+    try:
+        with span("chunk.reconcile", blocks=len(product_blocks)):
+            response, tokens_used = await llm_call_basic_with_llmcallfailure_exception_async(
+                system_prompt_reconcile_boundary_product_blocks,
+                # row numbers only matter to the chunk that produced them; the model would just echo them back
+                make_user_prompt_for_block_reconciliation([
+                    {key: value for key, value in block.items() if key != ROW_REFERENCES_KEY} for block in product_blocks
+                ])
+            )
+    except LLMCallFailure as e:
+        logger.warning(f"⚠️ Boundary reconciliation failed, keeping blocks as extracted: {e}")
+        return _inherit_section_context(product_blocks), (0, 0)
+
+    reconciled_blocks = response.get("product_blocks")
+    if not reconciled_blocks:
+        logger.warning("⚠️ Boundary reconciliation returned no blocks, keeping blocks as extracted")
+        return _inherit_section_context(product_blocks), tokens_used
+    return reconciled_blocks, tokens_used
+
+
+async def process_all_chunks_parallel(
+    df_schedule: pd.DataFrame,
+    output_folder: str,
+    sheet_name: str,
+    boq_context_md: str,
+    boq_header_md: str,
+    chunk_size: int = 20,
+    token_budget: Optional[int] = None,
+    output_mode: str = "text",
+    table_format: str = "markdown"
+) -> Tuple[List[Tuple[int, int]], int, int]:
+
+    chunk_ranges = generate_and_save_chunk_ranges(
+        df_schedule, output_folder, chunk_size, boq_header_md, token_budget, table_format
+    )
+    description_col, mapped_columns = row_refs_columns(df_schedule, boq_header_md) if output_mode == "row_refs" else (None, {})
+    numeric_cols = numeric_columns(boq_header_md, df_schedule) if table_format == "compact" else []
+    chunk_output_folder = os.path.join(output_folder, "chunking", "chunk_outputs")
+    boundaries_folder = os.path.join(output_folder, "boundaries")
+    store = current_run_store(output_folder)
+
+    # --- Stage 1: extract every chunk concurrently ---
+    async def extract_with_span(start_row: int, end_row: int):
+        with span("chunk.extract", sheet_name=sheet_name, row_range=[start_row, end_row]) as chunk_stats:
+            result = await extract_one_chunk_independently(
+                df_schedule, start_row, end_row, sheet_name,
+                chunk_output_folder, boq_context_md, boq_header_md, output_mode, description_col, mapped_columns,
+                table_format, numeric_cols
+            )
+            chunk_stats.update(prompt_tokens=result[2][0], completion_tokens=result[2][1])
+            return result
+
+    extraction_results = await asyncio.gather(*[
+        extract_with_span(start_row, end_row) for start_row, end_row in chunk_ranges
+    ])
+    blocks_per_chunk = [product_blocks for product_blocks, _, _ in extraction_results]
+    total_prompt_tokens = sum(tokens_used[0] for _, _, tokens_used in extraction_results)
+    total_completion_tokens = sum(tokens_used[1] for _, _, tokens_used in extraction_results)
+
+    # --- Stage 2: reconcile blocks split across chunk boundaries, also concurrently ---
+    groups = plan_boundary_groups(blocks_per_chunk)
+    reconciliation_results = await asyncio.gather(*[
+        reconcile_boundary_group([blocks_per_chunk[chunk_idx][block_idx] for chunk_idx, block_idx in group])
+        for group in groups
+    ])
+    for _, tokens_used in reconciliation_results:
+        total_prompt_tokens += tokens_used[0]
+        total_completion_tokens += tokens_used[1]
+
+    # --- Stage 3: write corrected chunk outputs; a reconciled group is emitted in the chunk where it starts ---
+    group_of_position = {position: group_idx for group_idx, group in enumerate(groups) for position in group}
+    for chunk_idx, (start_row, end_row) in enumerate(chunk_ranges):
+        corrected_blocks = []
+        for block_idx, block in enumerate(blocks_per_chunk[chunk_idx]):
+            group_idx = group_of_position.get((chunk_idx, block_idx))
+            if group_idx is None:
+                corrected_blocks.append(block)
+            elif groups[group_idx][0] == (chunk_idx, block_idx):
+                corrected_blocks.extend(reconciliation_results[group_idx][0])
+
+        _, original_rows_info, tokens_used = extraction_results[chunk_idx]
+        product_entries = flatten_product_blocks(corrected_blocks)
+        store.put_corrected_chunk(sheet_name, start_row, end_row, product_entries)
+        if WRITE_DEBUG_ARTIFACTS:
+            save_output_json(os.path.join(boundaries_folder, f"page_output_dropped_last_product_entry_{start_row}_{end_row}.json"), {
+                "sheet_name": sheet_name,
+                "boq_context": boq_context_md,
+                "product_entries": product_entries,
+                "original_rows_info": original_rows_info,
+                "token_usage": {
+                    "prompt_tokens": tokens_used[0],
+                    "completion_tokens": tokens_used[1]
+                }
+            })
+        emit_progress(
+            "product_entries", sheet_name=sheet_name, row_range=[start_row, end_row],
+            product_entries=product_entries
+        )
+        emit_progress("chunk_completed", sheet_name=sheet_name, row_range=[start_row, end_row])
+
+    logger.info(f"✅ Parallel extraction of sheet '{sheet_name}': {len(chunk_ranges)} chunks, {len(groups)} boundary reconciliations")
+    return chunk_ranges, total_prompt_tokens, total_completion_tokens
+
+
+if __name__ == "__main__":
+    from utils.logging_utils.logging_config import setup_logging
+    setup_logging()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    from utils.prepare_metadata.prepare_metadata_for_one_sheet import load_prepared_schedule
+
+    file_path = os.path.join("inputs", "R4_ELECTRICAL OFFER  CITCO (2).xlsx")
+    sheet_name = "FIRE PUMP ROOM"
+    metadata, df_schedule = load_prepared_schedule(file_path, sheet_name)
+
+    chunk_ranges, total_prompt_tokens, total_completion_tokens = asyncio.run(process_all_chunks_parallel(
+        df_schedule, metadata["output_folder"], sheet_name,
+        metadata.get("context_md", ""), metadata.get("header_md", ""), chunk_size=30
+    ))
+    print(f"Total prompt tokens: {total_prompt_tokens}")
+    print(f"Total completion tokens: {total_completion_tokens}")
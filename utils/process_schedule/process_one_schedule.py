@@ -1,19 +1,30 @@
 import os
+import asyncio
 import pandas as pd
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple, Optional
 import logging
 
 from utils.boq_context_extraction.folder_helpers import create_output_folder, create_intermediate_results_folders
 from utils.process_schedule.generate_chunk_ranges import generate_and_save_chunk_ranges
 from utils.process_schedule.process_chunks_copy import process_all_chunks
+from utils.process_schedule.process_chunks_parallel import process_all_chunks_parallel
+from utils.process_schedule.row_classifier import strip_non_item_rows
+from utils.common_utils.run_options import resolve_run_options
+from utils.common_utils.progress_events import emit_progress
+from utils.common_utils.run_manifest import run_manifest_var
 from utils.process_schedule.merge_outputs import merge_final_outputs
+from utils.observability.tracing import span
 
 logger = logging.getLogger(__name__)
 
-def process_one_schedule(metadata: Dict) -> Tuple[int, int]:
+async def process_one_schedule(
+    metadata: Dict,
+    df_schedule: Optional[pd.DataFrame] = None,
+    run_options: Optional[Dict] = None
+) -> Tuple[int, int, List[Dict]]:
+    run_options = resolve_run_options(run_options)
     sheet_name = metadata["sheet_name"]
     output_folder = metadata["output_folder"]
-    schedule_path = metadata["schedule_path"]
     boq_context_md = metadata["context_md"]
     boq_header_md = metadata["header_md"]
     tokens_used_ctx = metadata.get("tokens_used_ctx", (0, 0))  # (prompt_tokens, completion_tokens)
@@ -22,53 +33,73 @@ def process_one_schedule(metadata: Dict) -> Tuple[int, int]:
     create_output_folder(metadata["file_path"], metadata["sheet_name"])
     create_intermediate_results_folders(output_folder)
 
+    # --- Load schedule only when it was not handed over in memory ---
+    if df_schedule is None:
+        df_schedule = await asyncio.to_thread(pd.read_excel, metadata["schedule_path"])
+
+    # --- Leave blank, total and repeated header rows out of the chunks ---
+    if run_options["row_prepass"]:
+        with span("sheet.row_prepass", sheet_name=sheet_name) as prepass_stats:
+            prepass_stats["rows"] = len(df_schedule)
+            df_schedule, _ = await asyncio.to_thread(strip_non_item_rows, df_schedule, boq_header_md, output_folder)
+            prepass_stats["kept_rows"] = len(df_schedule)
+
     # --- Step 1: Process all chunks ---
-    chunk_ranges, token_chunks_prompt, token_chunks_completion = process_all_chunks(
-        schedule_path, output_folder, sheet_name, boq_context_md, boq_header_md, chunk_size=30
+    emit_progress("sheet_started", sheet_name=sheet_name)
+    if run_options["extraction_mode"] == "parallel":
+        process_chunks = process_all_chunks_parallel
+    else:
+        process_chunks = process_all_chunks
+    chunk_ranges, token_chunks_prompt, token_chunks_completion = await process_chunks(
+        df_schedule, output_folder, sheet_name, boq_context_md, boq_header_md, chunk_size=30,
+        token_budget=run_options["chunk_token_budget"], output_mode=run_options["output_mode"],
+        table_format=run_options["table_format"]
     )
 
     # --- Step 3: Merge final output ---
-    merge_final_outputs(
-        output_folder,
-        chunk_ranges,
-        sheet_name,
-        boq_context_md,
-        boq_header_md
-    )
+    with span("sheet.merge", sheet_name=sheet_name):
+        final_products, final_paths = await asyncio.to_thread(
+            merge_final_outputs,
+            output_folder,
+            chunk_ranges,
+            sheet_name,
+            boq_context_md,
+            boq_header_md
+        )
 
     # --- Final token counts ---
     total_prompt_tokens = tokens_used_ctx[0] + token_chunks_prompt
     total_completion_tokens = tokens_used_ctx[1] + token_chunks_completion
 
+    final_json_path = os.path.join(output_folder, "final_output", "final_product_entries.json")
+    manifest = run_manifest_var.get()
+    if manifest:
+        manifest.record_sheet_completed(sheet_name, final_paths)
+
     logger.info(f"✅ Completed processing sheet: {sheet_name}")
+    emit_progress("sheet_completed", sheet_name=sheet_name, final_json_path=final_json_path)
 
-    return total_prompt_tokens, total_completion_tokens
+    # the merged entries go back in memory so the cross-sheet combiner does not re-read them from disk
+    return total_prompt_tokens, total_completion_tokens, final_products
 
 
 if __name__ == "__main__":
-    import json
     import os
     from utils.logging_utils.logging_config import setup_logging
 
     setup_logging()
     logging.getLogger("httpx").setLevel(logging.WARNING)  # Suppress HTTP 200 logs
 
-    # 🛠️ Update this to your sheet's output folder
-    output_folder = "/home/student2/Documents/GitHub/1st_AI_Project_Kothari/boq_extraction_2/pipeline_copy_2/outputs/R4_ELECTRICAL_OFFER__CITCO__2_/FIRE_PUMP_ROOM"
-
-    # Load metadata.json
-    metadata_path = os.path.join(output_folder, "metadata.json")
-    with open(metadata_path, "r", encoding="utf-8") as f:
-        metadata = json.load(f)
+    from utils.prepare_metadata.prepare_metadata_for_one_sheet import load_prepared_schedule
 
-    # # In case metadata is missing some fields manually add if needed
-    # metadata["output_folder"] = output_folder
-    # metadata["schedule_path"] = os.path.join(output_folder, "schedule_only.xlsx")
-    # metadata["file_path"] = "dummy_file_path.xlsx"  # 🛠️ Dummy for create_output_folder
+    # 🛠️ Update this to your workbook and sheet (its metadata comes from the run store of an earlier run)
+    file_path = os.path.join("inputs", "R4_ELECTRICAL OFFER  CITCO (2).xlsx")
+    sheet_name = "FIRE PUMP ROOM"
+    metadata, df_schedule = load_prepared_schedule(file_path, sheet_name)
 
     # Now call the full processing function
-    prompt_tokens, completion_tokens = process_one_schedule(metadata)
+    prompt_tokens, completion_tokens, final_products = asyncio.run(process_one_schedule(metadata, df_schedule))
 
-    print(f"\n✅ Sheet processed successfully!")
+    print(f"\n✅ Sheet processed successfully! ({len(final_products)} product entries)")
     print(f"🧮 Total Prompt Tokens Used: {prompt_tokens}")
     print(f"🧮 Total Completion Tokens Used: {completion_tokens}")
@@ -0,0 +1,123 @@
+import os
+from typing import Dict, Optional, Tuple
+import logging
+
+import pandas as pd
+
+from utils.boq_context_extraction.excel_helpers import WRITE_DEBUG_ARTIFACTS
+from utils.common_utils.json_helpers import save_output_json
+from utils.process_schedule.column_roles import map_column_roles
+from utils.process_schedule.row_references import description_column
+
+logger = logging.getLogger(__name__)
+
+# Tag of every schedule row, from the local pre-pass that runs before chunking
+ROW_TAGS = ("blank", "repeated_header", "total", "note", "section_heading", "item", "spec_continuation")
+# Rows that carry nothing the extraction needs; they are left out of the chunk prompts
+DROPPED_ROW_TAGS = ("blank", "repeated_header", "total")
+
+TOTAL_PATTERN = r"^(?:sub ?-?total|grand total|total|carried (?:forward|over)|brought forward|c/f|b/f)\b"
+NOTE_PATTERN = r"^(?:note|notes|n\.b\.|nb)\b"
+MAX_HEADING_CHARS = 80
+
+
+def _cell_texts(df_schedule: pd.DataFrame) -> pd.DataFrame:
+    # stripped cell strings, with missing values (and the "nan" of stringified ones) as ""
+    texts = df_schedule.astype(object).where(df_schedule.notna(), "").astype(str).apply(lambda column: column.str.strip())
+    return texts.mask(texts.apply(lambda column: column.str.lower()).eq("nan"), "")
+
+
+def _normalize_line(text: str) -> str:
+    return " ".join(text.replace("|", " ").split()).lower()
+
+
+def classify_rows(df_schedule: pd.DataFrame, header_md: str, column_roles: Optional[Dict[str, int]] = None) -> pd.Series:
+    """
+    Tag of every row of the schedule (one of ROW_TAGS), from column-wise rules: filled cells, the mapped
+    quantity/unit columns (see column_roles.py), numbering and keyword patterns, and the header rows.
+    Without a mapped quantity or unit column, a row with a number outside its sl. no. and description
+    cells counts as an item.
+    """
+    tags = pd.Series("spec_continuation", index=df_schedule.index, dtype=object)
+    if df_schedule.empty or not df_schedule.shape[1]:
+        return tags
+    if column_roles is None:
+        column_roles = map_column_roles(header_md, df_schedule)
+
+    texts = _cell_texts(df_schedule)
+    filled = texts.ne("")
+    filled_count = filled.sum(axis=1)
+    row_text = texts.iloc[:, 0].str.cat([texts.iloc[:, col] for col in range(1, texts.shape[1])], sep=" ")
+    row_text = row_text.str.replace(r"\s+", " ", regex=True).str.strip().str.lower()
+    description_col = column_roles.get("description")
+    if description_col is None:
+        description_col = description_column(df_schedule)
+    lead_text = texts.iloc[:, description_col].where(texts.iloc[:, description_col].ne(""), row_text).str.lower()
+
+    if "quantity" in column_roles:
+        is_item = filled.iloc[:, column_roles["quantity"]]
+    elif "unit" in column_roles:
+        is_item = filled.iloc[:, column_roles["unit"]]
+    else:
+        numbers = texts.apply(lambda column: pd.to_numeric(column.str.replace(",", "", regex=False), errors="coerce").notna())
+        label_cols = {description_col, column_roles.get("item_no", 0)}
+        is_item = numbers.drop(columns=[texts.columns[col] for col in label_cols]).any(axis=1)
+
+    # a short upper-case label on its own, e.g. "B | PUMP HOUSE PIPING"
+    is_heading = (
+        ~is_item & filled_count.between(1, 2) & row_text.str.len().le(MAX_HEADING_CHARS)
+        & row_text.str.contains(r"[a-z]", regex=True)
+        & texts.iloc[:, description_col].eq(texts.iloc[:, description_col].str.upper())
+    )
+    header_lines = {_normalize_line(line) for line in header_md.split("\n") if line.replace("|", "").strip()}
+
+    tags[is_heading] = "section_heading"
+    tags[is_item] = "item"
+    tags[~is_item & lead_text.str.contains(NOTE_PATTERN, regex=True)] = "note"
+    tags[~is_item & lead_text.str.contains(TOTAL_PATTERN, regex=True)] = "total"
+    tags[row_text.isin(header_lines) & filled_count.gt(0)] = "repeated_header"
+    tags[filled_count.eq(0)] = "blank"
+    return tags
+
+
+def strip_non_item_rows(
+    df_schedule: pd.DataFrame,
+    header_md: str,
+    output_folder: Optional[str] = None
+) -> Tuple[pd.DataFrame, pd.Series]:
+    """
+    The schedule without its DROPPED_ROW_TAGS rows, and the tag of every original row. Kept rows keep their
+    index labels, so original_rows_info still points at the sheet. With `output_folder` and
+    BOQ_WRITE_DEBUG_ARTIFACTS set, the tags are saved to chunking/row_tags.json, where kept_rows maps chunk
+    row positions back to those labels.
+    """
+    tags = classify_rows(df_schedule, header_md)
+    keep = ~tags.isin(DROPPED_ROW_TAGS)
+    df_items = df_schedule[keep]
+
+    counts = tags.value_counts().to_dict()
+    logger.info(
+        f"🧹 Kept {len(df_items)} of {len(df_schedule)} schedule rows "
+        f"({', '.join(f'{tag}: {counts[tag]}' for tag in ROW_TAGS if tag in counts)})"
+    )
+    if output_folder and WRITE_DEBUG_ARTIFACTS:
+        save_output_json(os.path.join(output_folder, "chunking", "row_tags.json"), {
+            "row_tags": {str(label): tag for label, tag in tags.items()},
+            "kept_rows": [str(label) for label in df_items.index],
+        })
+    return df_items, tags
+
+
+if __name__ == "__main__":
+    import sys
+    from utils.logging_utils.logging_config import setup_logging
+
+    setup_logging()
+
+    from utils.prepare_metadata.prepare_metadata_for_one_sheet import load_prepared_schedule
+
+    # python -m utils.process_schedule.row_classifier <workbook> <sheet name>  (after a run of that workbook)
+    metadata, df = load_prepared_schedule(sys.argv[1], sys.argv[2])
+    row_tags = classify_rows(df, metadata["header_md"])
+    for label, tag in row_tags.items():
+        print(f"{label:>5} {tag:<18} {' | '.join(_cell_texts(df.loc[[label]]).iloc[0])[:100]}")
@@ -0,0 +1,134 @@
+import re
+import math
+from typing import Dict, List, Optional
+import logging
+
+import pandas as pd
+
+from utils.prompts.variant_extraction_prompts import (
+    system_prompt_product_entries_v2n_2,
+    system_prompt_product_entries_row_refs,
+    system_prompt_product_entries_row_refs_mapped_columns,
+)
+
+logger = logging.getLogger(__name__)
+
+# Row-reference output mode: the model returns row numbers (section_context_rows per block, description_rows per
+# variant) instead of copying text, and the text is rebuilt here from df_schedule. The row numbers are kept on
+# each resolved block under ROW_REFERENCES_KEY, so a carried-over block can be referred to by the next chunk.
+ROW_REFERENCES_KEY = "row_references"
+# Joins the heading rows of a section context into the text mode's form, e.g. "C | RESIN PLANT > C4 | FDA SYSTEM"
+SECTION_CONTEXT_SEPARATOR = " > "
+# An integral number written with a decimal tail, e.g. "1234.0" or "1,200.000"
+INTEGRAL_NUMBER_PATTERN = re.compile(r"^([-+]?[\d,]*\d)\.0+$")
+
+
+def chunk_system_prompt(output_mode: str, mapped_columns: Optional[Dict] = None) -> str:
+    if output_mode != "row_refs":
+        return system_prompt_product_entries_v2n_2
+    if mapped_columns and {"quantity", "unit"} <= mapped_columns.keys():
+        return system_prompt_product_entries_row_refs_mapped_columns
+    return system_prompt_product_entries_row_refs
+
+
+def cell_text(value) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    text = str(value).strip()
+    return "" if text.lower() == "nan" else text
+
+
+def quantity_text(value) -> str:
+    """Cell text of a quantity as it reads in the sheet: exact, with only the ".0" of an integral number dropped."""
+    return INTEGRAL_NUMBER_PATTERN.sub(r"\1", cell_text(value))
+
+
+def is_number(text: str) -> bool:
+    try:
+        float(text.replace(",", ""))
+        return True
+    except ValueError:
+        return False
+
+
+def description_column(df_schedule: pd.DataFrame) -> int:
+    """Position of the column holding product descriptions: the one with the most text."""
+    if df_schedule.empty:
+        return 0
+    text_lengths = [
+        sum(len(text) for text in map(cell_text, df_schedule.iloc[:, col]) if not is_number(text))
+        for col in range(df_schedule.shape[1])
+    ]
+    return max(range(len(text_lengths)), key=text_lengths.__getitem__)
+
+
+def _row_position(df_schedule: pd.DataFrame, reference) -> Optional[int]:
+    try:
+        row = int(reference)
+    except (TypeError, ValueError):
+        return None
+    return row if 0 <= row < len(df_schedule) else None
+
+
+def row_text(df_schedule: pd.DataFrame, row: int) -> str:
+    # a section heading as it reads in the table, e.g. "A. | FIRE PUMP ROOM"
+    return " | ".join(text for text in map(cell_text, df_schedule.iloc[row]) if text)
+
+
+def description_text(df_schedule: pd.DataFrame, reference, description_col: int) -> str:
+    """Text of one description_rows entry: a row number, or [row number, start character, end character]."""
+    span = None
+    if isinstance(reference, (list, tuple)):
+        if not reference:
+            return ""
+        reference, span = reference[0], reference[1:3]
+    row = _row_position(df_schedule, reference)
+    if row is None:
+        logger.debug(f"Ignoring invalid row reference {reference!r}")
+        return ""
+    text = cell_text(df_schedule.iloc[row, description_col]) or row_text(df_schedule, row)
+    if span and len(span) == 2:
+        try:
+            text = text[int(span[0]):int(span[1])].strip()
+        except (TypeError, ValueError):
+            pass
+    return text
+
+
+def resolve_row_references(product_blocks: List[Dict], df_schedule: pd.DataFrame, description_col: int) -> List[Dict]:
+    """
+    Product blocks of the row-reference mode, rebuilt into the blocks of the text mode: section context and
+    full_product_description come from the referenced rows. Text the model returned anyway (e.g. a carried-over
+    block it repeated as-is) is kept when no row numbers are given.
+    """
+    resolved_blocks = []
+    for block in product_blocks:
+        previous_references = block.get(ROW_REFERENCES_KEY) or {}
+        section_rows = block.get("section_context_rows", previous_references.get("section_context_rows"))
+        if section_rows is None:
+            section_context = block.get("section_context_for_this_product_block", "")
+        else:
+            section_context = SECTION_CONTEXT_SEPARATOR.join(
+                row_text(df_schedule, row) for row in (_row_position(df_schedule, ref) for ref in section_rows)
+                if row is not None
+            )
+
+        variants, description_rows = [], []
+        for variant in block.get("list_of_product_variants", []):
+            fields = {key: value for key, value in variant.items() if key not in ("description_rows", "full_product_description")}
+            references = variant.get("description_rows")
+            if references is None:
+                full_product_description = variant.get("full_product_description", "")
+            else:
+                parts = (description_text(df_schedule, reference, description_col) for reference in references)
+                full_product_description = " ".join(part for part in parts if part)
+            variants.append({"full_product_description": full_product_description, **fields})
+            description_rows.append(references or [])
+
+        resolved_blocks.append({
+            "section_context_for_this_product_block": section_context,
+            "is_group": block.get("is_group", len(variants) > 1),
+            "list_of_product_variants": variants,
+            ROW_REFERENCES_KEY: {"section_context_rows": section_rows or [], "description_rows": description_rows},
+        })
+    return resolved_blocks
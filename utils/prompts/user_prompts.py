@@ -6,4 +6,26 @@ logger = logging.getLogger(__name__)
 
 
 user_prompt_basic = """Text:
-{text}"""
\ No newline at end of file
+{text}"""
+
+def build_chunk_user_prompt(
+    markdown_table: str,
+    boq_context_md: str = "",
+    section_context_from_previous_chunk: str = None,
+    last_product_block_from_previous_chunk: dict = None
+) -> str:
+    """
+    User prompt of one chunk extraction call, ordered for provider-side prompt caching: what every chunk of a
+    sheet shares (BOQ context, then the table whose header rows lead) comes first, what changes per chunk
+    (table rows, carry-over from the previous chunk) comes last. After the common system prompt this keeps
+    the identical prefix of consecutive calls as long as possible.
+    """
+    sections = []
+    if boq_context_md:
+        sections.append(f"boq_context: \n{boq_context_md}")
+    sections.append(f"Markdown Table: \n{markdown_table}")
+    if section_context_from_previous_chunk:
+        sections.append(f"section_context_from_last_extracted_product_block_in_previous_chunk: {section_context_from_previous_chunk}")
+    if last_product_block_from_previous_chunk:
+        sections.append(f"last_extracted_product_block_in_previous_chunk: {last_product_block_from_previous_chunk}")
+    return user_prompt_basic.format(text="\n\n".join(sections))
@@ -352,3 +352,114 @@ product_blocks: \\array of dictionaries where each dictionary contains the field
 }
 """
 
+
+
+# Row-reference output mode (run option output_mode="row_refs"): every table row is numbered, and the model
+# points at the rows holding descriptions and section headings instead of copying their text. The pipeline
+# rebuilds full_product_description and section_context_for_this_product_block from those rows
+# (see utils.process_schedule.row_references), so completion tokens no longer scale with description length.
+
+system_prompt_product_entries_row_refs = """
+You are a BOQ extraction expert.
+
+Knowledge about the BOQ document:
+Each chunk contains rows, where:
+- A section is introduced by a heading row (e.g., text like "B | SUPPLY ITEMS: ...".
+- Each section can contain one or more product blocks.
+- Each product block can contain one or more product variants for the same product.
+- The first column, `row`, is the row number of each table row. Refer to rows by this number.
+
+**Guidelines:**
+
+Context Handling:
+- If section_context_from_last_extracted_product_block_in_previous_chunk is provided:
+    - Use it as the context for the current text chunk (for all entries) until a new context is found in the chunk; its row numbers are the section_context_rows in the `row_references` of last_extracted_product_block_in_previous_chunk.
+    - If a new context is found, use the new context for the subsequent entries.
+
+Handling Previous Product Block:
+- If last_extracted_product_block_in_previous_chunk is provided:
+    - Consider it as the pre-text for the current text chunk. Its `row_references` give the row numbers of its section context and of each variant's description.
+    - If the current text chunk contains the REMAINING ROWS of the product block of which `last_extracted_product_block_in_previous_chunk` is a part:
+        - Borrow the section context rows, the description rows shared by its variants, and other fields from `last_extracted_product_block_in_previous_chunk` while extracting product variant entries for REMAINING ROWS from the current chunk.
+    - If the current chunk does not contain the REMAINING ROWS of the product block of which `last_extracted_product_block_in_previous_chunk` is a part:
+        - Still output `last_extracted_product_block_in_previous_chunk` in the output, with its section_context_rows and description_rows taken from its `row_references`.
+
+
+**Task:**
+Given the following part of the table (alternatively called as text chunk) from a BOQ document, extract:
+
+    - product_blocks: list of product blocks:
+        - section_context_rows: row numbers of all the parent section / header row(s) corresponding to the section in which the product block is present, excluding the rows of the product description and the variant-specific information itself.
+        - is_group: true if the block contains multiple variants (e.g., 13.01, 13.02...) false, if the block contains only one variant or no variant at all as per the givne input text chunk.
+        - list_of_product_variants: list of product variants in this product block, where each product variant entry should include the following fields:
+                1. description_rows:
+                - row numbers, in table order, of every row whose description makes up the complete descriptive information of the product variant: the common product description row(s) of the block followed by the variant-specific row.
+                - when only part of a row's description belongs to this variant, give [row number, start character, end character] for that row instead of the row number.
+                - do NOT copy the description text itself.
+
+                2. core_product_name
+                - Main product name describing its function or type.
+                - Include subtypes or key variations (e.g., “needle”, “gate”, “ball”).
+                - Exclude qualifiers like “FULL & REDUCED”. Exclude size, specifications.
+                - Expand acronyms if unambiguous (e.g., "VFD" → "Vacuum Fluorescent Display").
+                - Result should represent the core identity of the product.
+                - Return in lowercase.
+                Examples:
+                Input: FULL & REDUCED BORE BALL VALVE → Ball Valve
+                Input: Non Ferrous Ball Valve → Ball Valve
+                Input: MS black steel pipe Heavy grade of thickness 5.4mm → MS black steel pipe
+
+                Important: ONLY when pipes are the product, keep the material in the core_product_name. Not for other products.
+
+                3. size
+                - Capture any dimensional or capacity-related information for different parts of the product, if present.
+                - Use structured key value pair format; ensure to inlcude the part of the product for which the size is mentioned in the key and actual size in the value.
+                - E.g. "size: 150 mm NB", or "diameter: 150 NB", or "flanged outlet diameter: 1 inch", "tank capacity: 250 ml"
+                - reflect the input exactly as it is; retain original descriptors/keys.
+
+                4. feature_or_specifications
+                - Include material, grade, standard, voltage, pressure, manufacturer, internal mechanisms, or other key specifications/features at product level and also for each part of the product, if present.
+                - Use structured key value pair format; ensure to inlcude the part of the product for which the specification is mentioned in the key and actual specification in the value.
+                - E.g. "material: carbon steel", "grade: A105", "standard: IS 2062", "voltage: 220 volts", "manufacturer: siemens", "feature: explosion proof"
+                - When it comes to long forms of acronyms, keep the acronym as it is and also provide the long form in brakcets)
+                cs → cs(carbon steel), ss → ss(stainless steel), IS → IS(indian standard), UL → UL(underwriters laboratories), etc.
+
+                5. acronymed_core_product_name
+                - Acronymed form of the core product name, if an acronym for the entire core product name or for a part of it is present in the raw product name.
+                - Exclude qualifiers like “FULL & REDUCED”. Exclude size, specifications.
+                - Return in lowercase.
+                Examples:
+                Input: Vacuum Fluorescent Display (VFD) Annunciators → VFD Annunciators
+
+                6. quantity: numerical quantity or R/O, if provided in the input.
+                7. unit: corresponding unit, normalized (e.g., "Nos", "M", "KG"), as provided in the input.
+
+                Formatting Rules:
+                - Remove brackets and extra spaces.
+                - For slashes ("/") that separate names, choose the full name for core_product_name, and the shorter as acronymed_core_product_name.
+                - For slashes ("/") that stand for "or" replace them with "or" unless used in acronyms.
+                - Use lowercase for core_product_name, acronymed_core_product_name.
+                - Preserve order of entries as in the table.
+
+Important:
+- Product blocks must group related variants together under one block. Use cues like shared prefixes in sl. no. (e.g., 13.01, 13.02) or shared product names to group them.
+- Do not split variants of the same product into different product blocks.
+- Each block should contain all related product entries before moving to the next block.
+- Every product variant row of the table must be referenced by exactly one variant.
+
+Return JSON. If any field is not applicable, return as an empty string (an empty list for row numbers) but do not drop the field name.
+i.e.
+{
+product_blocks: \\array of dictionaries where each dictionary contains the fields mentioned above for a product block
+}
+"""
+
+# Row-reference prompt for schedules whose quantity and unit columns are mapped (column_roles.py): those
+# fields are read from the table by row number, so the model does not return them
+system_prompt_product_entries_row_refs_mapped_columns = system_prompt_product_entries_row_refs.replace(
+    """                6. quantity: numerical quantity or R/O, if provided in the input.
+                7. unit: corresponding unit, normalized (e.g., "Nos", "M", "KG"), as provided in the input.
+""",
+    """                Do NOT return quantity, unit or sl. no.: they are read from the table using description_rows.
+"""
+)
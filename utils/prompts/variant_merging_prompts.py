@@ -41,4 +41,35 @@ Last entry from first chunk:
 Entries from second chunk (only the incomplete ones):
 {json.dumps({"products": spec_only_entries}, indent=2, ensure_ascii=False)}
 """
-# ones with `is_only_product_specs_row = "Y"`
\ No newline at end of file
+# ones with `is_only_product_specs_row = "Y"`
+
+# Used by the parallel extraction mode: chunks are extracted independently, so the product block that
+# straddles a chunk boundary comes back as two (or more) partial blocks that are reconciled here.
+
+system_prompt_reconcile_boundary_product_blocks = """
+You are a BOQ extraction expert.
+
+You are given consecutive product blocks, in table order, that were extracted independently from consecutive chunks of the same BOQ table.
+The first block is the last block of one chunk; the last block is the first block of a following chunk.
+Because of the chunk boundary, one product block may have been split into several partial blocks.
+
+Your task:
+- If consecutive blocks are parts of the same product block (e.g. the later block continues the same sl. no. series, or its variants only carry variant-specific rows such as sizes without the common product description), merge them into one block:
+    - Complete `full_product_description` of each variant with the common descriptive information from the earlier part.
+    - Use the section context of the earlier part when the later part has none.
+    - Keep every variant; remove exact duplicates of the same variant.
+- If the blocks are different products, return them unchanged, but fill an empty `section_context_for_this_product_block` from the preceding block.
+- Preserve the order of blocks and variants.
+- Do not alter field names and do not drop fields.
+
+Output must be in the JSON format:
+{
+  "product_blocks": [ array of reconciled product blocks ]
+}
+"""
+
+def make_user_prompt_for_block_reconciliation(product_blocks: list[dict]):
+    return f"""
+Consecutive product blocks across chunk boundaries:
+{json.dumps({"product_blocks": product_blocks}, indent=2, ensure_ascii=False)}
+"""